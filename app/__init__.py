@@ -5,7 +5,20 @@ from app.domain.exceptions import HTTPException
 
 
 def create_app():
-    app = FastAPI()
+    # imported here, not at package import: the engine must not exist before DATABASE_URL is final
+    from app.api import metrics
+    from app.api.response_cache import ResponseCacheMiddleware, response_cache, table_versions
+    from app.data import query_trace
+    from app.startup import lifespan
+
+    app = FastAPI(lifespan=lifespan)
+    if query_trace.SQL_TRACE:
+        app.add_middleware(metrics.QueryTraceMiddleware)
+    app.add_middleware(ResponseCacheMiddleware, cache=response_cache, versions=table_versions)
+    app.add_middleware(metrics.FirstRequestMiddleware)
+    # added last so it is the outermost layer and also times cache hits
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(metrics.router)
 
     @app.exception_handler(HTTPException)
     async def exception_handler(_, exception: HTTPException):
@@ -1,110 +1,143 @@
-import sqlite3
-from typing import Annotated
+import os
+from typing import Annotated, Literal
 
-from jose import ExpiredSignatureError
-from jwt import InvalidTokenError
-from sqlmodel import Session
-from app.auth.dependencies import oauth2_scheme_instructor, oauth2_scheme_student
-from fastapi import APIRouter, HTTPException, status
+from app.auth.dependencies import get_current_instructor, get_current_student
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, status
 from fastapi.params import Depends
-from app.auth.token import verify_token
-from app.api.dependencies import get_repo
-from app.data.models import Grade
-from app.data.student_repo import AbstractRepo
-from app.data.schemas import CreateUserSchema, GetInstructorResponse, GetInstructorsResponse, GradeSchema, TokenData, UpdateInstructorResponse, UpdateUserSchema, UserSchema, GetStudentsResponse, \
-    UpdateStudentResponse, GetStudentResponse
-from app.domain import instructor_service, student_service
-from app.auth.dependencies import UserRepository, hash_password
+from fastapi.responses import FileResponse, StreamingResponse
+from app.api.fields import sparse_fields
+from app.api.responses import FastJSONResponse
+from app.api.streaming import CSV_MEDIA_TYPE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NDJSON_MEDIA_TYPE, async_csv_lines, async_ndjson_lines, ndjson_lines, next_cursor, wants_ndjson
+from app.api.dependencies import COMMIT_UNIT_OF_WORK, get_async_instructor_repo, get_async_student_repo, get_instructor_repo, get_report_job_repo, get_repo, get_session
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+from app.data.instructor_repo import AsyncInstructorRepo, InstructorRepo
+from app.data.report_job_repo import ReportJobRepo
+from app.data.models import GRADE_FIELDS, GRADE_LIST_FIELDS, PUBLIC_USER_FIELDS, Grade, Instructor, Student
+from app.data.student_repo import AbstractRepo, AsyncStudentRepo
+from app.data.schemas import USER_DETAIL_FIELDS, CreateUserSchema, GetInstructorResponse, GetInstructorsResponse, GradeImportReport, GradeSchema, ProvisioningReport, UpdateInstructorResponse, UpdateUserSchema, UserSchema, GetStudentsResponse, \
+    UpdateStudentResponse, GetStudentResponse, SearchStudentsResponse, BatchReport, BatchRequest, ReportJobRequest, ReportJobResponse
+from app.domain import analytics, batch, grade_import, instructor_service, provisioning, report_jobs, student_service
+from app.domain.leaderboard import DEFAULT_TOP_N, MAX_TOP_N, Subject
+from app.auth.dependencies import hash_password
+
+router = APIRouter(prefix="/api", dependencies=[COMMIT_UNIT_OF_WORK])
 
-router = APIRouter(prefix="/api")
+PageLimit = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+SEARCH_PAGE_SIZE = 20
+GRADE_HISTORY_PAGE_SIZE = 50
+
+# ?fields= projections; a detail route returns what its response model declares unless asked otherwise
+UserListFields = Annotated[tuple[str, ...], Depends(sparse_fields(PUBLIC_USER_FIELDS))]
+UserFields = Annotated[tuple[str, ...], Depends(sparse_fields(PUBLIC_USER_FIELDS, USER_DETAIL_FIELDS))]
+GradeListFields = Annotated[tuple[str, ...], Depends(sparse_fields(GRADE_LIST_FIELDS))]
+GradeFields = Annotated[tuple[str, ...], Depends(sparse_fields(GRADE_FIELDS))]
 
 
 @router.post("/create-user", response_model=UserSchema)  # Creation of a student
 def create_User(
     user: CreateUserSchema,
     repo: Annotated[AbstractRepo, Depends(get_repo)],
-    token: Annotated[str, Depends(oauth2_scheme_instructor)],
-    session: Session
+    instructor_repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-    
     hashed_passwd = hash_password(user.password)
-    
+
     if user.userRole == "Student":
-    
+
         user_data = user.model_dump()
         user_data["hashed_password"] = hashed_passwd
-        
+
         student = student_service.create_student(data=user_data, user_repo=repo)
         try:
-            return UserSchema.model_validate(dict(student))  # Use model_validate to create a UserSchema instance
+            return UserSchema.model_validate(student, from_attributes=True)  # Use model_validate to create a UserSchema instance
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))  # Handle validation errors
-    
-    elif user.user_role == "Instructor":
+
+    elif user.userRole == "Instructor":
         user_data = user.model_dump()
         user_data["hashed_password"] = hashed_passwd
-        
-        instructor = instructor_service.create_instructor(data=user_data, user_repo=repo)
+
+        new_instructor = instructor_service.create_instructor(data=user_data, user_repo=instructor_repo)
         try:
-            return UserSchema.model_validate(dict(instructor))  # Use model_validate to create a UserSchema instance
+            return UserSchema.model_validate(new_instructor, from_attributes=True)  # Use model_validate to create a UserSchema instance
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))  # Handle validation errors
-        
+
+    raise HTTPException(status_code=400, detail="userRole must be either 'Student' or 'Instructor'")
 
 
-@router.get("/students", response_model=GetStudentsResponse)  # Get all students
+@router.post("/batch",
+        response_model=BatchReport,
+        tags = ["Instructor"],
+        description="Run an ordered list of student, instructor and grade operations in one transaction, "
+                    "all or nothing unless `atomic` is false; every operation gets the status and body its own route would return",
+        summary="Batch of operations")
+def run_batch(
+    body: BatchRequest,
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
+):
+    if len(body.operations) > batch.BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {batch.BATCH_MAX_OPERATIONS} operations per batch")
+    return FastJSONResponse(batch.run_batch(body.operations, atomic=body.atomic, instructor_id=instructor.id).model_dump(mode="json"))
+
+
+@router.post("/users/bulk",
+        response_model=ProvisioningReport,
+        tags = ["Instructor"],
+        description="Create many students/instructors at once; duplicates are reported per record without aborting the batch",
+        summary="Bulk provision users")
+def bulk_create_users(
+    users: list[CreateUserSchema],
+    session: Annotated[Session, Depends(get_session)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
+):
+    return provisioning.provision_users(enumerate(users), session)
+
+
+@router.get("/students", response_model=GetStudentsResponse, response_class=FastJSONResponse)  # Get all students, paginated by ?after_id=&limit=
 def get_students(
+    request: Request,
     repo: Annotated[AbstractRepo, Depends(get_repo)],
-    token: Annotated[str, Depends(oauth2_scheme_instructor)],
-    session: Session
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    fields: UserListFields,
+    after_id: int | None = None,
+    limit: PageLimit = DEFAULT_PAGE_SIZE
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
+    # Accept: application/x-ndjson streams every student after `after_id` one row at a time
+    if wants_ndjson(request):
+        return StreamingResponse(ndjson_lines(student_service.stream_students(repo, after_id=after_id, fields=fields)), media_type=NDJSON_MEDIA_TYPE)
+
     # Operation
-    students = student_service.get_students(repo)
-    return GetStudentsResponse(students=students)
+    students = student_service.get_students(repo, after_id=after_id, limit=limit, fields=fields)
+    # already in the GetStudentsResponse shape: encode once, without response_model validation
+    return FastJSONResponse({"students": students, "next_after_id": next_cursor(students, limit)})
 
 
-@router.get("/students/{user_id}", response_model=GetStudentResponse)  # Get student by id
+# declared before /students/{user_id}, which would otherwise take "search" for an id
+@router.get("/students/search", response_model=SearchStudentsResponse, response_class=FastJSONResponse)  # Ranked prefix search on names and e-mail
+def search_students(
+    repo: Annotated[AbstractRepo, Depends(get_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    fields: UserListFields,
+    q: Annotated[str, Query(min_length=1, max_length=100)],
+    offset: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = SEARCH_PAGE_SIZE
+):
+    students = student_service.search_students(repo, q, offset=offset, limit=limit, fields=fields)
+    next_offset = offset + limit if len(students) == limit else None
+    return FastJSONResponse({"students": students, "next_offset": next_offset})
+
+
+@router.get("/students/{user_id}", response_model=GetStudentResponse, response_class=FastJSONResponse)  # Get student by id
 def get_student_by_id(
     user_id: int,
     repo: Annotated[AbstractRepo, Depends(get_repo)],
-    token: Annotated[str, Depends(oauth2_scheme_instructor)],
-    session: Session
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    fields: UserFields
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-    student = student_service.get_student(student_id=user_id, user_repo=repo)
-    try:
-        return GetStudentResponse.model_validate(dict(student))  # Use model_validate to create a UserSchema instance
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))  # Handle validation errors
+    return FastJSONResponse(student_service.get_student_fields(student_id=user_id, user_repo=repo, fields=fields))
 
 
 @router.put("/students/{user_id}", response_model=UpdateStudentResponse)  # Update a student
@@ -112,23 +145,11 @@ def update_student(
     user_id: int,
     schema: UpdateUserSchema,
     repo: Annotated[AbstractRepo, Depends(get_repo)],
-    session: Session,
-    token: Annotated[str, Depends(oauth2_scheme_instructor)]
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-        
     student = student_service.update_student(student_id=user_id, repo=repo, data=schema)
     try:
-        return UpdateStudentResponse.model_validate(dict(student))  # Use model_validate to create a UserSchema instance
+        return UpdateStudentResponse.model_validate(student, from_attributes=True)  # Use model_validate to create a UserSchema instance
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))  # Handle validation errors
 
@@ -137,330 +158,286 @@ def update_student(
 def delete_student(
     user_id: int,
     repo: Annotated[AbstractRepo, Depends(get_repo)],
-    session = Session, 
-    token = Annotated[str, Depends(oauth2_scheme_instructor)]
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-        
-    student_service.delete_student(student_id=user_id, repo=repo)
-    return {"student deleted successfully"}
+    student_service.delete_student(student_id=user_id, repo=repo, instructor_id=instructor.id)
+
+
+@router.get("/students/{user_id}/grade-history", response_class=FastJSONResponse,
+        tags = ["Instructor"],
+        description="Audited changes of a student's grade, latest first: who changed it, when, and the marks before and after. "
+                    "The trail is written behind the requests, a change shows up within GRADE_AUDIT_FLUSH_INTERVAL seconds",
+        summary="Grade change history")
+def get_grade_history(
+    user_id: int,
+    repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = GRADE_HISTORY_PAGE_SIZE
+):
+    return FastJSONResponse(instructor_service.get_grade_history(repo, student_id=user_id, limit=limit))
 
 
 
-@router.get("/instructor/{instructor_id}", response_model=GetInstructorResponse)  # Get instructor by id
+@router.get("/instructor/{instructor_id}", response_model=GetInstructorResponse, response_class=FastJSONResponse)  # Get instructor by id
 def get_instructor_by_id(
     instructor_id: int,
-    repo: Annotated[AbstractRepo, Depends(get_repo)],
-    token: Annotated[str, Depends(oauth2_scheme_instructor)],
-    session: Session
+    repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    fields: UserFields
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-    instructor = instructor_service.get_instructor(instructor_id=instructor_id, user_repo=repo)
-    try:
-        return GetInstructorResponse.model_validate(dict(instructor))  # Use model_validate to create a UserSchema instance
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))  # Handle validation errors
+    return FastJSONResponse(instructor_service.get_instructor_fields(instructor_id=instructor_id, user_repo=repo, fields=fields))
 
 
-@router.get("/instructors", response_model=GetInstructorsResponse)  # Get all instructors
+@router.get("/instructors", response_model=GetInstructorsResponse, response_class=FastJSONResponse)  # Get all instructors, paginated by ?after_id=&limit=
 def get_instructors(
-    repo: Annotated[AbstractRepo, Depends(get_repo)],
-    token: Annotated[str, Depends(oauth2_scheme_instructor)],
-    session: Session
+    request: Request,
+    repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    fields: UserListFields,
+    after_id: int | None = None,
+    limit: PageLimit = DEFAULT_PAGE_SIZE
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
+    if wants_ndjson(request):
+        return StreamingResponse(ndjson_lines(instructor_service.stream_instructors(repo, after_id=after_id, fields=fields)), media_type=NDJSON_MEDIA_TYPE)
+
     # Operation
-    instructors = instructor_service.get_instructor(repo)
-    return GetInstructorsResponse(instructors=instructors)
+    instructors = instructor_service.get_instructors(repo, after_id=after_id, limit=limit, fields=fields)
+    return FastJSONResponse({"instructors": instructors, "next_after_id": next_cursor(instructors, limit)})
 
 
-@router.put("/instructor/{instructor_id}", response_model=UpdateStudentResponse)  # Update a student
+@router.put("/instructor/{instructor_id}", response_model=UpdateInstructorResponse)  # Update an instructor
 def update_instructor(
     instructor_id: int,
     schema: UpdateUserSchema,
-    repo: Annotated[AbstractRepo, Depends(get_repo)],
-    session: Session,
-    token: Annotated[str, Depends(oauth2_scheme_instructor)]
+    repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-        
-    instructor = instructor_service.update_instructor(instructor_id=instructor_id, repo=repo, data=schema)
+    updated_instructor = instructor_service.update_instructor(instructor_id=instructor_id, repo=repo, data=schema)
     try:
-        return UpdateInstructorResponse.model_validate(dict(instructor))  # Use model_validate to create a UserSchema instance
+        return UpdateInstructorResponse.model_validate(updated_instructor, from_attributes=True)  # Use model_validate to create a UserSchema instance
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))  # Handle validation errors
 
 
 
-@router.delete("/instructor/{user_id}", status_code=204)  # Delete a student
+@router.delete("/instructor/{user_id}", status_code=204)  # Delete an instructor
 def delete_instructor(
     user_id: int,
-    repo: Annotated[AbstractRepo, Depends(get_repo)],
-    session = Session, 
-    token = Annotated[str, Depends(oauth2_scheme_instructor)]
+    repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
 ):
-    payload = verify_token(token)
-    userRepo = UserRepository(session)
-    instructor = userRepo.get_instructor_by_name(payload.get("username"))
-    
-    if instructor is None:
-        raise HTTPException(
-            status_code= status.HTTP_404_NOT_FOUND,
-            details = "Couldn't Find this instructor",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-        
     instructor_service.delete_instructor(instructor_id = user_id, repo = repo)
-    
-    return {"deleted successfully"}
 
 
-@router.get("/my-grades", 
-         response_model = Grade, 
-         tags = ["Students' Endpoints"], 
+@router.get("/my-grades",
+         response_model = Grade,
+         response_class=FastJSONResponse,
+         tags = ["Students' Endpoints"],
          description="Student view his/her grades",
          summary="Student view his/her grades")
-async def get_student_grade(student_name: str , token: Annotated[str, Depends(oauth2_scheme_student)], session: Session):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = verify_token(token)
-
-        if not payload:
-            raise HTTPException(
-                status_code= status.HTTP_204_NO_CONTENT,
-                details= "No Token Found",
-                headers= {"WWW-Authenticate": "Bearer"}
-            )
-        username = payload.get("username")
-        if username == student_name:
-            token_D = {
-                "username": username,
-                "role": payload.get("role")
-            }
-            token_data = TokenData(**token_D)
-        
-        # if the username in the token doesn't match the student_name parameter provided in the request
-        if username != student_name:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You are not authorized to access this student's grade",
-                )
-
-    except InvalidTokenError:
-        raise credentials_exception
-    
-    except ExpiredSignatureError:
+async def get_student_grade(
+    student_name: str,
+    student: Annotated[Student, Depends(get_current_student)],
+    repo: Annotated[AsyncStudentRepo, Depends(get_async_student_repo)],
+    fields: GradeFields
+):
+    # if the username in the token doesn't match the student_name parameter provided in the request
+    if student.userName != student_name:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not authorized to access this student's grade",
             )
-    
-    userRepo = UserRepository(session)
-    student = userRepo.get_student_by_name(username = token_data.username)
-    
-    if student is None:
-        raise credentials_exception
-    
-    Student_grades = student_service.get_my_grades(student_id = student.id)
-    
-    # Handling the error condition for null value of the Student_grades
-    if Student_grades is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No grades found for this student"
-        )
-    return Student_grades
-
-
-@router.get("/top-students", 
-        tags = ["Instructor"], 
-        description="Get the top 5 students by an Authorized instructor",
-        summary="Retrieve the top 5 most performant student")
-async def top_students(token: Annotated[str, Depends(oauth2_scheme_instructor)], session: Session):
-    
-    # credentials_exception = HTTPException(
-    #     status_code=status.HTTP_401_UNAUTHORIZED,
-    #     detail="Could not validate credentials",
-    #     headers={"WWW-Authenticate": "Bearer"},
-    # )
-    try:
-        payload = verify_token(token)
-        userRepo = UserRepository(session)
-        instructor = userRepo.get_instructor_by_name(payload.get("username"))
-        # UnAuthorized token sent is not granted the permission to use this endpoint
 
-        if instructor is None:
-            raise HTTPException(
-                status_code= status.HTTP_404_NOT_FOUND,
-                details = "Couldn't Find this instructor",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        
+    # raises 404 when the student has no grades yet
+    Student_grades = await student_service.get_my_grade_fields_async(student_id = student.id, repo = repo, fields = fields)
+    return FastJSONResponse(Student_grades)
+
+
+@router.get("/top-students",
+        response_class=FastJSONResponse,
+        tags = ["Instructor"],
+        description="Get the top N students (overall average or a single subject). Ties share a rank and students tied at "
+                    "the cutoff are all listed, up to MAX_BOARD_ROWS (200) rows in all",
+        summary="Retrieve the most performant students")
+async def top_students(
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    repo: Annotated[AsyncInstructorRepo, Depends(get_async_instructor_repo)],
+    n: Annotated[int, Query(ge=1, le=MAX_TOP_N)] = DEFAULT_TOP_N,
+    subject: Subject | None = None
+):
+    try:
         # Perform operation here
-        
-        topStudents = instructor_service.get_top_students()
 
-        return topStudents
-    
-    except sqlite3.IntegrityError:
+        topStudents = await instructor_service.get_top_students_async(repo, n=n, subject=subject)
+
+        return FastJSONResponse(topStudents)
+
+    except IntegrityError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="A student Records not found")
-    
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error: " + str(e))
-    
-    except ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-            )
 
 
-@router.put("/students/grades/update-Add", 
-         response_model= Grade, 
-         tags = ["Instructor"], 
+@router.put("/students/grades/update-Add",
+         response_model= Grade,
+         tags = ["Instructor"],
          description="Update Existing Student Marks by an Authorized instructor",
          summary="Update existing Records of Students")
-async def update_or_Add_student_Record(student_id: int, grade: GradeSchema, token: Annotated[str, Depends(oauth2_scheme_instructor)], session: Session):
-    
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def update_or_Add_student_Record(
+    student_id: int,
+    grade: GradeSchema,
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    student_repo: Annotated[AsyncStudentRepo, Depends(get_async_student_repo)],
+    instructor_repo: Annotated[AsyncInstructorRepo, Depends(get_async_instructor_repo)]
+):
     try:
-        payload = verify_token(token)
-        userRepo = UserRepository(session)
-        instructor = userRepo.get_instructor_by_name(payload.get("username"))
-        # UnAuthorized token sent is not granted the permission to use this endpoint
+        # operation
 
-        if instructor is None:
-            raise HTTPException(
-                status_code= status.HTTP_404_NOT_FOUND,
-                details = "Couldn't Find this instructor",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        
-        # operation 
-        
-        existing_student= student_service.get_student(student_id)
+        existing_student = await student_repo.get_student_by_id(student_id)
         if not existing_student:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Student with the ID provided not found")
-        
+
         # check if the student has grades in the grade table
-        existing_student_grade = student_service.get_my_grades(student_id)
-        
+        existing_student_grade = await student_repo.get_my_grades(student_id)
+
         if existing_student_grade:
             # Update the student grades if already existing
-            update_grade = instructor_service.update_grade(student_id = student_id, data= grade)
-            
+            update_grade = await instructor_service.update_grade_async(student_id = student_id, data = grade, repo = instructor_repo, instructor_id = instructor.id)
+
             return update_grade
-        
+
         else:
-            new_grade = instructor_service.add_new_grade(data = grade)
-            
+            new_grade = await instructor_service.add_new_grade_async(data = grade, repo = instructor_repo, instructor_id = instructor.id)
+
             return new_grade
-    
-    except InvalidTokenError:
-            raise credentials_exception
-    
-    except ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-            )
-    except sqlite3.IntegrityError as e:
+
+    except IntegrityError as e:
     # Check if it's a CHECK constraint violation
         if 'CHECK constraint failed' in str(e):
             raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail="Grade value exceeds the allowed range (0-20).")
-    
+        raise
+
 
 
-@router.get("/all-grades", 
-        tags = ["Instructor"], 
+@router.get("/all-grades",
+        response_class=FastJSONResponse,
+        tags = ["Instructor"],
         description="Get all the students with their grade records",
         summary="get all student grades")
-async def view_grades(token: Annotated[str, Depends(oauth2_scheme_instructor)], session: Session):
-    
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def view_grades(
+    request: Request,
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    repo: Annotated[AsyncInstructorRepo, Depends(get_async_instructor_repo)],
+    fields: GradeListFields,
+    after_id: int | None = None,
+    limit: PageLimit = DEFAULT_PAGE_SIZE
+):
+    if wants_ndjson(request):
+        return StreamingResponse(async_ndjson_lines(instructor_service.stream_all_grades_async(repo, after_id=after_id, fields=fields)), media_type=NDJSON_MEDIA_TYPE)
+
     try:
-        payload = verify_token(token)
-        userRepo = UserRepository(session)
-        instructor = userRepo.get_instructor_by_name(payload.get("username"))
-        # UnAuthorized token sent is not granted the permission to use this endpoint
+        #  OPeration performed
 
-        if instructor is None:
-            raise HTTPException(
-                status_code= status.HTTP_404_NOT_FOUND,
-                details = "Couldn't Find this instructor",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        #  OPeration performed 
-        
-        all_grades = instructor_service.view_all_grades()
-        
-        if not all_grades:
+        all_grades = await instructor_service.view_all_grades_async(repo, after_id=after_id, limit=limit, fields=fields)
+
+        if not all_grades and after_id is None:
             raise HTTPException(
-                status_code = status.HTTP_404_NOT_FOUND, 
+                status_code = status.HTTP_404_NOT_FOUND,
                 detail="No record Found")
-        
-        return all_grades
-    
-    except sqlite3.IntegrityError:
+
+        # the body stays a plain list, the cursor for the next page travels in a header
+        cursor = next_cursor(all_grades, limit)
+        headers = {"X-Next-After-Id": str(cursor)} if cursor is not None else None
+
+        return FastJSONResponse(all_grades, headers=headers)
+
+    except IntegrityError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="A student Records not found")
-    
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error: " + str(e))
-    
-    except ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-            )
\ No newline at end of file
+
+
+@router.get("/all-grades/export",
+        tags = ["Instructor"],
+        description="Every student's grades in one download, CSV (default) or NDJSON, streamed from a server-side cursor: "
+                    "memory stays flat and the first bytes go out before the query has read the whole table",
+        summary="Export all student grades")
+async def export_grades(
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    repo: Annotated[AsyncInstructorRepo, Depends(get_async_instructor_repo)],
+    fields: GradeListFields,
+    export_format: Annotated[Literal["csv", "ndjson"], Query(alias="format")] = "csv"
+):
+    if export_format == "ndjson":
+        body, media_type = async_ndjson_lines(instructor_service.stream_all_grades_async(repo, fields=fields)), NDJSON_MEDIA_TYPE
+    else:
+        body, media_type = async_csv_lines(fields, instructor_service.export_all_grades_async(repo, fields=fields)), CSV_MEDIA_TYPE
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="grades.{export_format}"'})
+
+
+@router.post("/grades/import",
+        response_model = GradeImportReport,
+        tags = ["Instructor"],
+        description="Upsert many grades from a CSV (header row with GradeSchema fields) or NDJSON upload in one transaction",
+        summary="Bulk import student grades")
+def import_grades(
+    file: UploadFile,
+    repo: Annotated[InstructorRepo, Depends(get_instructor_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)],
+    file_format: Annotated[grade_import.ImportFormat | None, Query(alias="format")] = None
+):
+    file_format = file_format or grade_import.detect_format(file.filename, file.content_type)
+    rows = grade_import.read_rows(file.file, file_format)
+    return grade_import.import_grades(rows, repo, instructor_id=instructor.id)
+
+
+@router.get("/analytics/grades",
+        tags = ["Instructor"],
+        description="Per-subject mean, standard deviation, percentiles, histograms and correlations over all grades",
+        summary="Class-wide grade statistics")
+def grade_analytics(
+    session: Annotated[Session, Depends(get_session)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
+):
+    return analytics.grade_statistics(session)
+
+
+@router.post("/jobs",
+        status_code = status.HTTP_202_ACCEPTED,
+        response_model = ReportJobResponse,
+        tags = ["Instructor"],
+        description="Queue a full-school report (`grades` as CSV or NDJSON, or `top_students` as JSON) for the background workers; "
+                    "poll the Location it answers with until the job has succeeded, then download its result_url",
+        summary="Start a report job")
+def create_report_job(
+    body: ReportJobRequest,
+    repo: Annotated[ReportJobRepo, Depends(get_report_job_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
+):
+    job = report_jobs.enqueue(body, repo, instructor_id=instructor.id)
+    return FastJSONResponse(report_jobs.job_status(job), status_code=status.HTTP_202_ACCEPTED,
+                            headers={"Location": f"/api/jobs/{job.id}"})
+
+
+@router.get("/jobs/{job_id}",
+        response_model = ReportJobResponse,
+        tags = ["Instructor"],
+        description="Status, progress (rows written out of total) and, once it succeeded, result location of a report job",
+        summary="Poll a report job")
+def get_report_job(
+    job_id: int,
+    repo: Annotated[ReportJobRepo, Depends(get_report_job_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
+):
+    return FastJSONResponse(report_jobs.job_status(report_jobs.get_job(repo, job_id)))
+
+
+@router.get("/jobs/{job_id}/result",
+        tags = ["Instructor"],
+        description="Download the report a succeeded job wrote, 409 while it is queued or running or when it failed, "
+                    "410 once its retention period is over",
+        summary="Download a report")
+def get_report_job_result(
+    job_id: int,
+    repo: Annotated[ReportJobRepo, Depends(get_report_job_repo)],
+    instructor: Annotated[Instructor, Depends(get_current_instructor)]
+):
+    path, media_type = report_jobs.get_result(repo, job_id)
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
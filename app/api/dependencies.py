@@ -1,11 +1,94 @@
 from typing import Annotated
 
-from fastapi import Depends
+from fastapi import Depends, Request
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.data.database import get_session
-from app.data.student_repo import StudentRepo, AbstractRepo
+from app.data.database import Intent
+from app.data.instructor_repo import AsyncInstructorRepo, InstructorRepo
+from app.data.report_job_repo import ReportJobRepo
+from app.data.student_repo import AsyncStudentRepo, StudentRepo, AbstractRepo
+from app.data.unit_of_work import AsyncUnitOfWork, UnitOfWork
+
+# routes declare their intent through their method: these only read
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# any value sends the request's reads to the primary, e.g. right after a write when a replica may lag
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+
+
+def route_intent(request: Request) -> Intent:
+    if request.method in READ_METHODS and not request.headers.get(READ_YOUR_WRITES_HEADER):
+        return Intent.READ
+    return Intent.WRITE
+
+
+# one unit of work of each kind per request: the auth dependencies and the route share its session
+async def get_unit_of_work(intent: Annotated[Intent, Depends(route_intent)]):
+    work = UnitOfWork(intent)
+    try:
+        yield work
+    finally:
+        # closing returns the connection to the pool, blocking IO; most async routes never open this session
+        if work.opened:
+            await run_in_threadpool(work.close)
+
+
+async def get_async_unit_of_work(intent: Annotated[Intent, Depends(route_intent)]):
+    work = AsyncUnitOfWork(intent)
+    try:
+        yield work
+    finally:
+        await work.close()
+
+
+async def commit_unit_of_work(
+    work: Annotated[UnitOfWork, Depends(get_unit_of_work)],
+    async_work: Annotated[AsyncUnitOfWork, Depends(get_async_unit_of_work)],
+):
+    """Router dependency, function scope: commits once the route has returned, before the response is sent.
+
+    A route that raises rolls back instead. The sessions stay open (request scope) for streamed bodies.
+    """
+    try:
+        yield
+    except BaseException:
+        await async_work.rollback()
+        if work.pending:
+            await run_in_threadpool(work.rollback)
+        raise
+    await async_work.commit()
+    if work.pending:
+        await run_in_threadpool(work.commit)
+
+
+COMMIT_UNIT_OF_WORK = Depends(commit_unit_of_work, scope="function")
+
+
+async def get_session(work: Annotated[UnitOfWork, Depends(get_unit_of_work)]) -> Session:
+    # building the session does no IO, it connects on its first statement
+    return work.session
+
+
+async def get_async_session(work: Annotated[AsyncUnitOfWork, Depends(get_async_unit_of_work)]) -> AsyncSession:
+    return await work.session()
 
 
 def get_repo(session: Annotated[Session, Depends(get_session)]) -> AbstractRepo:
-    return StudentRepo(session)
\ No newline at end of file
+    return StudentRepo(session)
+
+
+def get_instructor_repo(session: Annotated[Session, Depends(get_session)]) -> InstructorRepo:
+    return InstructorRepo(session)
+
+
+def get_async_student_repo(session: Annotated[AsyncSession, Depends(get_async_session)]) -> AsyncStudentRepo:
+    return AsyncStudentRepo(session)
+
+
+def get_async_instructor_repo(session: Annotated[AsyncSession, Depends(get_async_session)]) -> AsyncInstructorRepo:
+    return AsyncInstructorRepo(session)
+
+
+def get_report_job_repo(session: Annotated[Session, Depends(get_session)]) -> ReportJobRepo:
+    return ReportJobRepo(session)
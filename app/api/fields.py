@@ -0,0 +1,34 @@
+from typing import Annotated, Callable, Sequence
+
+from fastapi import HTTPException, Query, status
+
+# the row key and pagination cursor, part of every sparse fieldset
+ALWAYS_INCLUDED = "id"
+
+
+def sparse_fields(allowed: Sequence[str], default: Sequence[str] | None = None) -> Callable[..., tuple[str, ...]]:
+    """Dependency turning `?fields=a,b` into the tuple of columns a route selects and returns.
+
+    Only names in `allowed` are accepted, so columns left out of it (`hashed_password`) can't be
+    requested. The result keeps the order of `allowed` and always contains `id`, which also makes
+    equivalent requests share a response cache entry.
+    """
+    allowed = tuple(allowed)
+    default = tuple(default or allowed)
+
+    def dependency(
+        fields: Annotated[str | None, Query(description=f"Comma-separated subset of: {', '.join(allowed)}")] = None,
+    ) -> tuple[str, ...]:
+        if not fields:
+            return default
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested.difference(allowed)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}",
+            )
+        requested.add(ALWAYS_INCLUDED)
+        return tuple(name for name in allowed if name in requested)
+
+    return dependency
@@ -0,0 +1,110 @@
+import logging
+import time
+
+from fastapi import APIRouter, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+from app.data import query_trace
+
+logger = logging.getLogger(__name__)
+
+UNMATCHED_ROUTE = "<unmatched>"
+# set by layers that answer before routing (the response cache) so their responses keep their route label
+ROUTE_TEMPLATE_KEY = "route_template"
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def route_template(scope: Scope) -> str:
+    """The path template the request was routed to (`/api/students/{user_id}`), never the raw path."""
+    route = scope.get("route")
+    template = getattr(route, "path_format", None) or getattr(route, "path", None)
+    return template or scope.get(ROUTE_TEMPLATE_KEY) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Latency and status metrics per (method, route template), plus the SQL each request ran.
+
+    The route is only known once the router has run, so the in-flight gauge is per method. Paths that
+    match no route share a single label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"] if scope["method"] in HTTP_METHODS else "OTHER"
+        status = 500
+        stats = metrics.QueryStats()
+        token = metrics.current_query_stats.set(stats)
+
+        async def record_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.http_requests_in_progress.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, record_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.current_query_stats.reset(token)
+            metrics.http_requests_in_progress.dec(method)
+            route = route_template(scope)
+            metrics.http_requests.inc(method, route, str(status))
+            metrics.http_request_duration.observe(elapsed, method, route)
+            metrics.http_request_db_queries.observe(stats.count, method, route)
+            metrics.http_request_db_duration.observe(stats.seconds, method, route)
+
+
+class FirstRequestMiddleware:
+    """Times the first request of the process, the one that pays for anything the startup didn't warm."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.pending = True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.pending or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        self.pending = False
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.app_first_request_duration.set(elapsed)
+            logger.info("First request %s %s served in %.1f ms", scope["method"], route_template(scope), elapsed * 1000)
+
+
+class QueryTraceMiddleware:
+    """Collects the statements of each request into one trace and reports it once the response is sent."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = query_trace.QueryTrace(f"{scope['method']} {scope['path']}")
+        token = query_trace.current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            query_trace.current_trace.reset(token)
+            trace.label = f"{scope['method']} {route_template(scope)}"
+            query_trace.report(trace)
@@ -0,0 +1,290 @@
+"""Conditional GET and an in-process response cache for the read-mostly list endpoints.
+
+A cached body is keyed by path, query string, Accept header and bearer token, and is tagged with
+the versions of the tables it was built from. The versions live in SQLite (`table_version`, bumped
+by the repo write methods in the writing transaction), so writes from another worker invalidate
+our entries too. An entry only depends on the counters of the tables its route reads. Checking them
+costs one `PRAGMA data_version` on a dedicated connection, read on a worker thread. That value only
+moves when another connection committed, and only then are the counters read again.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from jose import JWTError, jwt
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.metrics import ROUTE_TEMPLATE_KEY
+from app.api.streaming import NDJSON_MEDIA_TYPE
+from app.auth.principal_cache import principal_cache, token_key
+from app.auth.token import revoked_families
+from app.data.database import engine
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+
+# path -> tables whose rows (or whose principals) the response is built from
+CACHED_ROUTES: dict[str, tuple[str, ...]] = {
+    "/api/students": ("student", "instructor"),
+    "/api/students/search": ("student", "instructor"),
+    "/api/instructors": ("instructor",),
+    "/api/all-grades": ("student", "grade", "instructor"),
+    "/api/top-students": ("student", "grade", "instructor"),
+    "/api/my-grades": ("student", "grade"),
+}
+
+CACHE_CONTROL = b"private, no-cache"
+VARY = b"Authorization, Accept"
+
+
+class TableVersions:
+    """Current `table_version` counters, re-read only when SQLite reports a commit by someone else.
+
+    Every table the app writes has a counter, so a commit that left all of them as they were came
+    from outside the app (sqlite3 shell, a script using its own session): only then does `epoch`
+    move, and every cached response goes stale. It does blocking I/O, call it from a thread.
+    """
+
+    def __init__(self, db_engine: Engine):
+        self._engine = db_engine
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._data_version: int | None = None
+        self._versions: dict[str, int] = {}
+        self._epoch = 0
+
+    def _connect(self) -> sqlite3.Connection | None:
+        database = self._engine.url.database
+        if not database or database == ":memory:" or database.startswith("file::memory:"):
+            return None
+        return sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+
+    def current(self, tables: tuple[str, ...]) -> tuple[int, ...]:
+        with self._lock:
+            if self._connection is None:
+                self._connection = self._connect()
+            if self._connection is None:
+                # in-memory database, there is no second connection to watch from: read the counters every time
+                with self._engine.connect() as connection:
+                    self._versions = dict(connection.exec_driver_sql("SELECT name, version FROM table_version").all())
+            else:
+                data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != self._data_version:
+                    versions = dict(self._connection.execute("SELECT name, version FROM table_version"))
+                    if versions == self._versions:
+                        self._epoch += 1
+                    self._versions, self._data_version = versions, data_version
+            return (self._epoch, *(self._versions.get(table, 0) for table in tables))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection, self._data_version = None, None
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    versions: tuple[int, ...]
+    etag: bytes
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+
+class ResponseCache:
+    """LRU of serialized response bodies, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, versions: tuple[int, ...]) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.versions != versions or entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        if entry.size > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+def make_etag(body: bytes) -> bytes:
+    return b'"' + hashlib.sha256(body).hexdigest()[:32].encode() + b'"'
+
+
+def etag_matches(if_none_match: str | None, etag: bytes) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, a W/ prefix doesn't prevent a match
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.decode() in tags
+
+
+def _token_claims(token: str) -> dict:
+    # the token was verified by the route that produced the entry, its claims are only read here
+    try:
+        return jwt.get_unverified_claims(token)
+    except JWTError:
+        return {}
+
+
+def _token_expiry(token: str) -> float:
+    # bounds the entry's lifetime
+    claims = _token_claims(token)
+    if not claims:
+        return 0.0
+    expires_at = claims.get("exp")
+    return float(expires_at) if expires_at is not None else float("inf")
+
+
+def _still_authorized(token: str) -> bool:
+    """Whether a hit may skip the route's auth: the token's login isn't revoked and its principal
+    still resolves (revoking, updating or deleting the principal drops it from the principal cache)."""
+    return _token_claims(token).get("fam") not in revoked_families and principal_cache.resolves(token)
+
+
+class ResponseCacheMiddleware:
+    """Serves `CACHED_ROUTES` from `ResponseCache` and answers a matching `If-None-Match` with 304.
+
+    Only successful, non-streamed, authenticated GETs are stored. Misses run the route as usual,
+    with the body buffered so its ETag can go in the headers. A hit is only served while the token's
+    principal is in the principal cache; otherwise the route runs, and with it the auth checks.
+    """
+
+    def __init__(self, app: ASGIApp, cache: ResponseCache, versions: TableVersions,
+                 routes: dict[str, tuple[str, ...]] = CACHED_ROUTES):
+        self.app = app
+        self.cache = cache
+        self.versions = versions
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.routes:
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        accept = headers.get("accept", "")
+        if scheme.lower() != "bearer" or not token or NDJSON_MEDIA_TYPE in accept:
+            return await self.app(scope, receive, send)
+
+        # versions are read before the route runs, a write racing with it leaves the entry already stale
+        versions = await run_in_threadpool(self.versions.current, self.routes[scope["path"]])
+        key = (scope["path"], scope["query_string"], accept, token_key(token))
+        if_none_match = headers.get("if-none-match")
+
+        entry = self.cache.get(key, versions)
+        if entry is not None and _still_authorized(token):
+            # answered without routing; the cached paths are their own route templates
+            scope[ROUTE_TEMPLATE_KEY] = scope["path"]
+            if etag_matches(if_none_match, entry.etag):
+                return await _send_not_modified(send, entry.etag)
+            await send({"type": "http.response.start", "status": 200, "headers": entry.headers})
+            return await send({"type": "http.response.body", "body": entry.body})
+
+        await self._fill(scope, receive, send, key, versions, token, if_none_match)
+
+    async def _fill(self, scope: Scope, receive: Receive, send: Send, key: tuple, versions: tuple[int, ...],
+                    token: str, if_none_match: str | None):
+        start: Message | None = None
+        chunks: list[bytes] = []
+        size = 0
+        passthrough = False
+
+        async def capture(message: Message):
+            nonlocal start, size, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                if message["status"] != 200:
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > self.cache.max_entry_bytes:
+                # too big to keep, hand over what was held back and stream the rest
+                passthrough = True
+                await send(start)
+                return await send({**message, "body": b"".join(chunks)})
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            etag = make_etag(body)
+            response_headers = [
+                (name, value) for name, value in start["headers"]
+                if name.lower() not in (b"etag", b"cache-control", b"vary")
+            ]
+            response_headers += [(b"etag", etag), (b"cache-control", CACHE_CONTROL), (b"vary", VARY)]
+            self.cache.put(key, CachedResponse(versions, etag, response_headers, body, _token_expiry(token)))
+
+            if etag_matches(if_none_match, etag):
+                return await _send_not_modified(send, etag)
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, capture)
+
+
+async def _send_not_modified(send: Send, etag: bytes):
+    await send({
+        "type": "http.response.start",
+        "status": 304,
+        "headers": [(b"etag", etag), (b"cache-control", CACHE_CONTROL), (b"vary", VARY)],
+    })
+    await send({"type": "http.response.body", "body": b""})
+
+
+response_cache = ResponseCache()
+table_versions = TableVersions(engine)
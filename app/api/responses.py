@@ -0,0 +1,15 @@
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON encoded by orjson, which handles dates and datetimes itself.
+
+    Routes that already hold the response in its final shape return this directly, so FastAPI skips
+    `response_model` validation and `jsonable_encoder` and the content is walked exactly once.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
@@ -0,0 +1,79 @@
+import csv
+import io
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Sequence
+
+import orjson
+from fastapi import Request
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+MAX_PAGE_SIZE = 1000
+# page size of the list routes when ?limit= is absent; the full list is only ever streamed (NDJSON)
+DEFAULT_PAGE_SIZE = 100
+# flush to the socket once this many bytes are buffered rather than once per row
+STREAM_CHUNK_SIZE = 64 * 1024
+# a text cell starting with one of these is a formula to Excel and LibreOffice (CSV injection)
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def next_cursor(rows: list[dict[str, Any]], limit: int | None) -> int | None:
+    # a full page means there may be more rows after the last id
+    if limit is None or len(rows) < limit:
+        return None
+    return rows[-1]["id"]
+
+
+def _encode(row: dict[str, Any]) -> bytes:
+    return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def ndjson_lines(rows: Iterable[dict[str, Any]]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for row in rows:
+        buffer += _encode(row)
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def async_ndjson_lines(rows: AsyncIterable[dict[str, Any]]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for row in rows:
+        buffer += _encode(row)
+        if len(buffer) >= STREAM_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def csv_safe_row(row: Sequence[Any]) -> list[Any]:
+    """`row` with every text cell that a spreadsheet would evaluate prefixed by a quote, so it shows as text."""
+    return [f"'{cell}" if isinstance(cell, str) and cell.startswith(CSV_FORMULA_PREFIXES) else cell for cell in row]
+
+
+async def async_csv_lines(header: Sequence[str], rows: AsyncIterable[Sequence[Any]]) -> AsyncIterator[bytes]:
+    """CSV encoded row by row into a small buffer; the header goes out alone, before the query's first batch.
+
+    Text cells are escaped with `csv_safe_row`: the values come from users and the file is opened in spreadsheets.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    async for row in rows:
+        writer.writerow(csv_safe_row(row))
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -1,16 +1,35 @@
 # 13 the instructors' token route
 from datetime import timedelta
 from typing import Annotated
-from fastapi import Depends, HTTPException, APIRouter, status
+from fastapi import Depends, HTTPException, APIRouter, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth.dependencies import UserRepository
-from app.data.schemas import Token
-from sqlmodel import Session, select
-from app.auth.token import create_access_token
+from app.auth.dependencies import AsyncRefreshTokenRepo, AsyncUserRepository
+from app.api.dependencies import COMMIT_UNIT_OF_WORK, get_async_session
+from app.data.models import Instructor, Student
+from app.data.schemas import RefreshTokenRequest, Token
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.auth.token import ACCESS_TOKEN_EXPIRATION_TIMEOUT, create_access_token
 
 
-router = APIRouter(prefix="/auth")
-ACCESS_TOKEN_EXPIRATION_TIMEOUT = 45
+router = APIRouter(prefix="/auth", dependencies=[COMMIT_UNIT_OF_WORK])
+
+
+def issue_tokens(user: Instructor | Student, family: int, refresh_token: str) -> Token:
+    # the access token carries its refresh family, so revoking the family also ends it
+    access_token = create_access_token(
+        data = {
+            "uid": user.id,
+            "username": user.userName,
+            "role": user.userRole,
+            "fam": family },
+        expires_delta = timedelta(minutes = ACCESS_TOKEN_EXPIRATION_TIMEOUT)
+        )
+    return Token(
+        access_token = access_token,
+        token_type = "Bearer",
+        role = user.userRole,
+        refresh_token = refresh_token
+    )
 
 
 #  Authenticate Endpoint for the Instructors 
@@ -19,13 +38,13 @@ ACCESS_TOKEN_EXPIRATION_TIMEOUT = 45
         tags = ["Authentication Endpoints"], 
         description=" Implement token-based authentication",
         summary= "Authenticates an Instructor in the system")
-async def get_instructor_access_token (session: Session, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+async def get_instructor_access_token (session: Annotated[AsyncSession, Depends(get_async_session)], form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     # Access the username, password, from the form_data object
     username = form_data.username
     password = form_data.password
 # Add your authentication logic here, that's validating instructor credentials
-    user_repo = UserRepository(session)
-    instructor = user_repo.authenticate_instructor(username, password)
+    user_repo = AsyncUserRepository(session)
+    instructor = await user_repo.authenticate_instructor(username, password)
     
     if not instructor: 
         raise HTTPException(
@@ -34,22 +53,9 @@ async def get_instructor_access_token (session: Session, form_data: Annotated[OA
             headers = {"WWW-Authenticate":"Bearer"}
             )
     
-    # define the expiration time on successful authentication 
-    access_token_expiration_time = timedelta(minutes = ACCESS_TOKEN_EXPIRATION_TIMEOUT)
-    
-    #  create the access token 
-    access_token = create_access_token(
-        data = {
-            "username": username,
-            "role": instructor.userRole },
-        expires_delta = access_token_expiration_time
-        )
-    #response 
-    return Token(
-        access_token = access_token,
-        token_type = "Bearer",
-        role = instructor.userRole
-    )
+    # a new refresh family per login, later access tokens come from /auth/refresh without bcrypt
+    family, refresh_token = await AsyncRefreshTokenRepo(session).issue(instructor)
+    return issue_tokens(instructor, family, refresh_token)
 
 
 #  Authenticate Endpoint for the Students 
@@ -58,13 +64,13 @@ async def get_instructor_access_token (session: Session, form_data: Annotated[OA
         tags = ["Authentication Endpoints"], 
         description=" Implement token-based authentication",
         summary= "Authenticates a Student in the system")
-async def get_student_access_token (session: Session, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+async def get_student_access_token (session: Annotated[AsyncSession, Depends(get_async_session)], form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
     # Access the username, password, from the form_data object
     username = form_data.username
     password = form_data.password
 # Add your authentication logic here, that's validating instructor credentials
-    user_repo = UserRepository(session)
-    student = user_repo.authenticate_student(username, password)
+    user_repo = AsyncUserRepository(session)
+    student = await user_repo.authenticate_student(username, password)
     
     if not student: 
         raise HTTPException(
@@ -73,19 +79,32 @@ async def get_student_access_token (session: Session, form_data: Annotated[OAuth
             headers = {"WWW-Authenticate":"Bearer"}
             )
     
-    # define the expiration time on successful authentication 
-    access_token_expiration_time = timedelta(minutes = ACCESS_TOKEN_EXPIRATION_TIMEOUT)
-    
-    #  create the access token 
-    access_token = create_access_token(
-        data = {
-            "username": username,
-            "role": student.userRole },
-        expires_delta = access_token_expiration_time
-        )
-    #response 
-    return Token(
-        access_token = access_token,
-        token_type = "Bearer",
-        role = student.userRole
-    )
\ No newline at end of file
+    family, refresh_token = await AsyncRefreshTokenRepo(session).issue(student)
+    return issue_tokens(student, family, refresh_token)
+
+
+@router.post("/refresh",
+        response_model = Token,
+        tags = ["Authentication Endpoints"],
+        description = "Exchanges a refresh token for a new access token and the next refresh token; the one sent can't be used again",
+        summary = "Refreshes the tokens of a student or an instructor")
+async def refresh_tokens(body: RefreshTokenRequest, session: Annotated[AsyncSession, Depends(get_async_session)]):
+    rotated = await AsyncRefreshTokenRepo(session).rotate(body.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code = status.HTTP_401_UNAUTHORIZED,
+            detail = "Invalid refresh token",
+            headers = {"WWW-Authenticate":"Bearer"}
+            )
+    return issue_tokens(*rotated)
+
+
+@router.post("/revoke",
+        status_code = status.HTTP_204_NO_CONTENT,
+        tags = ["Authentication Endpoints"],
+        description = "Revokes a refresh token together with every token rotated from the same login",
+        summary = "Logs out a student or an instructor")
+async def revoke_refresh_token(body: RefreshTokenRequest, session: Annotated[AsyncSession, Depends(get_async_session)]):
+    # same answer whether or not the token was live
+    await AsyncRefreshTokenRepo(session).revoke(body.refresh_token)
+    return Response(status_code = status.HTTP_204_NO_CONTENT)
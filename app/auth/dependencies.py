@@ -1,6 +1,23 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app.data.models import Instructor, Student
+from app.auth.principal_cache import principal_cache
+from app.auth.token import (
+    ACCESS_TOKEN_EXPIRATION_TIMEOUT, new_refresh_token, parse_refresh_token, refresh_token_expiry, refresh_token_hash, revoked_families, verify_token,
+)
+from app.api.dependencies import get_async_session
+from app.data.models import Instructor, RefreshToken, Student
+from app.data.table_versions import bump_versions
+from sqlalchemy import delete, update
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from passlib.context import CryptContext
 
 
@@ -18,8 +35,18 @@ oauth2_scheme_instructor = OAuth2PasswordBearer(
     description= "Authentication endpoint for the Instructors"
     )
 
+# bcrypt work factor, raising it makes existing hashes get rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop without extra processes
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 # Create a password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+# Bulk provisioning hashes thousands of passwords at once, it gets one process per core
+BULK_HASH_PROCESSES = int(os.getenv("BULK_HASH_PROCESSES", str(os.cpu_count() or 1)))
+_bulk_hash_executor: ProcessPoolExecutor | None = None
+_bulk_hash_lock = threading.Lock()
 
 class UserRepository:
     def __init__(self, session: Session):
@@ -48,9 +75,235 @@ class UserRepository:
         return instructor
 
 
+class AsyncUserRepository:
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    async def get_instructor_by_name(self, instructor_name: str) -> Instructor | None:
+        result = await self._session.exec(select(Instructor).where(Instructor.userName == instructor_name))
+        return result.one_or_none()
+
+    async def get_student_by_name(self, student_name: str) -> Student | None:
+        result = await self._session.exec(select(Student).where(Student.userName == student_name))
+        return result.one_or_none()
+
+    async def get_principal(self, model: type[Instructor] | type[Student], payload: dict) -> Instructor | Student | None:
+        """The user an access token was issued to: its role must be `model`'s, and its id and name must still match."""
+        user_id = payload.get("uid")
+        if payload.get("role") != model.__name__ or not isinstance(user_id, int):
+            return None
+        result = await self._session.exec(select(model).where(model.id == user_id, model.userName == payload.get("username")))
+        return result.one_or_none()
+
+    async def authenticate_student(self, student_name: str, password: str):
+        student = await self.get_student_by_name(student_name)
+        if not student:
+            return False
+        if not await self._verify_and_rehash(student, password):
+            return False
+        return student
+
+    async def authenticate_instructor(self, instructor_name: str, password: str):
+        instructor = await self.get_instructor_by_name(instructor_name)
+        if not instructor:
+            return False
+        if not await self._verify_and_rehash(instructor, password):
+            return False
+        return instructor
+
+    async def _verify_and_rehash(self, user: Instructor | Student, password: str) -> bool:
+        valid, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+        if valid and new_hash:
+            # stored hash was made with another cost (or scheme), upgrade it while we have the plain password
+            user.hashed_password = new_hash
+            self._session.add(user)
+            await self._session.flush()
+            await self._session.exec(bump_versions(user.__tablename__))
+        return valid
+
+
+class AsyncRefreshTokenRepo:
+    """One `refresh_token` row per login, rotated in place; every method is a single keyed statement."""
+
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    async def issue(self, user: Instructor | Student) -> tuple[int, str]:
+        """Start a family for a password login, returns the family and the refresh token."""
+        # expired logins of this user go when they log in again, which keeps the table at about one row per device
+        await self._session.exec(delete(RefreshToken).where(
+            RefreshToken.role == user.userRole, RefreshToken.user_id == user.id, RefreshToken.expires_at <= time.time()))
+        family, token, token_hash = new_refresh_token()
+        self._session.add(RefreshToken(
+            family=family, token_hash=token_hash, role=user.userRole, user_id=user.id, user_name=user.userName,
+            user_created_at=user.created_at, expires_at=refresh_token_expiry()))
+        await self._session.flush()
+        await self._session.exec(bump_versions("refresh_token"))
+        return family, token
+
+    async def rotate(self, token: str) -> tuple[Instructor | Student, int, str] | None:
+        """Swap a current refresh token for the next one of its family, returns the user, family and new token.
+
+        The family's previous token, presented again, was used before, i.e. someone else holds a copy:
+        the whole family is revoked. That takes a secret the family was really issued: a family id is
+        no secret (access tokens carry it), so anything else only gets None, as unknown or expired tokens do.
+        """
+        parsed = parse_refresh_token(token)
+        if parsed is None or parsed[0] in revoked_families:
+            return None
+        family, secret = parsed
+        presented_hash = refresh_token_hash(secret)
+        _, new_token, new_hash = new_refresh_token(family)
+        result = await self._session.exec(
+            update(RefreshToken)
+            .where(RefreshToken.family == family, RefreshToken.token_hash == presented_hash,
+                   RefreshToken.expires_at > time.time())
+            .values(previous_hash=RefreshToken.token_hash, token_hash=new_hash, expires_at=refresh_token_expiry())
+            .returning(RefreshToken.role, RefreshToken.user_id, RefreshToken.user_name, RefreshToken.user_created_at)
+        )
+        row = result.one_or_none()
+        if row is None:
+            reused = await self._session.exec(
+                select(RefreshToken.family).where(RefreshToken.family == family, RefreshToken.previous_hash == presented_hash))
+            if reused.one_or_none() is not None:
+                await self.revoke_family(family)
+            return None
+        await self._session.exec(bump_versions("refresh_token"))
+        user = await self._session.get(Instructor if row.role == "Instructor" else Student, row.user_id)
+        if user is not None and (user.userName, user.created_at) != (row.user_name, row.user_created_at):
+            # the id now belongs to someone else: the login's user was deleted
+            user = None
+        if user is None:
+            await self.revoke_family(family)
+            return None
+        return user, family, new_token
+
+    async def revoke(self, token: str) -> bool:
+        """Log out: revoke the family of a current refresh token."""
+        parsed = parse_refresh_token(token)
+        if parsed is None:
+            return False
+        family, secret = parsed
+        result = await self._session.exec(
+            select(RefreshToken.family).where(RefreshToken.family == family, RefreshToken.token_hash == refresh_token_hash(secret)))
+        if result.one_or_none() is None:
+            return False
+        return await self.revoke_family(family)
+
+    async def revoke_family(self, family: int) -> bool:
+        result = await self._session.exec(
+            delete(RefreshToken).where(RefreshToken.family == family).returning(RefreshToken.role, RefreshToken.user_id))
+        row = result.one_or_none()
+        if row is not None:
+            await self._session.exec(bump_versions("refresh_token"))
+        # committed here, not by the unit of work: a revocation must stick even when the request then fails
+        await self._session.commit()
+        if row is None:
+            return False
+        # the family's access tokens stop working too; cached principals are resolved again
+        revoked_families.add(family, ACCESS_TOKEN_EXPIRATION_TIMEOUT * 60)
+        principal_cache.invalidate(row.role, row.user_id)
+        return True
+
+
 # Utility functions outside the class
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
+
+
+def _get_bulk_hash_executor() -> ProcessPoolExecutor:
+    global _bulk_hash_executor
+    with _bulk_hash_lock:
+        if _bulk_hash_executor is None:
+            # spawn: forking a process that already runs the event loop and thread pools is not safe
+            _bulk_hash_executor = ProcessPoolExecutor(
+                max_workers=BULK_HASH_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _bulk_hash_executor
+
+
+def hash_passwords_parallel(passwords: list[str]) -> list[str]:
+    """Hash a batch of passwords across the bulk hashing processes, results keep the input order."""
+    if len(passwords) < 2 or BULK_HASH_PROCESSES < 2:
+        return [hash_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (BULK_HASH_PROCESSES * 4))
+    return list(_get_bulk_hash_executor().map(hash_password, passwords, chunksize=chunksize))
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    # run bcrypt on the password pool, the event loop keeps serving other requests meanwhile
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, hash_password, password)
+
+
+# Current principal dependencies: one JWT decode and one lookup per token, then served from the cache
+async def get_current_instructor(
+    token: Annotated[str, Depends(oauth2_scheme_instructor)],
+    session: Annotated[AsyncSession, Depends(get_async_session)]
+) -> Instructor:
+    instructor = principal_cache.get(token, "Instructor")
+    if instructor is not None:
+        return instructor
+
+    payload = verify_token(token)
+    if payload.get("fam") in revoked_families:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    # by role and id: a student and an instructor may share a userName
+    instructor = await AsyncUserRepository(session).get_principal(Instructor, payload)
+    if instructor is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Couldn't Find this instructor",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    # detach so the cached object outlives this request's session
+    session.expunge(instructor)
+    principal_cache.put(token, "Instructor", instructor.id, instructor, payload.get("exp"))
+    return instructor
+
+
+async def get_current_student(
+    token: Annotated[str, Depends(oauth2_scheme_student)],
+    session: Annotated[AsyncSession, Depends(get_async_session)]
+) -> Student:
+    student = principal_cache.get(token, "Student")
+    if student is not None:
+        return student
+
+    payload = verify_token(token)
+    if payload.get("fam") in revoked_families:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    student = await AsyncUserRepository(session).get_principal(Student, payload)
+    if student is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    session.expunge(student)
+    principal_cache.put(token, "Student", student.id, student, payload.get("exp"))
+    return student
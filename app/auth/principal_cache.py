@@ -0,0 +1,91 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))  # seconds
+
+
+def token_key(token: str) -> str:
+    # never keep raw bearer tokens in memory longer than the request
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PrincipalCache:
+    """Bounded LRU of decoded tokens -> resolved principal, with a per-entry deadline.
+
+    Entries expire after `ttl` seconds or when the token itself expires, whichever
+    comes first, and can be dropped for a given principal when it is updated or deleted.
+    """
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str, int, Any]] = OrderedDict()
+        self._by_principal: dict[tuple[str, int], set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str, role: str) -> Any | None:
+        key = token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, entry_role, principal_id, principal = entry
+            if deadline <= time.monotonic():
+                self._remove(key)
+                return None
+            if entry_role != role:
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def resolves(self, token: str) -> bool:
+        """Whether the token's principal was resolved within the TTL and not invalidated since."""
+        with self._lock:
+            entry = self._entries.get(token_key(token))
+            return entry is not None and entry[0] > time.monotonic()
+
+    def put(self, token: str, role: str, principal_id: int, principal: Any, token_expires_at: float | None = None):
+        ttl = self.ttl
+        if token_expires_at is not None:
+            ttl = min(ttl, token_expires_at - time.time())
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        key = token_key(token)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, role, principal_id, principal)
+            self._by_principal.setdefault((role, principal_id), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, role: str, principal_id: int):
+        with self._lock:
+            for key in self._by_principal.pop((role, principal_id), set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_principal.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, role, principal_id, _ = entry
+        keys = self._by_principal.get((role, principal_id))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_principal[(role, principal_id)]
+
+
+principal_cache = PrincipalCache()
@@ -2,7 +2,11 @@ from fastapi import HTTPException, status
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import hashlib
 import os
+import secrets
+import threading
+import time
 from app.data.schemas import Token
 
 # Load SECRET_KEY from environment variables for better security
@@ -13,6 +17,10 @@ I used os.getenv("SECRET_KEY", default_value) to load the secret key from enviro
 If the environment variable is not set, it defaults to your existing hardcoded key.'''
 ALGORITHM = "HS256"
 
+ACCESS_TOKEN_EXPIRATION_TIMEOUT = 45  # minutes
+# Refresh tokens outlive many access tokens; every use extends this lifetime
+REFRESH_TOKEN_EXPIRATION_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRATION_DAYS", "30"))
+
 # Create a password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -49,3 +57,56 @@ def verify_token(token: str):
             detail=f"Token validation failed: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+# Refresh tokens are `<family>.<secret>`: the family names the login they descend from, only a hash of the secret is stored
+def new_refresh_token(family: int | None = None) -> tuple[int, str, bytes]:
+    """Returns the family, the token to hand out and the hash to store; a new login passes no family."""
+    if family is None:
+        family = secrets.randbits(63) or 1
+    secret = secrets.token_urlsafe(32)
+    return family, f"{family}.{secret}", refresh_token_hash(secret)
+
+
+def refresh_token_hash(secret: str) -> bytes:
+    # the secret is 256 random bits, a fast hash is enough (bcrypt protects guessable passwords)
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def parse_refresh_token(token: str) -> tuple[int, str] | None:
+    family, _, secret = token.partition(".")
+    if not family.isdigit() or not secret:
+        return None
+    return int(family), secret
+
+
+def refresh_token_expiry() -> int:
+    return int(time.time()) + REFRESH_TOKEN_EXPIRATION_DAYS * 86400
+
+
+class RevocationSet:
+    """Families revoked by this process, kept as long as the access tokens issued to them can be valid.
+
+    Access tokens carry their family (`fam`), so checking one against this set is a dict lookup.
+    """
+
+    def __init__(self):
+        self._deadlines: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, family: int, ttl: float):
+        now = time.monotonic()
+        with self._lock:
+            self._deadlines = {key: deadline for key, deadline in self._deadlines.items() if deadline > now}
+            self._deadlines[family] = now + ttl
+
+    def __contains__(self, family: int | None) -> bool:
+        deadline = self._deadlines.get(family)
+        return deadline is not None and deadline > time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._deadlines.clear()
+
+
+revoked_families = RevocationSet()
@@ -0,0 +1,58 @@
+"""Command line tools.
+
+    python -m app.cli provision-users users.ndjson
+    python -m app.cli provision-users users.csv
+
+Input rows carry the CreateUserSchema fields (userName, firstName, lastName, email,
+dateOfBirth, userRole, password); the report is printed as JSON.
+"""
+import argparse
+import csv
+import json
+import sys
+from typing import Iterator
+
+from pydantic import ValidationError
+from sqlmodel import Session
+
+from app.data.database import create_tables, engine
+from app.data.schemas import CreateUserSchema
+from app.domain import provisioning
+
+
+def read_users(path: str) -> Iterator[tuple[int, CreateUserSchema | Exception]]:
+    with open(path, encoding="utf-8-sig", newline="") as source:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(source)
+        else:
+            rows = (json.loads(line) for line in source if line.strip())
+        for index, row in enumerate(rows):
+            try:
+                yield index, CreateUserSchema.model_validate(row)
+            except (ValidationError, ValueError) as e:
+                yield index, e
+
+
+def provision_users_command(args: argparse.Namespace) -> int:
+    create_tables()
+    with Session(engine) as session:
+        report = provisioning.provision_users(read_users(args.path), session, batch_size=args.batch_size)
+    print(report.model_dump_json(indent=2))
+    return 0 if not report.failed else 1
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    provision = commands.add_parser("provision-users", help="bulk create students/instructors from a CSV or NDJSON file")
+    provision.add_argument("path")
+    provision.add_argument("--batch-size", type=int, default=provisioning.PROVISIONING_BATCH_SIZE)
+    provision.set_defaults(handler=provision_users_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,257 @@
-from sqlmodel import create_engine, SQLModel, Session
-from contextlib import contextmanager
+import logging
+import os
+from contextlib import asynccontextmanager, contextmanager
+from enum import Enum
+from itertools import count
 
-# Database connection
-DATABASE_URL = "sqlite:///school.db"
-engine = create_engine(DATABASE_URL)
+from sqlalchemy import Select, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import metrics
+from app.data import query_trace
+
+logger = logging.getLogger(__name__)
+
+# Database connection, overridable per node through the environment
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///school.db")
+
+
+def to_async_url(url: str) -> str:
+    """Map a sync database URL onto its asyncio driver (sqlite -> aiosqlite)."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.get_driver_name() in ("pysqlite", "sqlite"):
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+# Comma-separated read engines (replica copies, or a `mode=ro` URI, see `read_only_url`). Unset, every
+# session reads from the primary
+DATABASE_READ_URLS = os.getenv("DATABASE_READ_URLS", "")
+
+# SQLite pragmas applied to every new DBAPI connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative values are KiB, i.e. 64 MiB
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds
+
+# the pragmas set by the connect hooks above, read back at startup
+REPORTED_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "busy_timeout")
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    database = make_url(url).database
+    return database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first so that switching the journal mode waits on concurrent writers
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+def _apply_sqlite_reader_pragmas(dbapi_connection, _connection_record):
+    # no journal_mode/synchronous: a read-only connection can't change them, and doesn't write
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        # replica copies are opened read-write by SQLite, refuse writes through them anyway
+        cursor.execute("PRAGMA query_only = 1")
+    finally:
+        cursor.close()
+
+
+def read_only_url(url: str) -> str | None:
+    """A `mode=ro` URI on the same SQLite file as `url`, None for in-memory or non-SQLite databases."""
+    parsed = make_url(url)
+    if not _is_sqlite(url) or _is_memory_sqlite(url) or parsed.database.startswith("file:"):
+        return None
+    return parsed.set(database=f"file:{parsed.database}", query={"mode": "ro", "uri": "true"}).render_as_string(hide_password=False)
+
+
+def read_urls(configured: str = DATABASE_READ_URLS) -> list[str]:
+    return [read_url.strip() for read_url in configured.split(",") if read_url.strip()]
+
+
+def _engine_kwargs(url: str, **kwargs) -> dict:
+    engine_kwargs = {}
+    if _is_sqlite(url):
+        # FastAPI runs sync routes in a thread pool, connections are handed between threads
+        engine_kwargs["connect_args"] = {"check_same_thread": False}
+    if not (_is_sqlite(url) and _is_memory_sqlite(url)):
+        # in-memory SQLite uses a singleton pool that doesn't take sizing arguments
+        engine_kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=False,
+        )
+    engine_kwargs.update(kwargs)
+    return engine_kwargs
+
+
+def _instrument(sync_engine: Engine):
+    # count and time every statement, per request and per statement type (see app.metrics)
+    event.listen(sync_engine, "before_cursor_execute", metrics.before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", metrics.after_cursor_execute)
+    # opt-in statement tracing, a no-op unless SQL_TRACE is set (see app.data.query_trace)
+    event.listen(sync_engine, "before_cursor_execute", query_trace.before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", query_trace.after_cursor_execute)
+    event.listen(sync_engine, "checkin", query_trace.on_checkin)
+
+
+def create_db_engine(url: str = DATABASE_URL, read_only: bool = False, **kwargs) -> Engine:
+    """Build an engine for `url` with the pool settings and, for SQLite, the pragmas above."""
+    new_engine = create_engine(url, **_engine_kwargs(url, **kwargs))
+    if _is_sqlite(url):
+        event.listen(new_engine, "connect", _apply_sqlite_reader_pragmas if read_only else _apply_sqlite_pragmas)
+    _instrument(new_engine)
+    return new_engine
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, read_only: bool = False, **kwargs) -> AsyncEngine:
+    """Async counterpart of `create_db_engine`, same pool settings and pragmas."""
+    new_engine = create_async_engine(url, **_engine_kwargs(url, **kwargs))
+    if _is_sqlite(url):
+        event.listen(new_engine.sync_engine, "connect", _apply_sqlite_reader_pragmas if read_only else _apply_sqlite_pragmas)
+    _instrument(new_engine.sync_engine)
+    return new_engine
+
+
+def get_effective_pragmas(db_engine: Engine) -> dict[str, str]:
+    """Read back the pragmas a pooled connection actually runs with."""
+    if db_engine.dialect.name != "sqlite":
+        return {}
+    with db_engine.connect() as connection:
+        return {
+            pragma: connection.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+            for pragma in REPORTED_PRAGMAS
+        }
+
+
+def log_effective_pragmas(db_engine: Engine) -> dict[str, str]:
+    pragmas = get_effective_pragmas(db_engine)
+    pool = db_engine.pool
+    logger.info(
+        "Database %s: pool=%s size=%s pragmas=%s",
+        db_engine.url.render_as_string(hide_password=True),
+        type(pool).__name__,
+        pool.size() if hasattr(pool, "size") else "n/a",
+        pragmas,
+    )
+    return pragmas
+
+
+engine = create_db_engine()
+async_engine = create_async_db_engine()
+read_engines = [create_db_engine(url, read_only=True) for url in read_urls()]
+async_read_engines = [create_async_db_engine(to_async_url(url), read_only=True) for url in read_urls()]
 
 
 def create_tables():
-    SQLModel.metadata.create_all(engine)
+    # schema changes go through the versioned migrations so existing databases get new indexes too
+    from app.data.migrations import migrate
+    migrate(engine)
+
+
+# binds the connection a session begins on to the session's trace; covers AsyncSession through its sync session
+event.listen(OrmSession, "after_begin", query_trace.after_begin)
+
+
+class Intent(str, Enum):
+    READ = "read"
+    WRITE = "write"
+
+
+_next_reader = count()
+
+
+class RoutingSession(Session):
+    """Sends the SELECTs of a READ session to a read engine and everything else to the primary.
+
+    A session picks its reader on its first read and keeps it, so all its reads see one replica's
+    state. A session that has written (flushed, or executed an INSERT/UPDATE/DELETE) reads from the
+    primary from then on, so it sees its own writes whatever the replica lag. WRITE sessions, which
+    read the rows they are about to change, never touch a read engine.
+    """
+
+    def __init__(self, primary: Engine, readers: list[Engine] = (), intent: Intent = Intent.WRITE, **kwargs):
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.readers = list(readers)
+        self.intent = intent
+        self.wrote = False
+        self.reader: Engine | None = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or not isinstance(clause, Select):
+            # also tells the unit of work there is something to commit
+            self.wrote = True
+        elif self.intent is Intent.READ and self.readers and not self.wrote:
+            if self.reader is None:
+                self.reader = self.readers[next(_next_reader) % len(self.readers)]
+            return self.reader
+        return self.primary
 
 
 @contextmanager
-def get_session():
-    session = Session(engine)
+def session_scope(intent: Intent = Intent.WRITE):
+    session = RoutingSession(engine, read_engines, intent)
+    trace = query_trace.start_session_trace(session)
     try:
         yield session
     finally:
         session.close()
+        if trace is not None:
+            query_trace.report(trace)
+
+
+@asynccontextmanager
+async def async_session_scope(intent: Intent = Intent.WRITE):
+    # expire_on_commit=False: attributes stay loaded after commit, no lazy IO outside an await
+    async with AsyncSession(
+        sync_session_class=RoutingSession, primary=async_engine.sync_engine,
+        readers=[reader.sync_engine for reader in async_read_engines], intent=intent, expire_on_commit=False,
+    ) as session:
+        trace = query_trace.start_session_trace(session.sync_session)
+        try:
+            yield session
+        finally:
+            if trace is not None:
+                query_trace.report(trace)
+
+
+def get_session():
+    # primary only; routes take theirs from app.api.dependencies, which routes by the request
+    with session_scope() as session:
+        yield session
+
+
+async def get_async_session():
+    async with async_session_scope() as session:
+        yield session
@@ -0,0 +1,253 @@
+"""Append-only trail of grade changes (`grade_audit`), written behind the requests that make them.
+
+A grade write only builds a `GradeChange` and, once its transaction has committed, puts it on an
+in-process queue: the request never waits on an audit INSERT. One writer thread per process takes
+changes off the queue and inserts them in batches, when `GRADE_AUDIT_BATCH_SIZE` changes are
+waiting or `GRADE_AUDIT_FLUSH_INTERVAL` seconds after the oldest one arrived, whichever is first.
+
+Nothing is dropped: a batch the database refuses, and whatever is still queued or being written
+when the process stops, is appended (and fsynced) to an NDJSON spool file in `GRADE_AUDIT_SPOOL_DIR`,
+which the writer inserts on its next start. Being written behind, the trail lags the grades by up to the
+flush interval.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from glob import glob
+from itertools import islice
+from typing import Iterable, Iterator
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+from app import metrics
+from app.data.database import engine
+from app.data.models import GRADE_SUBJECTS, GradeAudit
+from app.data.table_versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+GRADE_AUDIT_BATCH_SIZE = int(os.getenv("GRADE_AUDIT_BATCH_SIZE", "500"))
+GRADE_AUDIT_FLUSH_INTERVAL = float(os.getenv("GRADE_AUDIT_FLUSH_INTERVAL", "1.0"))  # seconds
+GRADE_AUDIT_SPOOL_DIR = os.getenv("GRADE_AUDIT_SPOOL_DIR", "grade_audit_spool")
+
+OLD_COLUMNS = tuple(f"old_{subject}" for subject in GRADE_SUBJECTS)
+NEW_COLUMNS = tuple(f"new_{subject}" for subject in GRADE_SUBJECTS)
+
+Marks = tuple[int, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class GradeChange:
+    student_id: int
+    old: Marks | None  # None when the change created the grade
+    new: Marks | None  # None when the change deleted the grade
+    instructor_id: int | None
+    changed_at: datetime
+
+    def row(self) -> dict:
+        row = {"student_id": self.student_id, "instructor_id": self.instructor_id, "changed_at": self.changed_at}
+        row.update(zip(OLD_COLUMNS, self.old or (None,) * len(OLD_COLUMNS)))
+        row.update(zip(NEW_COLUMNS, self.new or (None,) * len(NEW_COLUMNS)))
+        return row
+
+    def to_json(self) -> str:
+        return json.dumps([self.student_id, self.old, self.new, self.instructor_id, self.changed_at.isoformat()])
+
+    @classmethod
+    def from_json(cls, line: str) -> "GradeChange":
+        student_id, old, new, instructor_id, changed_at = json.loads(line)
+        return cls(student_id, tuple(old) if old else None, tuple(new) if new else None, instructor_id, datetime.fromisoformat(changed_at))
+
+
+def marks(grade) -> Marks:
+    """The subject marks of a grade (model, schema or row object), in GRADE_SUBJECTS order."""
+    return tuple(getattr(grade, subject) for subject in GRADE_SUBJECTS)
+
+
+def grade_change(student_id: int, old: Marks | None, new: Marks | None, instructor_id: int | None = None) -> GradeChange | None:
+    """The change to record for a grade write, None when it left the marks as they were."""
+    if old == new:
+        return None
+    return GradeChange(student_id, old, new, instructor_id, datetime.now())
+
+
+def _chunks(changes: Iterable[GradeChange], size: int) -> Iterator[list[GradeChange]]:
+    changes = iter(changes)
+    while chunk := list(islice(changes, size)):
+        yield chunk
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class _Abandoned(Exception):
+    """The batch being written was spooled by `stop` meanwhile, its transaction must not commit."""
+
+
+class AuditWriter:
+    """The queue and the background thread that drains it into `grade_audit`."""
+
+    def __init__(self, db_engine: Engine, batch_size: int = GRADE_AUDIT_BATCH_SIZE,
+                 flush_interval: float = GRADE_AUDIT_FLUSH_INTERVAL, spool_dir: str = GRADE_AUDIT_SPOOL_DIR):
+        self.db_engine = db_engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        # the batch `_write` is inserting; whoever takes it under the lock (the commit or `stop`) owns it
+        self._inflight: list[GradeChange] | None = None
+
+    def record(self, change: GradeChange):
+        # an unbounded queue put: never blocks the request, never touches the database
+        self._queue.put(change)
+
+    def record_many(self, changes: Iterable[GradeChange]):
+        for change in changes:
+            self._queue.put(change)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="grade-audit-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Write what is queued; what can't be written within `timeout` goes to the spool."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        # not started, or stuck on a locked database: keep the batch it is writing and the rest on disk
+        # for the next start. The stuck thread rolls its insert back once it gets that far
+        leftover = [item for item in self._drain() if isinstance(item, GradeChange)]
+        inflight = self._take_inflight()
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+        if inflight or leftover:
+            self._spool((inflight or []) + leftover)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until everything recorded so far has been written (or spooled)."""
+        with self._lock:
+            running = self._thread is not None
+        if not running:
+            self._write([item for item in self._drain() if isinstance(item, GradeChange)])
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def _drain(self) -> list:
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _run(self):
+        self.replay_spool()
+        batch: list[GradeChange] = []
+        deadline = 0.0
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()) if batch else None)
+            except queue.Empty:
+                item = None  # the oldest change waited flush_interval
+            if isinstance(item, GradeChange):
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+            if batch:
+                self._write(batch)
+                batch = []
+            if isinstance(item, _Flush):
+                item.done.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, changes: list[GradeChange]):
+        if not changes:
+            return
+        started = time.perf_counter()
+        with self._lock:
+            self._inflight = changes
+        owned = False
+        try:
+            with self.db_engine.begin() as connection:
+                connection.execute(insert(GradeAudit), [change.row() for change in changes])
+                connection.execute(bump_versions("grade_audit"))
+                owned = self._take_inflight() is not None
+                if not owned:
+                    raise _Abandoned()
+        except _Abandoned:
+            return
+        except Exception:
+            logger.exception("Could not write %d grade changes, spooling them", len(changes))
+            if owned or self._take_inflight() is not None:
+                self._spool(changes)
+            return
+        metrics.grade_audit_flush_duration.observe(time.perf_counter() - started)
+        metrics.grade_audit_events.inc("database", amount=len(changes))
+
+    def _take_inflight(self) -> list[GradeChange] | None:
+        with self._lock:
+            inflight, self._inflight = self._inflight, None
+        return inflight
+
+    def _spool(self, changes: list[GradeChange]):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"grade_audit.{os.getpid()}.ndjson")
+        with open(path, "a", encoding="utf-8") as spool:
+            spool.writelines(change.to_json() + "\n" for change in changes)
+            spool.flush()
+            os.fsync(spool.fileno())
+        metrics.grade_audit_events.inc("spool", amount=len(changes))
+        logger.warning("Spooled %d grade changes to %s", len(changes), path)
+
+    def replay_spool(self) -> int:
+        """Insert the changes spooled by earlier runs, returns how many."""
+        replayed = 0
+        for path in sorted(glob(os.path.join(self.spool_dir, "grade_audit.*.ndjson"))):
+            # claimed by renaming, so that another worker starting at the same time skips it
+            claimed = f"{path}.{os.getpid()}.replay"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, encoding="utf-8") as spool:
+                changes = [GradeChange.from_json(line) for line in spool if line.strip()]
+            try:
+                with self.db_engine.begin() as connection:
+                    for chunk in _chunks(changes, self.batch_size):
+                        connection.execute(insert(GradeAudit), [change.row() for change in chunk])
+                    connection.execute(bump_versions("grade_audit"))
+            except Exception:
+                logger.exception("Could not replay the grade changes spooled in %s", path)
+                os.rename(claimed, path)
+                continue
+            os.remove(claimed)
+            replayed += len(changes)
+        if replayed:
+            metrics.grade_audit_events.inc("database", amount=replayed)
+            logger.info("Replayed %d spooled grade changes", replayed)
+        return replayed
+
+
+audit_writer = AuditWriter(engine)
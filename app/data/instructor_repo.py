@@ -1,14 +1,114 @@
 from abc import ABC, abstractmethod
-from typing import Sequence
+from typing import AsyncIterator, Callable, Iterable, Iterator, Sequence
 
 from fastapi import HTTPException, status
-from sqlalchemy import delete
-from sqlmodel import Session, desc, select
+from sqlalchemy import delete, update
+# projections go through sqlalchemy's select: sqlmodel's turns a one-column select into bare scalars
+from sqlalchemy import select as select_columns
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, desc, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.data.models import Instructor, Student, Grade
+from app.data.models import GRADE_LIST_FIELDS, GRADE_SUBJECTS, PUBLIC_USER_FIELDS, GradeAudit, Instructor, Student, Grade
+from app.data.table_versions import bump_versions
+from app.data.unit_of_work import after_commit
 from app.data.schemas import CreateUserSchema, GradeSchema, UpdateUserSchema
+from app.domain import leaderboard
 from app.domain.exceptions import StudentNotFound
-from app.domain.student_service import get_my_grades
+
+# rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+
+def _instructor_row_query(fields: Sequence[str] = PUBLIC_USER_FIELDS):
+    # column tuples in `fields` order, like the student rows
+    return select_columns(*(getattr(Instructor, field) for field in fields))
+
+
+def _instructors_query(after_id: int | None = None, limit: int | None = None, fields: Sequence[str] = PUBLIC_USER_FIELDS):
+    query = _instructor_row_query(fields).order_by(Instructor.id)
+    if after_id is not None:
+        query = query.where(Instructor.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _update_instructor_query(instructor_id: int, data: UpdateUserSchema):
+    # the changed row comes back with the UPDATE: no SELECT before it, no refresh after.
+    # A field left None keeps its value, the columns are NOT NULL
+    values = data.model_dump(exclude_none=True)
+    if not values:
+        return select_columns(Instructor).where(Instructor.id == instructor_id)
+    return update(Instructor).where(Instructor.id == instructor_id).values(**values).returning(Instructor)
+
+
+def _delete_instructor_query(instructor_id: int):
+    return delete(Instructor).where(Instructor.id == instructor_id).returning(Instructor.id)
+
+
+def _grade_marks_query(student_ids: Iterable[int]):
+    return select_columns(Grade.student_id, *(getattr(Grade, subject) for subject in GRADE_SUBJECTS)).where(
+        Grade.student_id.in_(set(student_ids)))
+
+
+def _grade_history_query(student_id: int, limit: int):
+    return select(GradeAudit).where(GradeAudit.student_id == student_id).order_by(desc(GradeAudit.id)).limit(limit)
+
+
+def _update_grade_query(student_id: int, data: GradeSchema):
+    marks = {subject: getattr(data, subject) for subject in GRADE_SUBJECTS}
+    return update(Grade).where(Grade.student_id == student_id).values(**marks).returning(Grade)
+
+
+def score_expression(subject: str | None = None):
+    """Leaderboard score: one subject's mark, or the sum of all five (matches the ix_grade_total index)."""
+    if subject is not None:
+        return getattr(Grade, subject)
+    return Grade.pure_maths + Grade.chemistry + Grade.biology + Grade.computer_science + Grade.physics
+
+
+def _leaderboard_cutoff_query(n: int, subject: str | None = None):
+    # over the board's own join: a grade whose student is gone must not take a place
+    score = score_expression(subject)
+    return select(score).join(Student, Student.id == Grade.student_id).order_by(desc(score)).offset(n - 1).limit(1)
+
+
+def _leaderboard_query(cutoff: int | None, n: int, subject: str | None = None):
+    score = score_expression(subject)
+    query = (
+        select(Student.id, Student.userName, Student.firstName, Student.lastName, score.label("score"))
+        .join(Grade, Grade.student_id == Student.id)
+        .order_by(desc(score), Student.id)
+    )
+    if cutoff is None:
+        # fewer than n graded students, all of them are on the board
+        return query.limit(n)
+    return query.where(score >= cutoff).limit(leaderboard.MAX_BOARD_ROWS)
+
+
+# the column behind each GRADE_LIST_FIELDS entry
+_GRADE_LIST_COLUMNS = {
+    "id": Student.id,
+    "userName": Student.userName,
+    "firstName": Student.firstName,
+    "lastName": Student.lastName,
+    **{subject: getattr(Grade, subject) for subject in GRADE_SUBJECTS},
+}
+
+
+def _grades_query(after_id: int | None = None, limit: int | None = None, fields: Sequence[str] = GRADE_LIST_FIELDS):
+    query = (
+        select_columns(*(_GRADE_LIST_COLUMNS[field] for field in fields))
+        .select_from(Student)
+        .join(Grade, Student.id == Grade.student_id)  # Join grades with students
+        .order_by(Student.id)  # Ordering by student ID, also the keyset cursor
+    )
+    if after_id is not None:
+        query = query.where(Student.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
 
 class AbstractRepo(ABC):
@@ -19,7 +119,7 @@ class AbstractRepo(ABC):
     def get_instructor_by_id(self, instructor_id: int): ...
 
     @abstractmethod
-    def get_all_instructors(self): ...
+    def get_all_instructors(self, after_id: int | None = None, limit: int | None = None): ...
 
     @abstractmethod
     def update_instructor(self, instructor_id: int, data: UpdateUserSchema): ...
@@ -28,7 +128,7 @@ class AbstractRepo(ABC):
     def delete_instructor(self, instructor_id: int): ...
     
     @abstractmethod
-    def get_top_students(self): ...
+    def get_top_students(self, n: int = 5, subject: str | None = None): ...
     
     @abstractmethod
     def add_new_grade(self, student_id: int, data: GradeSchema): ...
@@ -46,14 +146,17 @@ class InstructorRepo(AbstractRepo):
     def __init__(self, session: Session):
         self._session = session
 
+    def after_commit(self, callback: Callable[[], None]):
+        after_commit(self._session, callback)
 
     def create_instructor(self, data: CreateUserSchema) -> Instructor:
         instructor = Instructor(**dict(data))
         if instructor.userRole == "Instructor":
             self._session.add(instructor)
-            self._session.commit()
-            self._session.refresh(instructor)
-        
+            # sends the INSERT, which hands back the id; the unit of work commits
+            self._session.flush()
+            self._session.exec(bump_versions("instructor"))
+
         return instructor
 
 
@@ -61,94 +164,87 @@ class InstructorRepo(AbstractRepo):
         return self._session.exec(select(Instructor).where(Instructor.id == instructor_id)).one_or_none()
 
 
-    def get_all_instructors(self) -> Sequence[Instructor]:
-            return self._session.exec(select(Instructor)).all()
+    def get_instructor_row(self, instructor_id: int, fields: Sequence[str] = PUBLIC_USER_FIELDS) -> tuple | None:
+        return self._session.exec(_instructor_row_query(fields).where(Instructor.id == instructor_id)).one_or_none()
+
+    def get_all_instructors(self, after_id: int | None = None, limit: int | None = None,
+                            fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Sequence[tuple]:
+        return self._session.exec(_instructors_query(after_id, limit, fields)).all()
+
+    def stream_all_instructors(self, after_id: int | None = None, fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Iterator[tuple]:
+        query = _instructors_query(after_id, fields=fields).execution_options(yield_per=STREAM_BATCH_SIZE)
+        yield from self._session.exec(query)
 
 
     def update_instructor(self, instructor_id: int, data: UpdateUserSchema):
-        instructor = self.get_instructor_by_id(instructor_id)
+        instructor = self._session.exec(_update_instructor_query(instructor_id, data)).scalar_one_or_none()
         if not instructor:
             return None
-        instructor.first_name = data.first_name
-        instructor.last_name = data.last_name
-        instructor.email = data.email
-        instructor.date_of_birth = data.date_of_birth
-
-        self._session.add(instructor)
-        self._session.commit()
-        self._session.refresh(instructor)
+        self._session.exec(bump_versions("instructor"))
         return instructor
 
 
     def delete_instructor(self, instructor_id: int) -> bool:
-        instructor = self._session.exec(select(Instructor).where(Instructor.id == instructor_id)).one_or_none()
-        if not instructor:
+        if self._session.exec(_delete_instructor_query(instructor_id)).first() is None:
             return False
-        self._session.delete(instructor)
-        self._session.commit()
+        self._session.exec(bump_versions("instructor"))
         return True
 
 
-    def get_top_students(self, session: Session):
-        # Build the query using SQLModel's select
-        query = (
-            select(
-                Student.id,
-                Student.userName,
-                Student.firstName,
-                Student.lastName,
-                (
-                    (Grade.pure_maths + Grade.chemistry + Grade.biology + Grade.computer_science + Grade.physics) / 5.0
-                ).label('average_marks')
-            )
-            .join(Grade, Grade.student_id == Student.id)
-            .order_by(desc('average_marks'))
-            .limit(5)
-        )
-        
-        # Execute the query and return the result
-        top_students = session.exec(query).all()
-        return top_students
+    def get_top_students(self, n: int = 5, subject: str | None = None):
+        # two index walks: find the n-th best score, then every row at or above it (keeps ties at the cutoff)
+        cutoff = self._session.exec(_leaderboard_cutoff_query(n, subject)).first()
+        return self._session.exec(_leaderboard_query(cutoff, n, subject)).all()
 
     def add_new_grade(self, data: GradeSchema) -> Grade:
         grade = Grade(**dict(data))
         
         self._session.add(grade)
-        self._session.commit()
-        self._session.refresh(grade)
-        
+        self._session.flush()
+        self._session.exec(bump_versions("grade"))
+
         return grade
     
     def update_grade(self, student_id: int, data: GradeSchema)-> Grade:
-        grade = get_my_grades(student_id)
+        grade = self._session.exec(_update_grade_query(student_id, data)).scalar_one_or_none()
         if not grade:
             return None
-        
-        grade.student_id = student_id
-        grade.pure_maths = data.pure_maths
-        grade.chemistry = data.chemistry
-        grade.biology = data.biology
-        grade.computer_science = data.computer_science
-        grade.physics = data.physics
-        
-        return grade 
-
-
-    def view_grades(self, session: Session):
-        query = session.exec(
-            select(
-                Student.id,
-                Student.userName,
-                Student.firstName,
-                Student.lastName,
-                Grade.pure_maths,
-                Grade.chemistry,
-                Grade.biology,
-                Grade.computer_science,
-                Grade.physics
-            ).join(Grade, Student.id == Grade.student_id)  # Join grades with students
-            .order_by(Student.id)  # Ordering by student ID
+        self._session.exec(bump_versions("grade"))
+        return grade
+
+
+    def get_grade_marks(self, student_ids: Iterable[int]) -> dict[int, tuple[int, ...]]:
+        """Current marks (GRADE_SUBJECTS order) of the students that have a grade, by student id."""
+        return {row[0]: tuple(row[1:]) for row in self._session.exec(_grade_marks_query(student_ids))}
+
+    def count_grades(self) -> int:
+        return self._session.exec(select(func.count()).select_from(Grade)).one()
+
+    def get_grade_history(self, student_id: int, limit: int) -> Sequence[GradeAudit]:
+        return self._session.exec(_grade_history_query(student_id, limit)).all()
+
+    def existing_student_ids(self, student_ids: Iterable[int]) -> set[int]:
+        return set(self._session.exec(select(Student.id).where(Student.id.in_(set(student_ids)))).all())
+
+    def upsert_grades(self, batches: Iterable[list[dict]]) -> int:
+        """Insert-or-update grade rows batch by batch (executemany); the unit of work commits them all at once."""
+        statement = sqlite_insert(Grade)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Grade.student_id],
+            set_={subject: statement.excluded[subject] for subject in GRADE_SUBJECTS},
         )
+        connection = self._session.connection()
+        written = 0
+        for batch in batches:
+            if batch:
+                connection.execute(statement, batch)
+                written += len(batch)
+        self._session.exec(bump_versions("grade"))
+        return written
+
+    def view_grades(self, session: Session, after_id: int | None = None, limit: int | None = None,
+                    fields: Sequence[str] = GRADE_LIST_FIELDS):
+        query = session.exec(_grades_query(after_id, limit, fields))
         
         # Execute the query and return the result
         all_grades = query.all()
@@ -160,4 +256,80 @@ class InstructorRepo(AbstractRepo):
                 detail="No Records Found"  # Correct key is `detail`
             )
         
-        return all_grades
\ No newline at end of file
+        return all_grades
+
+
+class AsyncInstructorRepo(AbstractRepo):
+    """Same queries as `InstructorRepo`, awaited on an `AsyncSession` so they don't block the event loop."""
+
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    def after_commit(self, callback: Callable[[], None]):
+        after_commit(self._session.sync_session, callback)
+
+    async def create_instructor(self, data: CreateUserSchema) -> Instructor:
+        instructor = Instructor(**dict(data))
+        if instructor.userRole == "Instructor":
+            self._session.add(instructor)
+            await self._session.flush()
+            await self._session.exec(bump_versions("instructor"))
+
+        return instructor
+
+    async def get_instructor_by_id(self, instructor_id: int) -> Instructor | None:
+        result = await self._session.exec(select(Instructor).where(Instructor.id == instructor_id))
+        return result.one_or_none()
+
+    async def get_all_instructors(self, after_id: int | None = None, limit: int | None = None,
+                                  fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Sequence[tuple]:
+        result = await self._session.exec(_instructors_query(after_id, limit, fields))
+        return result.all()
+
+    async def update_instructor(self, instructor_id: int, data: UpdateUserSchema):
+        instructor = (await self._session.exec(_update_instructor_query(instructor_id, data))).scalar_one_or_none()
+        if not instructor:
+            return None
+        await self._session.exec(bump_versions("instructor"))
+        return instructor
+
+    async def delete_instructor(self, instructor_id: int) -> bool:
+        if (await self._session.exec(_delete_instructor_query(instructor_id))).first() is None:
+            return False
+        await self._session.exec(bump_versions("instructor"))
+        return True
+
+    async def get_top_students(self, n: int = 5, subject: str | None = None):
+        cutoff = (await self._session.exec(_leaderboard_cutoff_query(n, subject))).first()
+        result = await self._session.exec(_leaderboard_query(cutoff, n, subject))
+        return result.all()
+
+    async def add_new_grade(self, data: GradeSchema) -> Grade:
+        grade = Grade(**dict(data))
+
+        self._session.add(grade)
+        await self._session.flush()
+        await self._session.exec(bump_versions("grade"))
+
+        return grade
+
+    async def update_grade(self, student_id: int, data: GradeSchema) -> Grade | None:
+        grade = (await self._session.exec(_update_grade_query(student_id, data))).scalar_one_or_none()
+        if not grade:
+            return None
+        await self._session.exec(bump_versions("grade"))
+        return grade
+
+    async def get_grade_marks(self, student_ids: Iterable[int]) -> dict[int, tuple[int, ...]]:
+        result = await self._session.exec(_grade_marks_query(student_ids))
+        return {row[0]: tuple(row[1:]) for row in result}
+
+    async def view_grades(self, after_id: int | None = None, limit: int | None = None, fields: Sequence[str] = GRADE_LIST_FIELDS):
+        result = await self._session.exec(_grades_query(after_id, limit, fields))
+        return result.all()
+
+    async def stream_grades(self, after_id: int | None = None, fields: Sequence[str] = GRADE_LIST_FIELDS) -> AsyncIterator:
+        query = _grades_query(after_id, fields=fields).execution_options(yield_per=STREAM_BATCH_SIZE)
+        result = await self._session.stream(query)
+        async for row in result:
+            yield row
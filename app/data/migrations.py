@@ -0,0 +1,250 @@
+"""Versioned schema migrations for the SQLite database.
+
+The schema version lives in `PRAGMA user_version`, so checking whether a database is current is a
+single header read. Every migration is explicit, idempotent DDL (IF NOT EXISTS) frozen at the time it
+was written, never the current models, so a fresh database and an old `school.db` that catches up step
+by step end up with the same schema.
+
+Run pending migrations with `python -m app.data.migrations`.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import Connection
+from sqlalchemy.engine import Engine
+
+from app.data import models
+
+logger = logging.getLogger(__name__)
+
+# opt-in for migration 2 to delete duplicate grade rows, keeping the newest per student; by default it aborts
+MIGRATE_DEDUPLICATE_GRADES = os.getenv("MIGRATE_DEDUPLICATE_GRADES", "").lower() in ("1", "true", "yes")
+# duplicate student ids listed in the abort message
+REPORTED_DUPLICATES = 20
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _execute(connection: Connection, *statements: str):
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def _user_table(table: str) -> tuple[str, ...]:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (created_at DATETIME NOT NULL, last_updated DATETIME NOT NULL, "
+        'id INTEGER NOT NULL, "userName" VARCHAR NOT NULL, "firstName" VARCHAR NOT NULL, "lastName" VARCHAR NOT NULL, '
+        'email VARCHAR NOT NULL, "dateOfBirth" DATE NOT NULL, hashed_password VARCHAR NOT NULL, '
+        '"userRole" VARCHAR NOT NULL, PRIMARY KEY (id), UNIQUE (email))',
+        f'CREATE UNIQUE INDEX IF NOT EXISTS "ix_{table}_userName" ON {table} ("userName")',
+    )
+
+
+def _initial_schema(connection: Connection):
+    _execute(
+        connection,
+        *_user_table("student"),
+        *_user_table("instructor"),
+        "CREATE TABLE IF NOT EXISTS grade (id INTEGER NOT NULL, student_id INTEGER NOT NULL, "
+        "pure_maths INTEGER NOT NULL, chemistry INTEGER NOT NULL, biology INTEGER NOT NULL, "
+        "computer_science INTEGER NOT NULL, physics INTEGER NOT NULL, PRIMARY KEY (id), "
+        "FOREIGN KEY(student_id) REFERENCES student (id))",
+    )
+
+
+def _unique_grade_student_id(connection: Connection):
+    # one grade row per student. Older databases may have accumulated duplicates: those are grade data,
+    # so the migration stops and names them unless MIGRATE_DEDUPLICATE_GRADES allows dropping the older rows
+    duplicates = connection.exec_driver_sql(
+        "SELECT student_id, COUNT(*) FROM grade GROUP BY student_id HAVING COUNT(*) > 1 ORDER BY student_id"
+    ).all()
+    if duplicates:
+        extra = sum(count - 1 for _, count in duplicates)
+        student_ids = ", ".join(str(student_id) for student_id, _ in duplicates[:REPORTED_DUPLICATES])
+        if len(duplicates) > REPORTED_DUPLICATES:
+            student_ids += ", ..."
+        if not MIGRATE_DEDUPLICATE_GRADES:
+            raise MigrationError(
+                f"grade has {extra} duplicate rows for {len(duplicates)} students (student_id {student_ids}); "
+                "resolve them, or set MIGRATE_DEDUPLICATE_GRADES=1 to keep the newest row per student "
+                "(the others are copied to grade_duplicate)"
+            )
+        _execute(
+            connection,
+            "CREATE TABLE IF NOT EXISTS grade_duplicate AS SELECT * FROM grade WHERE 0",
+            "INSERT INTO grade_duplicate SELECT * FROM grade WHERE id NOT IN (SELECT MAX(id) FROM grade GROUP BY student_id)",
+            "DELETE FROM grade WHERE id NOT IN (SELECT MAX(id) FROM grade GROUP BY student_id)",
+        )
+        logger.warning("Removed %d duplicate grade rows of %d students (student_id %s), copied to grade_duplicate",
+                       extra, len(duplicates), student_ids)
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_grade_student_id")
+    connection.exec_driver_sql("CREATE UNIQUE INDEX ix_grade_student_id ON grade (student_id)")
+
+
+def _leaderboard_indexes(connection: Connection):
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_grade_total "
+        "ON grade ((pure_maths + chemistry + biology + computer_science + physics))"
+    )
+    for subject in models.GRADE_SUBJECTS:
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_grade_{subject} ON grade ({subject})")
+
+
+def _last_updated_indexes(connection: Connection):
+    for table in ("student", "instructor"):
+        connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_last_updated ON {table} (last_updated)")
+
+
+def _table_versions(connection: Connection):
+    # one counter per table, bumped by the repo write methods in the same transaction as the write
+    connection.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS table_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"
+    )
+    _version_counters(connection, "student", "instructor", "grade")
+
+
+def _version_counters(connection: Connection, *tables: str):
+    for table in tables:
+        connection.exec_driver_sql("INSERT OR IGNORE INTO table_version (name, version) VALUES (?, 0)", (table,))
+
+
+def _student_search(connection: Connection):
+    # external-content FTS5 index over the student columns, kept in sync by triggers so that every
+    # writer (repos, bulk provisioning, sqlite3 scripts) updates it in the writing transaction
+    columns = ", ".join(f'"{column}"' for column in models.STUDENT_SEARCH_FIELDS)
+    new = ", ".join(f'new."{column}"' for column in models.STUDENT_SEARCH_FIELDS)
+    old = ", ".join(f'old."{column}"' for column in models.STUDENT_SEARCH_FIELDS)
+    connection.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS student_search USING fts5({columns}, content='student', "
+        "content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS student_search_insert AFTER INSERT ON student BEGIN "
+        f"INSERT INTO student_search (rowid, {columns}) VALUES (new.id, {new}); END"
+    )
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS student_search_delete AFTER DELETE ON student BEGIN "
+        f"INSERT INTO student_search (student_search, rowid, {columns}) VALUES ('delete', old.id, {old}); END"
+    )
+    connection.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS student_search_update AFTER UPDATE OF {columns} ON student BEGIN "
+        f"INSERT INTO student_search (student_search, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO student_search (rowid, {columns}) VALUES (new.id, {new}); END"
+    )
+    # matches on userName weigh the most, e-mail the least
+    weights = ", ".join(str(weight) for weight in models.STUDENT_SEARCH_WEIGHTS)
+    connection.exec_driver_sql(f"INSERT INTO student_search (student_search, rank) VALUES ('rank', 'bm25({weights})')")
+    # index the students that existed before the triggers
+    connection.exec_driver_sql("INSERT INTO student_search (student_search) VALUES ('rebuild')")
+
+
+def _refresh_tokens(connection: Connection):
+    _execute(
+        connection,
+        "CREATE TABLE IF NOT EXISTS refresh_token (family INTEGER NOT NULL, token_hash BLOB NOT NULL, previous_hash BLOB, "
+        "role VARCHAR NOT NULL, user_id INTEGER NOT NULL, user_name VARCHAR NOT NULL, user_created_at DATETIME NOT NULL, "
+        "expires_at INTEGER NOT NULL, PRIMARY KEY (family))",
+        "CREATE INDEX IF NOT EXISTS ix_refresh_token_user ON refresh_token (role, user_id)",
+    )
+
+
+def _grade_audit(connection: Connection):
+    _execute(
+        connection,
+        "CREATE TABLE IF NOT EXISTS grade_audit (id INTEGER NOT NULL, student_id INTEGER NOT NULL, "
+        "instructor_id INTEGER, changed_at DATETIME NOT NULL, old_pure_maths INTEGER, old_chemistry INTEGER, "
+        "old_biology INTEGER, old_computer_science INTEGER, old_physics INTEGER, new_pure_maths INTEGER, "
+        "new_chemistry INTEGER, new_biology INTEGER, new_computer_science INTEGER, new_physics INTEGER, PRIMARY KEY (id))",
+        "CREATE INDEX IF NOT EXISTS ix_grade_audit_student ON grade_audit (student_id, id)",
+    )
+
+
+def _report_jobs(connection: Connection):
+    _execute(
+        connection,
+        "CREATE TABLE IF NOT EXISTS report_job (id INTEGER NOT NULL, kind VARCHAR NOT NULL, params VARCHAR NOT NULL, "
+        "status VARCHAR NOT NULL, progress INTEGER NOT NULL, total INTEGER, result_path VARCHAR, error VARCHAR, "
+        "instructor_id INTEGER, created_at DATETIME NOT NULL, started_at DATETIME, finished_at DATETIME, "
+        "PRIMARY KEY (id))",
+        "CREATE INDEX IF NOT EXISTS ix_report_job_status ON report_job (status, id)",
+    )
+
+
+def _writer_table_versions(connection: Connection):
+    # the tables written on logins, audit flushes and job progress get counters of their own, so that
+    # their commits are not taken for writes from outside the app
+    _version_counters(connection, "refresh_token", "grade_audit", "report_job")
+
+
+def _report_job_heartbeat(connection: Connection):
+    columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(report_job)")]
+    if "heartbeat_at" not in columns:
+        connection.exec_driver_sql("ALTER TABLE report_job ADD COLUMN heartbeat_at DATETIME")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "initial schema", _initial_schema),
+    Migration(2, "unique index on grade.student_id", _unique_grade_student_id),
+    Migration(3, "leaderboard score and subject indexes", _leaderboard_indexes),
+    Migration(4, "last_updated indexes for sync queries", _last_updated_indexes),
+    Migration(5, "per-table version counters for the response cache", _table_versions),
+    Migration(6, "full-text search index over students", _student_search),
+    Migration(7, "refresh tokens", _refresh_tokens),
+    Migration(8, "grade change audit trail", _grade_audit),
+    Migration(9, "background report jobs", _report_jobs),
+    Migration(10, "version counters for the token, audit and job tables", _writer_table_versions),
+    Migration(11, "report job heartbeats", _report_job_heartbeat),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(db_engine: Engine) -> int:
+    """Apply every migration newer than the database's version, returns the resulting version.
+
+    Each migration and its `user_version` bump are one explicit transaction: pysqlite left to itself
+    commits before DDL, so a crash could leave a migration half applied under the old version.
+    """
+    with db_engine.connect() as connection:
+        # the driver's implicit transaction handling off, the BEGIN / COMMIT below are the only ones
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        version = get_schema_version(connection)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            # IMMEDIATE: another process migrating at the same time waits, then finds the version moved
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                version = get_schema_version(connection)
+                if migration.version > version:
+                    logger.info("Applying migration %s: %s", migration.version, migration.description)
+                    migration.upgrade(connection)
+                    connection.exec_driver_sql(f"PRAGMA user_version = {migration.version}")
+                    version = migration.version
+                connection.exec_driver_sql("COMMIT")
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+    return version
+
+
+if __name__ == "__main__":
+    from app.data.database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"schema version {migrate(engine)}")
@@ -1,10 +1,13 @@
+from enum import Enum
+
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field
 from datetime import date, datetime
 
 
 class User_BaseModel(SQLModel):
     created_at: datetime = Field(default_factory=datetime.now)
-    last_updated: datetime = Field(default_factory=datetime.now)
+    last_updated: datetime = Field(default_factory=datetime.now, index=True)
     id: int | None = Field(default=None, primary_key=True)
     userName: str = Field(index=True, nullable=False, unique=True)
     firstName: str = Field(nullable=False)
@@ -14,19 +17,107 @@ class User_BaseModel(SQLModel):
     hashed_password: str
 
 
+# what the API returns for a user, in response order; hashed_password is never part of it
+PUBLIC_USER_FIELDS = ("created_at", "last_updated", "id", "userName", "firstName", "lastName", "email", "dateOfBirth", "userRole")
+
+
 class Student(User_BaseModel, table=True):
     userRole: str = "Student"
 
 
+# columns of the student_search full-text index (migration 6), and their bm25 weights
+STUDENT_SEARCH_FIELDS = ("userName", "firstName", "lastName", "email")
+STUDENT_SEARCH_WEIGHTS = (4.0, 2.0, 2.0, 1.0)
+
+
+GRADE_SUBJECTS = ("pure_maths", "chemistry", "biology", "computer_science", "physics")
+# a grade row, and a row of the all-grades list (student columns joined with the marks)
+GRADE_FIELDS = ("id", "student_id", *GRADE_SUBJECTS)
+GRADE_LIST_FIELDS = ("id", "userName", "firstName", "lastName", *GRADE_SUBJECTS)
+
+
 class Grade(SQLModel, table=True):
+    # The leaderboard orders by the summed marks; SQLite keeps this expression index current on every
+    # insert/update, so top-N is an index walk instead of a full scan and sort. Keep the expression
+    # in sync with instructor_repo.score_expression, the planner only uses it on an exact match.
+    __table_args__ = (
+        Index("ix_grade_total", text("(pure_maths + chemistry + biology + computer_science + physics)")),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
-    student_id: int = Field(nullable=False, foreign_key="Student.id")
-    pure_maths: int = Field(nullable=False, ge=0, le=20)
-    chemistry: int = Field(nullable=False, ge=0, le=20)
-    biology: int = Field(nullable=False, ge=0, le=20)
-    computer_science: int = Field(nullable=False, ge=0, le=20)
-    physics: int = Field(nullable=False, ge=0, le=20)
+    student_id: int = Field(nullable=False, foreign_key="student.id", unique=True, index=True)
+    pure_maths: int = Field(nullable=False, ge=0, le=20, index=True)
+    chemistry: int = Field(nullable=False, ge=0, le=20, index=True)
+    biology: int = Field(nullable=False, ge=0, le=20, index=True)
+    computer_science: int = Field(nullable=False, ge=0, le=20, index=True)
+    physics: int = Field(nullable=False, ge=0, le=20, index=True)
 
 
 class Instructor(User_BaseModel, table=True):
     userRole: str = "Instructor"
+
+
+class GradeAudit(SQLModel, table=True):
+    # append-only, one row per grade change; written in batches behind the requests (app.data.grade_audit)
+    __tablename__ = "grade_audit"
+    __table_args__ = (Index("ix_grade_audit_student", "student_id", "id"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    student_id: int = Field(nullable=False)  # no foreign key: the trail outlives the student and the grade
+    instructor_id: int | None = None  # None for changes made outside a request
+    changed_at: datetime = Field(nullable=False)
+    # the marks before the change, all None when the change created the grade
+    old_pure_maths: int | None = None
+    old_chemistry: int | None = None
+    old_biology: int | None = None
+    old_computer_science: int | None = None
+    old_physics: int | None = None
+    # the marks after it, all None when the change deleted the grade (with its student)
+    new_pure_maths: int | None = None
+    new_chemistry: int | None = None
+    new_biology: int | None = None
+    new_computer_science: int | None = None
+    new_physics: int | None = None
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ReportJob(SQLModel, table=True):
+    # a background report (app.domain.report_jobs): the row is both the queue entry and what GET /api/jobs/{id} polls
+    __tablename__ = "report_job"
+    __table_args__ = (Index("ix_report_job_status", "status", "id"),)
+
+    id: int | None = Field(default=None, primary_key=True)
+    kind: str = Field(nullable=False)
+    params: str = Field(default="{}", nullable=False)  # JSON of the report options
+    status: str = Field(default=JobStatus.QUEUED.value, nullable=False)
+    progress: int = Field(default=0, nullable=False)  # rows written so far
+    total: int | None = None  # rows the report will hold, once known
+    result_path: str | None = None
+    error: str | None = None
+    instructor_id: int | None = None
+    created_at: datetime = Field(default_factory=datetime.now, nullable=False)
+    started_at: datetime | None = None
+    heartbeat_at: datetime | None = None  # the running job's last sign of life, its claim or latest progress
+    finished_at: datetime | None = None
+
+
+class RefreshToken(SQLModel, table=True):
+    # one row per login: rotation replaces the hash in place, so a session costs one small row however often it refreshes
+    __tablename__ = "refresh_token"
+    __table_args__ = (Index("ix_refresh_token_user", "role", "user_id"),)
+
+    family: int = Field(primary_key=True)  # random id shared by every token a login rotates through
+    token_hash: bytes = Field(nullable=False)  # SHA-256 of the current token's secret, the token is never stored
+    previous_hash: bytes | None = None  # the token rotated away last: presenting it again means a copy is in use
+    role: str = Field(nullable=False)
+    user_id: int = Field(nullable=False)
+    # who logged in: a deleted user's id can be given to the next user, a user name with its creation time can't
+    user_name: str = Field(nullable=False)
+    user_created_at: datetime = Field(nullable=False)
+    expires_at: int = Field(nullable=False)  # unix seconds
@@ -0,0 +1,17 @@
+from typing import Any
+
+from sqlalchemy import Connection
+
+
+def explain_query_plan(connection: Connection, statement: str, parameters: Any = ()) -> list[str]:
+    """Return the `detail` column of SQLite's EXPLAIN QUERY PLAN for a raw DBAPI statement."""
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    """Plan steps that read a whole table. An ordered walk over an index ("SCAN x USING INDEX") is fine."""
+    return [
+        step for step in plan
+        if step.startswith("SCAN ") and " USING " not in step
+    ]
@@ -0,0 +1,159 @@
+"""Opt-in SQL tracing: every statement a request runs, N+1 suspects and a slow-query log.
+
+Enabled with SQL_TRACE=1. The engine hooks (see `app.data.database._instrument`) feed the trace
+that is active for the request, or for the session when there is no request. At the end of a
+trace, statement shapes that ran SQL_N_PLUS_ONE_THRESHOLD times or more are reported as N+1
+suspects. Independently, any statement slower than SQL_SLOW_QUERY_MS is written to the slow-query
+log together with its EXPLAIN QUERY PLAN. Parameters are never logged.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from app.data.query_plans import full_scans
+
+SQL_TRACE = os.getenv("SQL_TRACE", "0").lower() in ("1", "true", "yes")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "3"))
+SQL_TRACE_MAX_STATEMENTS = int(os.getenv("SQL_TRACE_MAX_STATEMENTS", "1000"))
+# file the slow-query log is appended to; unset leaves it to the logging configuration
+SQL_SLOW_QUERY_LOG = os.getenv("SQL_SLOW_QUERY_LOG")
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(__name__ + ".slow")
+
+if SQL_TRACE and SQL_SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SQL_SLOW_QUERY_LOG)
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_logger.addHandler(_handler)
+    slow_query_logger.setLevel(logging.INFO)
+
+# the session's trace, copied onto the pooled connection it runs on, dropped again at checkin
+TRACE_KEY = "query_trace"
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with literals and expanded IN lists folded, so that repeats compare equal."""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+@dataclass
+class TracedStatement:
+    shape: str
+    seconds: float
+
+
+@dataclass
+class QueryTrace:
+    label: str
+    statements: list[TracedStatement] = field(default_factory=list)
+    shapes: Counter = field(default_factory=Counter)
+    count: int = 0
+    seconds: float = 0.0
+
+    def add(self, statement: str, seconds: float):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[shape] += 1
+        if len(self.statements) < SQL_TRACE_MAX_STATEMENTS:
+            self.statements.append(TracedStatement(shape, seconds))
+
+    def repeated(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """Statement shapes that ran `threshold` times or more, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+# set per request by QueryTraceMiddleware; thread pool workers get a copy of the context, the object is shared
+current_trace: ContextVar[QueryTrace | None] = ContextVar("current_trace", default=None)
+
+
+def report(trace: QueryTrace):
+    for shape, count in trace.repeated():
+        logger.warning("Possible N+1 in %s: %d x %s", trace.label, count, shape)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "%s ran %d statements in %.1f ms:\n  %s", trace.label, trace.count, trace.seconds * 1000,
+            "\n  ".join(f"{statement.seconds * 1000:8.2f} ms  {statement.shape}" for statement in trace.statements),
+        )
+
+
+def start_session_trace(session) -> QueryTrace | None:
+    """Attach the active trace to `session`, or a trace of its own when no request is being traced.
+
+    Returns the trace the caller owns and must `report`, i.e. None when the session joined a request.
+    """
+    if not SQL_TRACE:
+        return None
+    trace = current_trace.get()
+    owned = trace is None
+    if owned:
+        trace = QueryTrace("session")
+    session.info[TRACE_KEY] = trace
+    return trace if owned else None
+
+
+def _explain(connection, statement: str, parameters) -> list[str]:
+    if connection.dialect.name != "sqlite" or not statement.lstrip()[:7].upper().startswith(EXPLAINABLE):
+        return []
+    if isinstance(parameters, list):
+        # executemany: the plan is the same for every parameter set
+        parameters = parameters[0] if parameters else ()
+    # a raw DBAPI cursor, so the EXPLAIN itself is neither traced nor timed
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as error:  # the plan is best effort, never fail the statement that was traced
+        return [f"<no plan: {error}>"]
+    finally:
+        cursor.close()
+
+
+def _log_slow(connection, statement: str, parameters, seconds: float, trace: QueryTrace | None):
+    plan = _explain(connection, statement, parameters)
+    slow_query_logger.warning(
+        "Slow query %.1f ms in %s%s: %s\n  plan: %s", seconds * 1000, trace.label if trace else "<untraced>",
+        " (full scan)" if full_scans(plan) else "", _WHITESPACE.sub(" ", statement).strip(),
+        "\n        ".join(plan) or "n/a",
+    )
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if SQL_TRACE and context is not None:
+        context.trace_started_at = time.perf_counter()
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "trace_started_at", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    trace = current_trace.get() or connection.info.get(TRACE_KEY)
+    if trace is not None:
+        trace.add(statement, seconds)
+    if seconds * 1000 >= SQL_SLOW_QUERY_MS:
+        _log_slow(connection, statement, parameters, seconds, trace)
+
+
+def after_begin(session, transaction, connection):
+    trace = session.info.get(TRACE_KEY)
+    if trace is not None:
+        connection.info[TRACE_KEY] = trace
+
+
+def on_checkin(dbapi_connection, connection_record):
+    connection_record.info.pop(TRACE_KEY, None)
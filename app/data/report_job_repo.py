@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Any, Callable, Sequence
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from app.data.models import JobStatus, ReportJob
+from app.data.table_versions import bump_versions
+from app.data.unit_of_work import after_commit
+
+
+def _set_job_query(job_id: int, **values: Any):
+    return update(ReportJob).where(ReportJob.id == job_id).values(**values)
+
+
+def _running_job_query(job_id: int, **values: Any):
+    # a job failed as interrupted meanwhile keeps that status
+    return _set_job_query(job_id, **values).where(ReportJob.status == JobStatus.RUNNING)
+
+
+class ReportJobRepo:
+    def __init__(self, session: Session):
+        self._session = session
+
+    def after_commit(self, callback: Callable[[], None]):
+        after_commit(self._session, callback)
+
+    def create_job(self, kind: str, params: str, instructor_id: int | None = None) -> ReportJob:
+        job = ReportJob(kind=kind, params=params, instructor_id=instructor_id)
+        self._session.add(job)
+        self._session.flush()
+        self._session.exec(bump_versions("report_job"))
+        return job
+
+    def get_job(self, job_id: int) -> ReportJob | None:
+        return self._session.get(ReportJob, job_id)
+
+    def queued_job_ids(self) -> Sequence[int]:
+        return self._session.exec(select(ReportJob.id).where(ReportJob.status == JobStatus.QUEUED).order_by(ReportJob.id)).all()
+
+    def claim_job(self, job_id: int) -> ReportJob | None:
+        """Mark a queued job running; None when it is gone or another worker claimed it first."""
+        now = datetime.now()
+        query = (
+            _set_job_query(job_id, status=JobStatus.RUNNING, started_at=now, heartbeat_at=now)
+            .where(ReportJob.status == JobStatus.QUEUED)
+            .returning(ReportJob)
+        )
+        job = self._session.exec(query).scalar_one_or_none()
+        if job is not None:
+            self._session.exec(bump_versions("report_job"))
+        return job
+
+    def set_progress(self, job_id: int, progress: int, total: int | None = None):
+        values = {"progress": progress} if total is None else {"progress": progress, "total": total}
+        self._session.exec(_running_job_query(job_id, heartbeat_at=datetime.now(), **values))
+        self._session.exec(bump_versions("report_job"))
+
+    def finish_job(self, job_id: int, progress: int, result_path: str):
+        self._session.exec(_running_job_query(
+            job_id, status=JobStatus.SUCCEEDED, progress=progress, result_path=result_path, finished_at=datetime.now()))
+        self._session.exec(bump_versions("report_job"))
+
+    def fail_job(self, job_id: int, error: str):
+        self._session.exec(_running_job_query(job_id, status=JobStatus.FAILED, error=error, finished_at=datetime.now()))
+        self._session.exec(bump_versions("report_job"))
+
+    def fail_stale_jobs(self, heartbeat_before: datetime, error: str) -> Sequence[int]:
+        """Fail the running jobs that gave no sign of life since `heartbeat_before`, returns their ids."""
+        query = (
+            update(ReportJob)
+            .where(ReportJob.status == JobStatus.RUNNING, ReportJob.heartbeat_at < heartbeat_before)
+            .values(status=JobStatus.FAILED, error=error, finished_at=datetime.now())
+            .returning(ReportJob.id)
+        )
+        job_ids = self._session.exec(query).scalars().all()
+        if job_ids:
+            self._session.exec(bump_versions("report_job"))
+        return job_ids
+
+    def expire_results(self, finished_before: datetime) -> Sequence[str]:
+        """Forget the reports of jobs finished before `finished_before`, returns their paths."""
+        expired = (ReportJob.finished_at < finished_before, ReportJob.result_path.is_not(None))
+        paths = self._session.exec(select(ReportJob.result_path).where(*expired)).all()
+        if paths:
+            self._session.exec(update(ReportJob).where(*expired).values(result_path=None))
+            self._session.exec(bump_versions("report_job"))
+        return paths
@@ -1,12 +1,20 @@
 from pydantic import BaseModel, Field
-from datetime import date
-from typing import Any, Optional
+from datetime import date, datetime
+from typing import Any, Literal, Optional
+
+from app.data.models import PUBLIC_USER_FIELDS
+from app.domain.leaderboard import DEFAULT_TOP_N, MAX_TOP_N, Subject
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
     role: str
+    refresh_token: Optional[str] = None  # exchange at /auth/refresh for the next pair, without the password
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -39,19 +47,39 @@ class UpdateUserSchema(BaseModel):
 
 class GradeSchema(BaseModel):
     student_id: int
-    pure_maths: int
-    chemistry: int
-    biology: int
-    computer_science: int
-    physics: int
+    pure_maths: int = Field(ge=0, le=20)
+    chemistry: int = Field(ge=0, le=20)
+    biology: int = Field(ge=0, le=20)
+    computer_science: int = Field(ge=0, le=20)
+    physics: int = Field(ge=0, le=20)
+
+
+class GradeImportError(BaseModel):
+    line: int
+    student_id: Optional[int] = None
+    error: str
 
 
-class CreateStudentResponse(CreateUserSchema):
+class GradeImportReport(BaseModel):
+    received: int
+    imported: int
+    failed: int
+    errors: list[GradeImportError]
+    errors_truncated: bool = False
+
+
+class CreateStudentResponse(UserSchema):
     id: int
 
 
 class GetStudentsResponse(BaseModel):
     students: list[dict[str, Any]]
+    next_after_id: Optional[int] = None  # pass back as ?after_id= to fetch the next page
+
+
+class SearchStudentsResponse(BaseModel):
+    students: list[dict[str, Any]]
+    next_offset: Optional[int] = None  # pass back as ?offset= to fetch the next page
 
 
 class UpdateStudentResponse(CreateStudentResponse): ...
@@ -60,11 +88,83 @@ class UpdateStudentResponse(CreateStudentResponse): ...
 class GetStudentResponse(CreateStudentResponse): ...
 
 
+# what GET /students/{id} and /instructor/{id} return without ?fields=
+USER_DETAIL_FIELDS = tuple(field for field in PUBLIC_USER_FIELDS if field in GetStudentResponse.model_fields)
+
+
 class GetInstructorsResponse(BaseModel):
     instructors: list[dict[str, Any]]
+    next_after_id: Optional[int] = None  # pass back as ?after_id= to fetch the next page
 
 
 class UpdateInstructorResponse(CreateStudentResponse): ...
 
 
-class GetInstructorResponse(CreateStudentResponse): ...
\ No newline at end of file
+class GetInstructorResponse(CreateStudentResponse): ...
+
+
+class ProvisioningError(BaseModel):
+    index: int
+    userName: Optional[str] = None
+    error: str
+
+
+class ProvisioningReport(BaseModel):
+    received: int
+    created: int
+    failed: int
+    errors: list[ProvisioningError]
+
+
+BatchOperationName = Literal[
+    "get_student", "update_student", "delete_student",
+    "get_instructor", "update_instructor", "delete_instructor",
+    "update_grade",
+]
+
+
+class BatchOperation(BaseModel):
+    op: BatchOperationName
+    id: int  # the student (update_grade included) or instructor the operation is about
+    data: Optional[dict[str, Any]] = None  # body of the matching single-item route
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation]
+    atomic: bool = True  # all or nothing; False keeps whatever succeeded
+
+
+class BatchResult(BaseModel):
+    index: int
+    status: int
+    body: Any = None  # what the single-item route would have answered
+
+
+class BatchReport(BaseModel):
+    committed: bool
+    succeeded: int
+    failed: int
+    results: list[BatchResult]
+
+
+ReportKind = Literal["grades", "top_students"]
+
+
+class ReportJobRequest(BaseModel):
+    kind: ReportKind
+    format: Literal["csv", "ndjson"] = "csv"  # grades: one row per student; top_students is always JSON
+    n: int = Field(default=DEFAULT_TOP_N, ge=1, le=MAX_TOP_N)  # top_students only
+    subject: Optional[Subject] = None  # top_students only, ranks by the sum of all subjects when absent
+
+
+class ReportJobResponse(BaseModel):
+    id: int
+    kind: ReportKind
+    status: Literal["queued", "running", "succeeded", "failed"]
+    progress: int  # rows written so far
+    total: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result_url: Optional[str] = None  # where to download the report once it succeeded
@@ -1,14 +1,92 @@
+import re
 from abc import ABC, abstractmethod
-from typing import Sequence
+from typing import Callable, Iterator, Sequence
 
 from fastapi import HTTPException, status
-from sqlalchemy import delete
+from sqlalchemy import column, delete, literal_column, table, update
+# projections go through sqlalchemy's select: sqlmodel's turns a one-column select into bare scalars
+from sqlalchemy import select as select_columns
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.data.models import Grade, Student
+from app.data.models import GRADE_FIELDS, PUBLIC_USER_FIELDS, Grade, Student
+from app.data.table_versions import bump_versions
 from app.data.schemas import CreateUserSchema, UpdateUserSchema
+from app.data.unit_of_work import after_commit
 from app.domain.exceptions import StudentNotFound
 
+# rows fetched per round trip when streaming from a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+
+def _student_row_query(fields: Sequence[str] = PUBLIC_USER_FIELDS):
+    # plain column tuples in `fields` order: no ORM identity map, and only the columns asked for are read
+    return select_columns(*(getattr(Student, field) for field in fields))
+
+
+def _students_query(after_id: int | None = None, limit: int | None = None, fields: Sequence[str] = PUBLIC_USER_FIELDS):
+    # keyset pagination: seek past the last id seen instead of OFFSET, the primary key index does the work
+    query = _student_row_query(fields).order_by(Student.id)
+    if after_id is not None:
+        query = query.where(Student.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+# the FTS5 index over the student names and e-mail (see migrations._student_search); rank is its configured bm25
+student_search = table("student_search", column("rowid"), column("rank"))
+_SEARCH_TERM = re.compile(r"\w+")
+
+
+def _update_student_query(student_id: int, data: UpdateUserSchema):
+    # the changed row comes back with the UPDATE: no SELECT before it, no refresh after.
+    # A field left None keeps its value, the columns are NOT NULL
+    values = data.model_dump(exclude_none=True)
+    if not values:
+        return select_columns(Student).where(Student.id == student_id)
+    return update(Student).where(Student.id == student_id).values(**values).returning(Student)
+
+
+def _delete_student_query(student_id: int):
+    return delete(Student).where(Student.id == student_id).returning(Student.id)
+
+
+def _delete_grade_query(student_id: int):
+    return delete(Grade).where(Grade.student_id == student_id).returning(Grade)
+
+
+def search_match(text: str) -> str | None:
+    """FTS5 query for `text`: every word must match the start of a word, e.g. `"ada"* "love"*`.
+
+    Words are quoted, so FTS5 operators and punctuation in user input are searched for literally.
+    """
+    terms = _SEARCH_TERM.findall(text)
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+
+def _search_query(match: str, offset: int = 0, limit: int | None = None, fields: Sequence[str] = PUBLIC_USER_FIELDS):
+    # FTS5 ranks every match and keeps the best offset + limit, only those are joined with student.
+    # id breaks ties so that offset pages don't overlap
+    candidates = (
+        select_columns(student_search.c.rowid, student_search.c.rank)
+        .where(literal_column("student_search").op("MATCH")(match))
+        .order_by(student_search.c.rank, student_search.c.rowid)
+    )
+    if limit is not None:
+        candidates = candidates.limit(offset + limit)
+    candidates = candidates.subquery("candidates")
+    query = (
+        _student_row_query(fields)
+        .select_from(candidates)
+        .join(Student, Student.id == candidates.c.rowid)
+        .order_by(candidates.c.rank, candidates.c.rowid)
+        .offset(offset)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
 
 class AbstractRepo(ABC):
 
@@ -19,13 +97,16 @@ class AbstractRepo(ABC):
     def get_student_by_id(self, student_id: int): ...
 
     @abstractmethod
-    def get_all_students(self): ...
+    def get_all_students(self, after_id: int | None = None, limit: int | None = None): ...
 
     @abstractmethod
     def update_student(self, student_id: int, data: UpdateUserSchema): ...
 
     @abstractmethod
     def delete_student(self, student_id: int): ...
+
+    @abstractmethod
+    def delete_grade(self, student_id: int): ...
     
     @abstractmethod
     def get_my_grades(self, student_id: int): ...
@@ -34,42 +115,56 @@ class StudentRepo(AbstractRepo):
     def __init__(self, session: Session):
         self._session = session
 
+    def after_commit(self, callback: Callable[[], None]):
+        after_commit(self._session, callback)
+
     def create_student(self, data: CreateUserSchema) -> Student:
         student = Student(**dict(data))
         if student.userRole == "Student":
             self._session.add(student)
-            self._session.commit()
-            self._session.refresh(student)
-        
+            # sends the INSERT, which hands back the id; the unit of work commits
+            self._session.flush()
+            self._session.exec(bump_versions("student"))
+
         return student
     
     def get_student_by_id(self, student_id: int) -> Student | None:
         return self._session.exec(select(Student).where(Student.id == student_id)).one_or_none()
 
-    def get_all_students(self) -> Sequence[Student]:
-        return self._session.exec(select(Student)).all()
+    def get_student_row(self, student_id: int, fields: Sequence[str] = PUBLIC_USER_FIELDS) -> tuple | None:
+        return self._session.exec(_student_row_query(fields).where(Student.id == student_id)).one_or_none()
+
+    def get_all_students(self, after_id: int | None = None, limit: int | None = None,
+                         fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Sequence[tuple]:
+        return self._session.exec(_students_query(after_id, limit, fields)).all()
+
+    def stream_all_students(self, after_id: int | None = None, fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Iterator[tuple]:
+        query = _students_query(after_id, fields=fields).execution_options(yield_per=STREAM_BATCH_SIZE)
+        yield from self._session.exec(query)
+
+    def search_students(self, match: str, offset: int = 0, limit: int | None = None,
+                        fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Sequence[tuple]:
+        """Students matching the FTS5 query `match` (see `search_match`), best match first."""
+        return self._session.exec(_search_query(match, offset, limit, fields)).all()
 
     def update_student(self, student_id: int, data: UpdateUserSchema):
-        student = self.get_student_by_id(student_id)
+        student = self._session.exec(_update_student_query(student_id, data)).scalar_one_or_none()
         if not student:
             return None
-        student.first_name = data.first_name
-        student.last_name = data.last_name
-        student.email = data.email
-        student.date_of_birth = data.date_of_birth
-
-        self._session.add(student)
-        self._session.commit()
-        self._session.refresh(student)
+        self._session.exec(bump_versions("student"))
         return student
 
     def delete_student(self, student_id: int) -> bool:
-        student = self._session.exec(select(Student).where(Student.id == student_id)).one_or_none()
-        if not student:
+        if self._session.exec(_delete_student_query(student_id)).first() is None:
             return False
-        self._session.delete(student)
-        self._session.commit()
+        self._session.exec(bump_versions("student"))
         return True
+
+    def delete_grade(self, student_id: int) -> Grade | None:
+        grade = self._session.exec(_delete_grade_query(student_id)).scalar_one_or_none()
+        if grade is not None:
+            self._session.exec(bump_versions("grade"))
+        return grade
     
     def get_my_grades(self, student_id: int) -> Grade:
         my_grades = self._session.exec(select(Grade).where(Grade.student_id == student_id)).one_or_none()
@@ -82,3 +177,57 @@ class StudentRepo(AbstractRepo):
         return my_grades
 
 
+class AsyncStudentRepo(AbstractRepo):
+    """Same queries as `StudentRepo`, awaited on an `AsyncSession` so they don't block the event loop."""
+
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    def after_commit(self, callback: Callable[[], None]):
+        after_commit(self._session.sync_session, callback)
+
+    async def create_student(self, data: CreateUserSchema) -> Student:
+        student = Student(**dict(data))
+        if student.userRole == "Student":
+            self._session.add(student)
+            await self._session.flush()
+            await self._session.exec(bump_versions("student"))
+
+        return student
+
+    async def get_student_by_id(self, student_id: int) -> Student | None:
+        result = await self._session.exec(select(Student).where(Student.id == student_id))
+        return result.one_or_none()
+
+    async def get_all_students(self, after_id: int | None = None, limit: int | None = None,
+                               fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Sequence[tuple]:
+        result = await self._session.exec(_students_query(after_id, limit, fields))
+        return result.all()
+
+    async def update_student(self, student_id: int, data: UpdateUserSchema):
+        student = (await self._session.exec(_update_student_query(student_id, data))).scalar_one_or_none()
+        if not student:
+            return None
+        await self._session.exec(bump_versions("student"))
+        return student
+
+    async def delete_student(self, student_id: int) -> bool:
+        if (await self._session.exec(_delete_student_query(student_id))).first() is None:
+            return False
+        await self._session.exec(bump_versions("student"))
+        return True
+
+    async def delete_grade(self, student_id: int) -> Grade | None:
+        grade = (await self._session.exec(_delete_grade_query(student_id))).scalar_one_or_none()
+        if grade is not None:
+            await self._session.exec(bump_versions("grade"))
+        return grade
+
+    async def get_my_grades(self, student_id: int) -> Grade | None:
+        result = await self._session.exec(select(Grade).where(Grade.student_id == student_id))
+        return result.one_or_none()
+
+    async def get_my_grade_row(self, student_id: int, fields: Sequence[str] = GRADE_FIELDS) -> tuple | None:
+        query = select_columns(*(getattr(Grade, field) for field in fields)).where(Grade.student_id == student_id)
+        result = await self._session.exec(query)
+        return result.one_or_none()
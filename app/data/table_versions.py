@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, MetaData, String, Table, update
+
+# every table the app writes has a counter, bumped with each write: a commit that moved none of them
+# came from outside the app. Cached responses depend on the first three only.
+VERSIONED_TABLES = ("student", "instructor", "grade", "refresh_token", "grade_audit", "report_job")
+
+# kept off SQLModel.metadata: created by migration 5, never dropped with the models
+table_version = Table(
+    "table_version",
+    MetaData(),
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+
+def bump_versions(*tables: str):
+    """UPDATE that bumps the counters of `tables`; execute it in the writing transaction, before the commit."""
+    return (
+        update(table_version)
+        .where(table_version.c.name.in_(tables))
+        .values(version=table_version.c.version + 1)
+    )
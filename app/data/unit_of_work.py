@@ -0,0 +1,171 @@
+"""The database work of one request (or job): a session opened on first use and a single commit.
+
+Repos only `flush()`: their INSERT/UPDATE/DELETE statements go out at once, generated ids and
+updated rows come back with them (`lastrowid`, `RETURNING`), but nothing is committed. The unit of
+work ends the transaction once, after the last write, so a route pays for one COMMIT (one fsync)
+however many rows it touches, and a request that fails halfway leaves nothing behind.
+
+In the API the unit of work is a request dependency (see `app.api.dependencies`); elsewhere use it
+as a context manager, it commits when the block exits and rolls back if it raises.
+`transaction_scope` is the variant for work that must be undone piecewise (the batch endpoint).
+"""
+from contextlib import AsyncExitStack, ExitStack, contextmanager
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.data import query_trace
+from app.data.database import Intent, RoutingSession, async_session_scope, engine, session_scope
+
+_AFTER_COMMIT_KEY = "after_commit"
+# set by transaction_scope: the session's commits only release savepoints, callbacks wait for the real one
+_DEFERRED_KEY = "after_commit.deferred"
+
+
+def after_commit(session: OrmSession, callback: Callable[[], None]):
+    """Run `callback` once the transaction `session` is in has committed; it is dropped on rollback.
+
+    For process-local state (in-memory snapshots, caches) that must not run ahead of the database.
+    """
+    session.info.setdefault(_AFTER_COMMIT_KEY, []).append(callback)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _run_after_commit(session: OrmSession):
+    callbacks = session.info.pop(_AFTER_COMMIT_KEY, ())
+    deferred = session.info.get(_DEFERRED_KEY)
+    if deferred is not None:
+        deferred.extend(callbacks)
+        return
+    for callback in callbacks:
+        callback()
+
+
+@event.listens_for(OrmSession, "after_soft_rollback")
+def _drop_after_commit(session: OrmSession, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_AFTER_COMMIT_KEY, None)
+
+
+def _pending(session: RoutingSession | None) -> bool:
+    # only a transaction that ran something other than SELECTs has anything to commit
+    return session is not None and session.in_transaction() and session.wrote
+
+
+class UnitOfWork:
+    def __init__(self, intent: Intent = Intent.WRITE):
+        self.intent = intent
+        self._stack = ExitStack()
+        self._session: Session | None = None
+
+    @property
+    def session(self) -> Session:
+        if self._session is None:
+            self._session = self._stack.enter_context(session_scope(self.intent))
+        return self._session
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    @property
+    def pending(self) -> bool:
+        return _pending(self._session)
+
+    def commit(self):
+        if self.pending:
+            self._session.commit()
+
+    def rollback(self):
+        if self._session is not None:
+            self._session.rollback()
+
+    def close(self):
+        self._session = None
+        self._stack.close()
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.close()
+
+
+class AsyncUnitOfWork:
+    """`UnitOfWork` over an `AsyncSession`; `session()` is awaited, the first call opens it."""
+
+    def __init__(self, intent: Intent = Intent.WRITE):
+        self.intent = intent
+        self._stack = AsyncExitStack()
+        self._session: AsyncSession | None = None
+
+    async def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = await self._stack.enter_async_context(async_session_scope(self.intent))
+        return self._session
+
+    @property
+    def pending(self) -> bool:
+        return self._session is not None and _pending(self._session.sync_session)
+
+    async def commit(self):
+        if self.pending:
+            await self._session.commit()
+
+    async def rollback(self):
+        if self._session is not None:
+            await self._session.rollback()
+
+    async def close(self):
+        self._session = None
+        await self._stack.aclose()
+
+    async def __aenter__(self) -> "AsyncUnitOfWork":
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                await self.commit()
+            else:
+                await self.rollback()
+        finally:
+            await self.close()
+
+
+@contextmanager
+def transaction_scope():
+    """A primary session inside one database transaction that the caller, not the session, ends.
+
+    The session's `commit()` only releases a SAVEPOINT and `rollback()` returns to the last one, so work
+    can be undone piecewise. Everything becomes durable when the block exits, and is rolled back if it
+    raises; `after_commit` callbacks of released savepoints run only then.
+    """
+    committed: list[Callable[[], None]] = []
+    with engine.connect() as connection:
+        with connection.begin():
+            if connection.dialect.name == "sqlite":
+                # pysqlite only sends BEGIN ahead of DML: the first SAVEPOINT would open (and its release
+                # commit) a transaction of its own. IMMEDIATE also takes the write lock up front.
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            session = RoutingSession(connection, join_transaction_mode="create_savepoint")
+            session.info[_DEFERRED_KEY] = committed
+            trace = query_trace.start_session_trace(session)
+            try:
+                yield session
+            finally:
+                session.close()
+                if trace is not None:
+                    query_trace.report(trace)
+        # reached only when the connection's transaction committed
+        for callback in committed:
+            callback()
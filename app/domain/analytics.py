@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from sqlmodel import Session
+
+if TYPE_CHECKING:
+    import numpy as np
+
+from app.data.models import GRADE_SUBJECTS, Grade
+
+# a worker only sees its own writes incrementally, other workers' writes show up after this many seconds
+ANALYTICS_SNAPSHOT_MAX_AGE = float(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE", "60"))
+PERCENTILES = (10, 25, 50, 75, 90)
+_LOAD_BATCH_SIZE = 50_000
+
+
+class GradeSnapshot:
+    """In-memory columnar copy of the five subject columns of `grade`.
+
+    Marks are held in one (rows x 5) int8 array next to an array of grade ids, so class-wide
+    statistics are a handful of vectorized NumPy calls instead of a Python loop over ORM rows.
+    Grade writes in this process are applied in place through `apply`; bulk writes call
+    `invalidate` and the next read reloads the table.
+    """
+
+    def __init__(self, max_age: float = ANALYTICS_SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # NumPy is only imported by the first load, processes that never serve analytics don't pay for it
+        self._ids: np.ndarray | None = None
+        self._marks: np.ndarray | None = None
+        self._size = 0
+        self._positions: dict[int, int] = {}
+        self._loaded_at: float | None = None
+
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.max_age
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def load(self, session: Session):
+        import numpy as np
+
+        columns = ", ".join(GRADE_SUBJECTS)
+        # raw DBAPI cursor: plain tuples convert to NumPy an order of magnitude faster than Row objects
+        cursor = session.connection().connection.cursor()
+        try:
+            total = cursor.execute("SELECT count(*) FROM grade").fetchone()[0]
+            ids = np.empty(total, dtype=np.int64)
+            marks = np.empty((total, len(GRADE_SUBJECTS)), dtype=np.int8)
+            cursor.execute(f"SELECT id, {columns} FROM grade ORDER BY id")
+            size = 0
+            while rows := cursor.fetchmany(_LOAD_BATCH_SIZE):
+                # rows can only outnumber the count if grades were inserted between the two statements
+                rows = rows[:total - size]
+                block = np.array(rows, dtype=np.int64)
+                ids[size:size + len(block)] = block[:, 0]
+                marks[size:size + len(block)] = block[:, 1:]
+                size += len(block)
+        finally:
+            cursor.close()
+
+        with self._lock:
+            self._ids, self._marks, self._size = ids, marks, size
+            self._positions = dict(zip(ids[:size].tolist(), range(size)))
+            self._loaded_at = time.monotonic()
+
+    def apply(self, grade: Grade):
+        """Insert or overwrite one grade row in place, a no-op until the snapshot has been loaded."""
+        values = [getattr(grade, subject) for subject in GRADE_SUBJECTS]
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            position = self._positions.get(grade.id)
+            if position is None:
+                position = self._size
+                if position == len(self._ids):
+                    import numpy as np
+
+                    # grow geometrically so a stream of new grades stays amortized O(1)
+                    capacity = max(16, 2 * len(self._ids))
+                    self._ids = np.resize(self._ids, capacity)
+                    self._marks = np.resize(self._marks, (capacity, len(GRADE_SUBJECTS)))
+                self._ids[position] = grade.id
+                self._positions[grade.id] = position
+                self._size += 1
+            self._marks[position] = values
+
+    def remove(self, grade_id: int):
+        """Drop one grade row in place, the last row takes its position; a no-op if the snapshot doesn't hold it."""
+        with self._lock:
+            if self._loaded_at is None or (position := self._positions.pop(grade_id, None)) is None:
+                return
+            last = self._size - 1
+            if position != last:
+                self._ids[position] = self._ids[last]
+                self._marks[position] = self._marks[last]
+                self._positions[int(self._ids[position])] = position
+            self._size = last
+
+    def marks(self, session: Session) -> np.ndarray:
+        if not self.is_fresh():
+            self.load(session)
+        with self._lock:
+            return self._marks[:self._size].copy()
+
+
+def _describe_counts(counts: np.ndarray, scale: float = 1.0) -> dict[str, Any]:
+    """Statistics of integer data given as a histogram (`counts[k]` values equal to k), scaled by `scale`.
+
+    Marks only take a few distinct values, so everything here is O(distinct values) once the
+    histogram exists; percentiles use the same linear interpolation as `np.percentile`.
+    """
+    import numpy as np
+
+    values = np.arange(len(counts), dtype=np.float64)
+    total = counts.sum()
+    mean = (values * counts).sum() / total
+    variance = max((values * values * counts).sum() / total - mean * mean, 0.0)
+    present = np.flatnonzero(counts)
+    cumulative = np.cumsum(counts)
+
+    def value_at(rank: int) -> float:
+        return float(np.searchsorted(cumulative, rank, side="right"))
+
+    percentiles = {}
+    for p in PERCENTILES:
+        position = p / 100 * (total - 1)
+        lower, fraction = int(position), position - int(position)
+        low = value_at(lower)
+        high = value_at(lower + 1) if fraction else low
+        percentiles[f"p{p}"] = (low + (high - low) * fraction) * scale
+
+    return {
+        "mean": float(mean) * scale,
+        "std": float(np.sqrt(variance)) * scale,
+        "min": float(present[0]) * scale,
+        "max": float(present[-1]) * scale,
+        "percentiles": percentiles,
+    }
+
+
+def _correlation(marks: np.ndarray) -> dict[str, dict[str, float | None]]:
+    import numpy as np
+
+    # one BLAS matmul gives every cross moment at once
+    as_float = marks.astype(np.float64)
+    count = len(as_float)
+    means = as_float.sum(axis=0) / count
+    covariance = as_float.T @ as_float / count - np.outer(means, means)
+    deviations = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        matrix = covariance / np.outer(deviations, deviations)
+    # a subject where everybody has the same mark has no defined correlation
+    return {
+        subject: {other: (None if not np.isfinite(value) else float(np.clip(value, -1, 1))) for other, value in zip(GRADE_SUBJECTS, row)}
+        for subject, row in zip(GRADE_SUBJECTS, matrix)
+    }
+
+
+def summarize(marks: np.ndarray) -> dict[str, Any]:
+    import numpy as np
+
+    count = len(marks)
+    if count == 0:
+        return {"count": 0, "subjects": {}, "average": None, "correlation": None}
+
+    subjects = {}
+    for column, subject in enumerate(GRADE_SUBJECTS):
+        # marks are integers 0..20, one bucket per possible mark
+        histogram = np.bincount(marks[:, column].astype(np.intp), minlength=21)
+        subjects[subject] = {**_describe_counts(histogram), "histogram": histogram.tolist()}
+
+    totals = marks.sum(axis=1, dtype=np.intp)
+    average = _describe_counts(np.bincount(totals, minlength=5 * 20 + 1), scale=1 / len(GRADE_SUBJECTS))
+
+    return {
+        "count": count,
+        "subjects": subjects,
+        "average": average,
+        "correlation": _correlation(marks) if count > 1 else None,
+    }
+
+
+grade_snapshot = GradeSnapshot()
+
+
+def grade_statistics(session: Session) -> dict[str, Any]:
+    return summarize(grade_snapshot.marks(session))
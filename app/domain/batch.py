@@ -0,0 +1,113 @@
+"""Many student/instructor operations in one request: one auth check, one session, one transaction.
+
+Every operation maps onto the service function its single-item route calls, and its result (or
+error) is what that route would have answered. Atomic batches stop at the first failure and roll
+everything back. Best-effort batches undo only the failing operation and carry on. Either way
+nothing is durable before the whole batch has run.
+"""
+import os
+from typing import Any, Callable
+
+from fastapi import HTTPException as RouteException, status
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from app.data.instructor_repo import InstructorRepo
+from app.data.schemas import (
+    BatchOperation, BatchReport, BatchResult, GradeSchema, UpdateInstructorResponse, UpdateStudentResponse,
+    UpdateUserSchema, USER_DETAIL_FIELDS,
+)
+from app.data.student_repo import StudentRepo
+from app.data.unit_of_work import transaction_scope
+from app.domain import instructor_service, student_service
+from app.domain.exceptions import HTTPException as DomainException
+
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "1000"))
+
+# status of an operation that never ran because an earlier one failed an atomic batch
+SKIPPED = status.HTTP_424_FAILED_DEPENDENCY
+
+
+class _Repos:
+    def __init__(self, session: Session, instructor_id: int | None):
+        self.students = StudentRepo(session)
+        self.instructors = InstructorRepo(session)
+        self.instructor_id = instructor_id
+
+
+def _update_student(operation: BatchOperation, repos: _Repos):
+    student = student_service.update_student(operation.id, UpdateUserSchema.model_validate(operation.data or {}), repos.students)
+    return UpdateStudentResponse.model_validate(student, from_attributes=True).model_dump(mode="json")
+
+
+def _update_instructor(operation: BatchOperation, repos: _Repos):
+    instructor = instructor_service.update_instructor(
+        operation.id, UpdateUserSchema.model_validate(operation.data or {}), repos.instructors)
+    return UpdateInstructorResponse.model_validate(instructor, from_attributes=True).model_dump(mode="json")
+
+
+def _update_grade(operation: BatchOperation, repos: _Repos):
+    # same as PUT /students/grades/update-Add: overwrite the student's grade row, or add it
+    grade = GradeSchema.model_validate({**(operation.data or {}), "student_id": operation.id})
+    student_service.get_student(operation.id, repos.students)
+    saved = instructor_service.update_grade(grade, repos.instructors, operation.id, repos.instructor_id)
+    if saved is None:
+        saved = instructor_service.add_new_grade(grade, repos.instructors, repos.instructor_id)
+    return saved.model_dump()
+
+
+OPERATIONS: dict[str, Callable[[BatchOperation, _Repos], Any]] = {
+    "get_student": lambda operation, repos: student_service.get_student_fields(operation.id, repos.students, USER_DETAIL_FIELDS),
+    "update_student": _update_student,
+    "delete_student": lambda operation, repos: student_service.delete_student(operation.id, repos.students, repos.instructor_id),
+    "get_instructor": lambda operation, repos: instructor_service.get_instructor_fields(operation.id, repos.instructors, USER_DETAIL_FIELDS),
+    "update_instructor": _update_instructor,
+    "delete_instructor": lambda operation, repos: instructor_service.delete_instructor(operation.id, repos.instructors),
+    "update_grade": _update_grade,
+}
+
+
+def _error(exception: Exception) -> tuple[int, Any]:
+    # the bodies the app's exception handlers produce for the single-item routes
+    if isinstance(exception, DomainException):
+        return exception.status_code, {"error_body": {"title": exception.title, "message": exception.message}}
+    if isinstance(exception, RouteException):
+        return exception.status_code, {"detail": exception.detail}
+    if isinstance(exception, ValidationError):
+        return status.HTTP_422_UNPROCESSABLE_ENTITY, {"detail": exception.errors(include_url=False, include_context=False)}
+    if isinstance(exception, IntegrityError):
+        return status.HTTP_409_CONFLICT, {"detail": "The change conflicts with a constraint on the stored data"}
+    raise exception
+
+
+class _RolledBack(Exception):
+    pass
+
+
+def run_batch(operations: list[BatchOperation], atomic: bool = True, instructor_id: int | None = None) -> BatchReport:
+    results: list[BatchResult] = []
+    committed = False
+    try:
+        with transaction_scope() as session:
+            repos = _Repos(session, instructor_id)
+            for index, operation in enumerate(operations):
+                try:
+                    body = OPERATIONS[operation.op](operation, repos)
+                    # ends the operation's savepoint, a later failure only undoes its own
+                    session.commit()
+                except (DomainException, RouteException, ValidationError, IntegrityError) as exception:
+                    session.rollback()
+                    error_status, error_body = _error(exception)
+                    results.append(BatchResult(index=index, status=error_status, body=error_body))
+                    if atomic:
+                        results += [BatchResult(index=skipped, status=SKIPPED) for skipped in range(index + 1, len(operations))]
+                        raise _RolledBack
+                    continue
+                results.append(BatchResult(index=index, status=status.HTTP_204_NO_CONTENT if body is None else status.HTTP_200_OK, body=body))
+        committed = True
+    except _RolledBack:
+        pass
+
+    failed = sum(result.status >= 400 for result in results)
+    return BatchReport(committed=committed, succeeded=len(results) - failed, failed=failed, results=results)
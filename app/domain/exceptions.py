@@ -15,4 +15,25 @@ class StudentNotFound(HTTPException):
 
 class InstructorNotFound(HTTPException):
     def __init__(self, title="Not Found", message="Instructor not Found", status_code=status.HTTP_404_NOT_FOUND):
-        super().__init__(title, message, status_code)
\ No newline at end of file
+        super().__init__(title, message, status_code)
+
+class EmailTaken(HTTPException):
+    def __init__(self, title="Conflict", message="Another user already has this email", status_code=status.HTTP_409_CONFLICT):
+        super().__init__(title, message, status_code)
+
+
+class ReportJobNotFound(HTTPException):
+    def __init__(self, title="Not Found", message="Report job not Found", status_code=status.HTTP_404_NOT_FOUND):
+        super().__init__(title, message, status_code)
+
+
+class ReportNotReady(HTTPException):
+    def __init__(self, title="Conflict", message="The report job has not succeeded, there is no result to download",
+                 status_code=status.HTTP_409_CONFLICT):
+        super().__init__(title, message, status_code)
+
+
+class ReportExpired(HTTPException):
+    def __init__(self, title="Gone", message="The report was deleted after its retention period, submit the job again",
+                 status_code=status.HTTP_410_GONE):
+        super().__init__(title, message, status_code)
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+from typing import Any, BinaryIO, Iterable, Iterator, Literal
+
+from pydantic import ValidationError
+
+from app.data import grade_audit
+from app.data.instructor_repo import InstructorRepo
+from app.data.models import GRADE_SUBJECTS
+from app.data.schemas import GradeImportError, GradeImportReport, GradeSchema
+from app.domain import analytics
+
+ImportFormat = Literal["csv", "ndjson"]
+
+# rows validated and written per executemany batch
+GRADE_IMPORT_BATCH_SIZE = int(os.getenv("GRADE_IMPORT_BATCH_SIZE", "5000"))
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename: str | None, content_type: str | None) -> ImportFormat:
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(stream: BinaryIO, file_format: ImportFormat) -> Iterator[tuple[int, Any]]:
+    """Yield (line number, raw row) pairs without loading the whole upload; bad JSON lines yield the exception."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if file_format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+class _GradeImport:
+    def __init__(self, repo: InstructorRepo, batch_size: int, instructor_id: int | None):
+        self.repo = repo
+        self.batch_size = batch_size
+        self.instructor_id = instructor_id
+        self.changes: list[grade_audit.GradeChange] = []
+        self.received = 0
+        self.failed = 0
+        self.errors: list[GradeImportError] = []
+
+    def fail(self, line: int, error: str, student_id: int | None = None):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(GradeImportError(line=line, student_id=student_id, error=error))
+
+    def validated_batches(self, rows: Iterable[tuple[int, Any]]) -> Iterator[list[dict]]:
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.batch_size)):
+            self.received += len(chunk)
+            valid: dict[int, tuple[int, dict]] = {}
+            for line, raw in chunk:
+                if isinstance(raw, Exception):
+                    self.fail(line, f"invalid JSON: {raw}")
+                    continue
+                try:
+                    grade = GradeSchema.model_validate(raw)
+                except ValidationError as e:
+                    self.fail(line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                    continue
+                # a later row for the same student wins, like it would with one request per row
+                valid[grade.student_id] = (line, grade.model_dump())
+
+            known = self.repo.existing_student_ids(valid)
+            old_marks = self.repo.get_grade_marks(known)
+            batch = []
+            for student_id, (line, grade) in valid.items():
+                if student_id in known:
+                    batch.append(grade)
+                    self.audit(student_id, old_marks.get(student_id), grade)
+                else:
+                    self.fail(line, "student not found", student_id)
+            yield batch
+
+    def audit(self, student_id: int, old: tuple[int, ...] | None, grade: dict):
+        change = grade_audit.grade_change(student_id, old, tuple(grade[subject] for subject in GRADE_SUBJECTS), self.instructor_id)
+        if change is not None:
+            self.changes.append(change)
+
+
+def import_grades(
+    rows: Iterable[tuple[int, Any]],
+    repo: InstructorRepo,
+    batch_size: int = GRADE_IMPORT_BATCH_SIZE,
+    instructor_id: int | None = None
+) -> GradeImportReport:
+    grade_import = _GradeImport(repo, batch_size, instructor_id)
+    imported = repo.upsert_grades(grade_import.validated_batches(rows))
+    if imported:
+        changes = grade_import.changes
+
+        def committed():
+            # too many rows to patch one by one, reload on the next analytics read
+            analytics.grade_snapshot.invalidate()
+            grade_audit.audit_writer.record_many(changes)
+
+        repo.after_commit(committed)
+    return GradeImportReport(
+        received=grade_import.received,
+        imported=imported,
+        failed=grade_import.failed,
+        errors=sorted(grade_import.errors, key=lambda error: error.line),
+        errors_truncated=grade_import.failed > len(grade_import.errors),
+    )
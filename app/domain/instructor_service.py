@@ -1,12 +1,17 @@
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Iterator, Sequence
 
 from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
-from app.data.models import Grade, Instructor
+from app.auth.principal_cache import principal_cache
+from app.data.models import GRADE_LIST_FIELDS, GRADE_SUBJECTS, PUBLIC_USER_FIELDS, Grade, Instructor
+from app.data import grade_audit
 from app.data.instructor_repo import AbstractRepo
 from app.data.schemas import CreateUserSchema, GradeSchema, UpdateUserSchema
-from app.domain.exceptions import InstructorNotFound
+from app.domain import analytics, leaderboard
+from app.domain.exceptions import EmailTaken, InstructorNotFound
+from app.domain.leaderboard import DEFAULT_TOP_N, Subject
 
 
 def create_instructor(
@@ -17,70 +22,176 @@ def create_instructor(
     return user
 
 
-def get_instructors(user_repo: AbstractRepo) -> list[dict[str, Any]]:
-    instructors = user_repo.get_all_instructors()
-    return [dict(instructor) for instructor in instructors]
+def get_instructors(user_repo: AbstractRepo, after_id: int | None = None, limit: int | None = None,
+                    fields: Sequence[str] = PUBLIC_USER_FIELDS) -> list[dict[str, Any]]:
+    instructors = user_repo.get_all_instructors(after_id=after_id, limit=limit, fields=fields)
+    return [dict(zip(fields, instructor)) for instructor in instructors]
+
+
+def stream_instructors(user_repo: AbstractRepo, after_id: int | None = None,
+                       fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Iterator[dict[str, Any]]:
+    for instructor in user_repo.stream_all_instructors(after_id=after_id, fields=fields):
+        yield dict(zip(fields, instructor))
 
 
 def get_instructor(instructor_id: int, user_repo: AbstractRepo) -> Instructor:
-    user = user_repo.get_instructor_by_id(user_id=instructor_id)
+    user = user_repo.get_instructor_by_id(instructor_id)
     if not user:
         raise InstructorNotFound(title="Not Found", message=f"Instructor with id {instructor_id} not found")
     return user
 
 
+def get_instructor_fields(instructor_id: int, user_repo: AbstractRepo, fields: Sequence[str] = PUBLIC_USER_FIELDS) -> dict[str, Any]:
+    row = user_repo.get_instructor_row(instructor_id, fields)
+    if row is None:
+        raise InstructorNotFound(title="Not Found", message=f"Instructor with id {instructor_id} not found")
+    return dict(zip(fields, row))
+
+
 def update_instructor(
     instructor_id: int,
     data: UpdateUserSchema,
     repo: AbstractRepo
 ) -> Instructor:
-    user = repo.update_instructor(user_id=instructor_id, data=data)
+    try:
+        user = repo.update_instructor(instructor_id, data)
+    except IntegrityError:
+        # email is the only unique column an update can write
+        raise EmailTaken
     if not user:
         raise InstructorNotFound
+    # once committed: a request resolving the principal before that would cache the old row again
+    repo.after_commit(lambda: principal_cache.invalidate("Instructor", instructor_id))
     return user
 
 
 def delete_instructor(instructor_id: int, repo: AbstractRepo):
-    has_been_deleted = repo.delete_instructor(user_id=instructor_id)
+    has_been_deleted = repo.delete_instructor(instructor_id)
     if not has_been_deleted:
-        InstructorNotFound
+        raise InstructorNotFound
+    repo.after_commit(lambda: principal_cache.invalidate("Instructor", instructor_id))
 
 
-def get_top_students(repo: AbstractRepo):
-    top_students = repo.get_top_students()
+def get_top_students(repo: AbstractRepo, n: int = DEFAULT_TOP_N, subject: Subject | None = None):
+    top_students = repo.get_top_students(n=n, subject=subject)
     if not top_students:
         raise HTTPException(
                 status_code=status.HTTP_204_NO_CONTENT,
-                details= "No Records Found"
+                detail= "No Records Found"
             )
-    return [dict(top_student) for top_student in top_students]
+    return leaderboard.rank_rows(top_students, subject)
+
+def _grade_written(repo: AbstractRepo, grade: Grade, old_marks: tuple[int, ...] | None, instructor_id: int | None):
+    # copied now: a sync session expires `grade` when it commits
+    written = Grade(**grade.model_dump())
+    change = grade_audit.grade_change(written.student_id, old_marks, grade_audit.marks(written), instructor_id)
+
+    def committed():
+        analytics.grade_snapshot.apply(written)
+        if change is not None:
+            grade_audit.audit_writer.record(change)
+
+    repo.after_commit(committed)
+
 
-def add_new_grade(data: GradeSchema, repo: AbstractRepo)-> Grade:
+def add_new_grade(data: GradeSchema, repo: AbstractRepo, instructor_id: int | None = None)-> Grade:
     grade = repo.add_new_grade(data)
+    _grade_written(repo, grade, None, instructor_id)
     return grade
 
-def update_grade(data: GradeSchema, repo: AbstractRepo, student_id: int)-> Grade:
+def update_grade(data: GradeSchema, repo: AbstractRepo, student_id: int, instructor_id: int | None = None)-> Grade:
+    # the audit needs the marks being overwritten, RETURNING only hands back the new ones
+    old_marks = repo.get_grade_marks([student_id]).get(student_id)
     grade = repo.update_grade(student_id, data)
-    
+    if grade:
+        _grade_written(repo, grade, old_marks, instructor_id)
     return grade
 
 
-def view_all_grades(repo: AbstractRepo, session: Session):
-    # Pass session to repo method
-    all_grades = repo.view_grades(session=session)
-    
+def get_grade_history(repo: AbstractRepo, student_id: int, limit: int) -> list[dict[str, Any]]:
+    """Latest audited changes of a student's grade first; changes younger than the audit flush interval may be missing."""
     return [
         {
-            "id": grade.id,  # Accessing by field name, not index
-            "userName": grade.userName,
-            "firstName": grade.firstName,
-            "lastName": grade.lastName,
-            "grades": {
-                "pure_maths": grade.pure_maths,
-                "chemistry": grade.chemistry,
-                "biology": grade.biology,
-                "computer_science": grade.computer_science,
-                "physics": grade.physics
-            }
-        } for grade in all_grades
-    ]
\ No newline at end of file
+            "changed_at": change.changed_at,
+            "instructor_id": change.instructor_id,
+            "old": dict(zip(GRADE_SUBJECTS, (getattr(change, column) for column in grade_audit.OLD_COLUMNS)))
+            if change.old_pure_maths is not None else None,
+            "new": dict(zip(GRADE_SUBJECTS, (getattr(change, column) for column in grade_audit.NEW_COLUMNS)))
+            if change.new_pure_maths is not None else None,
+        }
+        for change in repo.get_grade_history(student_id, limit)
+    ]
+
+
+def grade_row_formatter(fields: Sequence[str] = GRADE_LIST_FIELDS) -> Callable[[tuple], dict[str, Any]]:
+    # fields come in GRADE_LIST_FIELDS order: the student columns first, the marks after them nest under "grades"
+    split = sum(field not in GRADE_SUBJECTS for field in fields)
+    student_fields, subjects = fields[:split], fields[split:]
+
+    def to_dict(row: tuple) -> dict[str, Any]:
+        item = dict(zip(student_fields, row[:split]))
+        if subjects:
+            item["grades"] = dict(zip(subjects, row[split:]))
+        return item
+
+    return to_dict
+
+
+def view_all_grades(repo: AbstractRepo, session: Session, fields: Sequence[str] = GRADE_LIST_FIELDS):
+    # Pass session to repo method
+    all_grades = repo.view_grades(session=session, fields=fields)
+    
+    return list(map(grade_row_formatter(fields), all_grades))
+
+
+def grade_pages(repo: AbstractRepo, session: Session, page_size: int, fields: Sequence[str] = GRADE_LIST_FIELDS) -> Iterator[list]:
+    """Every grade row, `page_size` rows (one keyset query) at a time."""
+    after_id = None
+    while True:
+        try:
+            page = repo.view_grades(session=session, after_id=after_id, limit=page_size, fields=fields)
+        except HTTPException:
+            return  # 204: no grade past after_id
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1].id
+
+
+# Async variants, used by the async routes with an AsyncInstructorRepo
+
+async def get_top_students_async(repo: AbstractRepo, n: int = DEFAULT_TOP_N, subject: Subject | None = None):
+    top_students = await repo.get_top_students(n=n, subject=subject)
+    return leaderboard.rank_rows(top_students, subject)
+
+
+async def add_new_grade_async(data: GradeSchema, repo: AbstractRepo, instructor_id: int | None = None) -> Grade:
+    grade = await repo.add_new_grade(data)
+    _grade_written(repo, grade, None, instructor_id)
+    return grade
+
+
+async def update_grade_async(data: GradeSchema, repo: AbstractRepo, student_id: int, instructor_id: int | None = None) -> Grade:
+    old_marks = (await repo.get_grade_marks([student_id])).get(student_id)
+    grade = await repo.update_grade(student_id, data)
+    if grade:
+        _grade_written(repo, grade, old_marks, instructor_id)
+    return grade
+
+
+async def view_all_grades_async(repo: AbstractRepo, after_id: int | None = None, limit: int | None = None,
+                                fields: Sequence[str] = GRADE_LIST_FIELDS) -> list[dict[str, Any]]:
+    all_grades = await repo.view_grades(after_id=after_id, limit=limit, fields=fields)
+    return list(map(grade_row_formatter(fields), all_grades))
+
+
+async def stream_all_grades_async(repo: AbstractRepo, after_id: int | None = None,
+                                  fields: Sequence[str] = GRADE_LIST_FIELDS) -> AsyncIterator[dict[str, Any]]:
+    to_dict = grade_row_formatter(fields)
+    async for row in repo.stream_grades(after_id=after_id, fields=fields):
+        yield to_dict(row)
+
+
+def export_all_grades_async(repo: AbstractRepo, fields: Sequence[str] = GRADE_LIST_FIELDS) -> AsyncIterator[tuple]:
+    # flat column tuples for tabular exports, no per-row dict
+    return repo.stream_grades(fields=fields)
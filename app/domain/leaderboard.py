@@ -0,0 +1,36 @@
+from typing import Any, Literal, Sequence
+
+Subject = Literal["pure_maths", "chemistry", "biology", "computer_science", "physics"]
+
+DEFAULT_TOP_N = 5
+MAX_TOP_N = 100
+# students tied at the cutoff stay on the board, up to this many rows in all (the lowest ids first):
+# a common mark can't turn a top 5 into the whole school
+MAX_BOARD_ROWS = 2 * MAX_TOP_N
+
+
+def rank_rows(rows: Sequence[Any], subject: Subject | None = None) -> list[dict[str, Any]]:
+    """Attach competition ranks (1, 2, 2, 4) to rows already ordered by score, best first.
+
+    Rows carry the student columns plus `score`: the subject mark when `subject` is given,
+    otherwise the sum of the five subjects, reported as `average_marks`.
+    """
+    ranked = []
+    rank, previous_score = 0, None
+    for position, row in enumerate(rows, start=1):
+        if row.score != previous_score:
+            rank, previous_score = position, row.score
+        entry = {
+            "rank": rank,
+            "id": row.id,
+            "userName": row.userName,
+            "firstName": row.firstName,
+            "lastName": row.lastName,
+        }
+        if subject is None:
+            entry["average_marks"] = row.score / 5.0
+        else:
+            entry["subject"] = subject
+            entry["marks"] = row.score
+        ranked.append(entry)
+    return ranked
@@ -0,0 +1,120 @@
+import os
+from itertools import islice
+from typing import Iterable, Iterator
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from app.auth.dependencies import hash_passwords_parallel
+from app.data.models import Instructor, Student
+from app.data.schemas import CreateUserSchema, ProvisioningError, ProvisioningReport
+from app.data.table_versions import bump_versions
+
+# users hashed and inserted per transaction
+PROVISIONING_BATCH_SIZE = int(os.getenv("PROVISIONING_BATCH_SIZE", "500"))
+
+USER_MODELS: dict[str, type[Student] | type[Instructor]] = {"Student": Student, "Instructor": Instructor}
+
+DUPLICATE_USER = "userName or email already exists"
+
+
+class _Provisioning:
+    def __init__(self, session: Session):
+        self.session = session
+        self.received = 0
+        self.created = 0
+        self.errors: list[ProvisioningError] = []
+
+    def fail(self, index: int, error: str, user_name: str | None = None):
+        self.errors.append(ProvisioningError(index=index, userName=user_name, error=error))
+
+    def run_batch(self, batch: list[tuple[int, CreateUserSchema | Exception]]):
+        self.received += len(batch)
+        candidates: list[tuple[int, CreateUserSchema, type]] = []
+        seen: dict[type, tuple[set[str], set[str]]] = {model: (set(), set()) for model in USER_MODELS.values()}
+        for index, user in batch:
+            if isinstance(user, Exception):
+                self.fail(index, str(user))
+                continue
+            model = USER_MODELS.get(user.userRole)
+            if model is None:
+                self.fail(index, "userRole must be either 'Student' or 'Instructor'", user.userName)
+                continue
+            names, emails = seen[model]
+            if user.userName in names or user.email in emails:
+                self.fail(index, DUPLICATE_USER, user.userName)
+                continue
+            names.add(user.userName)
+            emails.add(user.email)
+            candidates.append((index, user, model))
+
+        candidates = self.drop_existing(candidates, seen)
+        if not candidates:
+            return
+
+        # the expensive part, spread over all cores before touching the database
+        hashes = hash_passwords_parallel([user.password for _, user, _ in candidates])
+        self.insert([
+            (index, user, model(**user.model_dump(exclude={"password"}), hashed_password=hashed))
+            for (index, user, model), hashed in zip(candidates, hashes)
+        ])
+
+    def drop_existing(self, candidates, seen):
+        # one query per table and column instead of a lookup per user, so nobody is hashed just to fail
+        taken: dict[type, tuple[set[str], set[str]]] = {}
+        for model, (names, emails) in seen.items():
+            if not names:
+                continue
+            taken_names = set(self.session.exec(select(model.userName).where(model.userName.in_(names))).all())
+            taken_emails = set(self.session.exec(select(model.email).where(model.email.in_(emails))).all())
+            taken[model] = (taken_names, taken_emails)
+
+        remaining = []
+        for index, user, model in candidates:
+            taken_names, taken_emails = taken.get(model, (set(), set()))
+            if user.userName in taken_names or user.email in taken_emails:
+                self.fail(index, DUPLICATE_USER, user.userName)
+            else:
+                remaining.append((index, user, model))
+        return remaining
+
+    def insert(self, rows):
+        try:
+            with self.session.begin_nested():
+                self.session.add_all([row for _, _, row in rows])
+            self.created += len(rows)
+        except IntegrityError:
+            # someone created one of these users meanwhile: retry one by one, only the clashing rows fail
+            for index, user, row in rows:
+                retry = type(row)(**row.model_dump(exclude={"id"}))
+                try:
+                    with self.session.begin_nested():
+                        self.session.add(retry)
+                    self.created += 1
+                except IntegrityError:
+                    self.fail(index, DUPLICATE_USER, user.userName)
+        self.session.exec(bump_versions(*{row.__tablename__ for _, _, row in rows}))
+        self.session.commit()
+
+
+def _batches(users: Iterable[tuple[int, CreateUserSchema | Exception]], size: int) -> Iterator[list]:
+    users = iter(users)
+    while batch := list(islice(users, size)):
+        yield batch
+
+
+def provision_users(
+    users: Iterable[tuple[int, CreateUserSchema | Exception]],
+    session: Session,
+    batch_size: int = PROVISIONING_BATCH_SIZE
+) -> ProvisioningReport:
+    """Create many students/instructors; failing records are reported by their index and never abort the rest."""
+    provisioning = _Provisioning(session)
+    for batch in _batches(users, batch_size):
+        provisioning.run_batch(batch)
+    return ProvisioningReport(
+        received=provisioning.received,
+        created=provisioning.created,
+        failed=len(provisioning.errors),
+        errors=sorted(provisioning.errors, key=lambda error: error.index),
+    )
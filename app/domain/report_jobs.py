@@ -0,0 +1,240 @@
+"""Heavy instructor reports, run by a local worker pool instead of inside the request.
+
+`POST /api/jobs` only writes a `report_job` row. Once that commits, the job id goes to the pool. A
+worker claims the row (queued -> running), pages through the same repo queries the routes use,
+records its progress on the row after every page and writes the report under `REPORT_DIR`.
+`GET /api/jobs/{id}` polls the row. There is no broker: the table is the queue, and jobs still
+queued when a process stops are picked up again by the next start. A job left running by a stopped
+process stops recording progress: once its heartbeat is `REPORT_JOB_STALE_AFTER` old, the next start
+or job marks it failed. Reports are deleted `REPORT_RETENTION` after they were written.
+
+`REPORT_JOB_EXECUTOR` picks threads (the default: SQLite releases the GIL while it works) or
+spawned processes, each with its own engines, when formatting is what makes reports slow.
+"""
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from glob import glob
+from typing import Any, Callable, TextIO
+
+import orjson
+from fastapi import HTTPException
+
+from app import metrics
+from app.api.streaming import csv_safe_row
+from app.data.database import Intent
+from app.data.instructor_repo import InstructorRepo
+from app.data.models import GRADE_LIST_FIELDS, JobStatus, ReportJob
+from app.data.report_job_repo import ReportJobRepo
+from app.data.schemas import ReportJobRequest
+from app.data.unit_of_work import UnitOfWork
+from app.domain import instructor_service
+from app.domain.exceptions import ReportExpired, ReportJobNotFound, ReportNotReady
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_EXECUTOR = os.getenv("REPORT_JOB_EXECUTOR", "thread")  # thread | process
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "2"))
+REPORT_DIR = os.getenv("REPORT_DIR", "reports")
+# grade rows read per keyset page, the job's progress is recorded after each
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "5000"))
+# seconds without progress after which a running job is taken for one whose process stopped
+REPORT_JOB_STALE_AFTER = float(os.getenv("REPORT_JOB_STALE_AFTER", "300"))
+# seconds a written report is kept
+REPORT_RETENTION = float(os.getenv("REPORT_RETENTION", str(7 * 86400)))
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", "json": "application/json"}
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if REPORT_JOB_EXECUTOR == "process":
+                # spawn, like the bulk hashing pool: forking a process that runs the event loop is not safe
+                _executor = ProcessPoolExecutor(max_workers=REPORT_JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _executor = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix="report-job")
+        return _executor
+
+
+def submit(job_id: int):
+    _get_executor().submit(run_job, job_id)
+
+
+def resume_queued_jobs() -> int:
+    """Submit the jobs left queued by a stopped process; the claim keeps a job from running twice."""
+    with UnitOfWork() as work:
+        job_ids = ReportJobRepo(work.session).queued_job_ids()
+    for job_id in job_ids:
+        submit(job_id)
+    return len(job_ids)
+
+
+def fail_interrupted_jobs() -> int:
+    """Fail the running jobs whose worker stopped recording progress; nothing would ever finish them."""
+    heartbeat_before = datetime.now() - timedelta(seconds=REPORT_JOB_STALE_AFTER)
+    with UnitOfWork() as work:
+        job_ids = ReportJobRepo(work.session).fail_stale_jobs(heartbeat_before, "Interrupted: the process running the job stopped")
+    for job_id in job_ids:
+        logger.warning("Report job %d was interrupted, marked failed", job_id)
+    return len(job_ids)
+
+
+def expire_reports() -> int:
+    """Delete the reports older than REPORT_RETENTION, and leftovers of jobs that died writing; returns how many."""
+    cutoff = time.time() - REPORT_RETENTION
+    with UnitOfWork() as work:
+        paths = ReportJobRepo(work.session).expire_results(datetime.fromtimestamp(cutoff))
+    # after the commit: no job points at a file about to go
+    removed = 0
+    for path in {*paths, *glob(os.path.join(REPORT_DIR, "report-*"))}:
+        try:
+            if path in paths or os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info("Deleted %d expired reports", removed)
+    return removed
+
+
+def shutdown():
+    # jobs not started yet stay queued in the table, running ones are abandoned with the process and
+    # failed by the next start once their heartbeat is stale
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def enqueue(data: ReportJobRequest, repo: ReportJobRepo, instructor_id: int | None = None) -> ReportJob:
+    if data.kind == "grades":
+        params = {"file_format": data.format}
+    else:
+        params = {"n": data.n, "subject": data.subject}
+    job = repo.create_job(data.kind, json.dumps(params), instructor_id)
+    job_id = job.id
+    # the worker must find the row committed
+    repo.after_commit(lambda: submit(job_id))
+    return job
+
+
+def job_status(job: ReportJob) -> dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result_url": f"/api/jobs/{job.id}/result" if job.status == JobStatus.SUCCEEDED else None,
+    }
+
+
+def get_job(repo: ReportJobRepo, job_id: int) -> ReportJob:
+    job = repo.get_job(job_id)
+    if job is None:
+        raise ReportJobNotFound()
+    return job
+
+
+def get_result(repo: ReportJobRepo, job_id: int) -> tuple[str, str]:
+    """Path and media type of a succeeded job's report."""
+    job = get_job(repo, job_id)
+    if job.status != JobStatus.SUCCEEDED:
+        raise ReportNotReady()
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise ReportExpired()
+    return job.result_path, MEDIA_TYPES[job.result_path.rsplit(".", 1)[-1]]
+
+
+def _set_progress(job_id: int, progress: int, total: int | None = None):
+    # a transaction of its own per page, so that polls see it while the job runs
+    with UnitOfWork() as work:
+        ReportJobRepo(work.session).set_progress(job_id, progress, total)
+
+
+def _grade_writer(out: TextIO, file_format: str) -> Callable[[list], None]:
+    if file_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(GRADE_LIST_FIELDS)
+        return lambda rows: writer.writerows(csv_safe_row(row) for row in rows)
+    to_dict = instructor_service.grade_row_formatter(GRADE_LIST_FIELDS)
+    return lambda rows: out.writelines(orjson.dumps(to_dict(row)).decode() + "\n" for row in rows)
+
+
+def _grades_report(job_id: int, out: TextIO, file_format: str = "csv") -> int:
+    written = 0
+    with UnitOfWork(Intent.READ) as work:
+        repo = InstructorRepo(work.session)
+        _set_progress(job_id, 0, repo.count_grades())
+        write = _grade_writer(out, file_format)
+        for page in instructor_service.grade_pages(repo, work.session, REPORT_PAGE_SIZE):
+            write(page)
+            written += len(page)
+            _set_progress(job_id, written)
+    return written
+
+
+def _top_students_report(job_id: int, out: TextIO, n: int, subject: str | None = None) -> int:
+    with UnitOfWork(Intent.READ) as work:
+        try:
+            ranked = instructor_service.get_top_students(InstructorRepo(work.session), n=n, subject=subject)
+        except HTTPException:
+            ranked = []  # 204: no grades yet
+    out.write(orjson.dumps(ranked).decode())
+    return len(ranked)
+
+
+# kind -> (report function, file extension from its params)
+REPORTS: dict[str, tuple[Callable[..., int], Callable[[dict], str]]] = {
+    "grades": (_grades_report, lambda params: params["file_format"]),
+    "top_students": (_top_students_report, lambda params: "json"),
+}
+
+
+def run_job(job_id: int):
+    """Claim and run one job; runs on a pool worker."""
+    with UnitOfWork() as work:
+        job = ReportJobRepo(work.session).claim_job(job_id)
+        if job is None:
+            return
+        kind, params = job.kind, json.loads(job.params)
+    report, extension = REPORTS[kind]
+    started = time.perf_counter()
+    path = os.path.abspath(os.path.join(REPORT_DIR, f"report-{job_id}.{extension(params)}"))
+    try:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        # written aside and renamed: a result_path always names a complete report
+        with open(f"{path}.part", "w", encoding="utf-8", newline="") as out:
+            rows = report(job_id, out, **params)
+        os.replace(f"{path}.part", path)
+    except Exception as e:
+        logger.exception("Report job %d (%s) failed", job_id, kind)
+        with UnitOfWork() as work:
+            ReportJobRepo(work.session).fail_job(job_id, f"{type(e).__name__}: {e}")
+        metrics.report_jobs.inc(kind, JobStatus.FAILED.value)
+    else:
+        with UnitOfWork() as work:
+            ReportJobRepo(work.session).finish_job(job_id, rows, path)
+        metrics.report_jobs.inc(kind, JobStatus.SUCCEEDED.value)
+        metrics.report_job_duration.observe(time.perf_counter() - started, kind)
+        logger.info("Report job %d (%s) wrote %d rows to %s", job_id, kind, rows, path)
+    # housekeeping for long-lived processes, which don't restart often enough to rely on the start
+    fail_interrupted_jobs()
+    expire_reports()
@@ -1,11 +1,15 @@
-from typing import Any
+from typing import Any, Iterator, Sequence
 
 from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
 
-from app.data.models import Student
-from app.data.student_repo import AbstractRepo
+from app.auth.principal_cache import principal_cache
+from app.data import grade_audit
+from app.data.models import GRADE_FIELDS, PUBLIC_USER_FIELDS, Student
+from app.data.student_repo import AbstractRepo, search_match
 from app.data.schemas import CreateUserSchema, UpdateUserSchema
-from app.domain.exceptions import StudentNotFound
+from app.domain import analytics
+from app.domain.exceptions import EmailTaken, StudentNotFound
 
 
 def create_student(
@@ -16,33 +20,73 @@ def create_student(
     return user
 
 
-def get_students(user_repo: AbstractRepo) -> list[dict[str, Any]]:
-    students = user_repo.get_all_students()
-    return [dict(student) for student in students]
+def get_students(user_repo: AbstractRepo, after_id: int | None = None, limit: int | None = None,
+                 fields: Sequence[str] = PUBLIC_USER_FIELDS) -> list[dict[str, Any]]:
+    students = user_repo.get_all_students(after_id=after_id, limit=limit, fields=fields)
+    return [dict(zip(fields, student)) for student in students]
+
+
+def stream_students(user_repo: AbstractRepo, after_id: int | None = None,
+                    fields: Sequence[str] = PUBLIC_USER_FIELDS) -> Iterator[dict[str, Any]]:
+    for student in user_repo.stream_all_students(after_id=after_id, fields=fields):
+        yield dict(zip(fields, student))
+
+
+def search_students(user_repo: AbstractRepo, text: str, offset: int = 0, limit: int | None = None,
+                    fields: Sequence[str] = PUBLIC_USER_FIELDS) -> list[dict[str, Any]]:
+    match = search_match(text)
+    if match is None:
+        return []
+    return [dict(zip(fields, student)) for student in user_repo.search_students(match, offset=offset, limit=limit, fields=fields)]
 
 
 def get_student(student_id: int, user_repo: AbstractRepo) -> Student:
-    user = user_repo.get_student_by_id(user_id=student_id)
+    user = user_repo.get_student_by_id(student_id)
     if not user:
         raise StudentNotFound(title="Not Found", message=f"Student with id {student_id} not found")
     return user
 
 
+def get_student_fields(student_id: int, user_repo: AbstractRepo, fields: Sequence[str] = PUBLIC_USER_FIELDS) -> dict[str, Any]:
+    row = user_repo.get_student_row(student_id, fields)
+    if row is None:
+        raise StudentNotFound(title="Not Found", message=f"Student with id {student_id} not found")
+    return dict(zip(fields, row))
+
+
 def update_student(
     student_id: int,
     data: UpdateUserSchema,
     repo: AbstractRepo
 ) -> Student:
-    user = repo.update_student(user_id=student_id, data=data)
+    try:
+        user = repo.update_student(student_id, data)
+    except IntegrityError:
+        # email is the only unique column an update can write
+        raise EmailTaken
     if not user:
         raise StudentNotFound
+    # once committed: a request resolving the principal before that would cache the old row again
+    repo.after_commit(lambda: principal_cache.invalidate("Student", student_id))
     return user
 
 
-def delete_student(student_id: int, repo: AbstractRepo):
-    has_been_deleted = repo.delete_student(user_id=student_id)
+def delete_student(student_id: int, repo: AbstractRepo, instructor_id: int | None = None):
+    has_been_deleted = repo.delete_student(student_id)
     if not has_been_deleted:
         raise StudentNotFound
+    # the grade goes with its student: SQLite hands the freed rowid to the next student, who would inherit it
+    grade = repo.delete_grade(student_id)
+    change = grade_audit.grade_change(student_id, grade_audit.marks(grade), None, instructor_id) if grade else None
+    grade_id = grade.id if grade else None
+
+    def committed():
+        principal_cache.invalidate("Student", student_id)
+        if change is not None:
+            analytics.grade_snapshot.remove(grade_id)
+            grade_audit.audit_writer.record(change)
+
+    repo.after_commit(committed)
 
 def get_my_grades(student_id: int, repo: AbstractRepo):
     grade = repo.get_my_grades(student_id)
@@ -52,4 +96,24 @@ def get_my_grades(student_id: int, repo: AbstractRepo):
                 details = "No Content was Found",
                 headers = {"WWW-Authenticate":"Bearer"}
             )
-    return grade
\ No newline at end of file
+    return grade
+
+
+async def get_my_grades_async(student_id: int, repo: AbstractRepo):
+    grade = await repo.get_my_grades(student_id)
+    if not grade:
+        raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No grades found for this student"
+            )
+    return grade
+
+
+async def get_my_grade_fields_async(student_id: int, repo: AbstractRepo, fields: Sequence[str] = GRADE_FIELDS) -> dict[str, Any]:
+    row = await repo.get_my_grade_row(student_id, fields)
+    if row is None:
+        raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No grades found for this student"
+            )
+    return dict(zip(fields, row))
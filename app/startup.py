@@ -0,0 +1,193 @@
+"""Process startup, run once per worker from the FastAPI lifespan (see `create_app`).
+
+Instead of `create_all` on every start, the schema check is a single `PRAGMA user_version` read;
+pending migrations only run when the database is behind. The rest warms what the first requests
+would otherwise pay for: pooled connections (and their pragmas), the compiled SQL of the hot repo
+reads, the bcrypt backend of the password context, the route handlers and the thread pool.
+"""
+import logging
+import os
+import time
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+
+from fastapi import FastAPI, HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import NoMatchFound
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import metrics
+from app.auth.dependencies import AsyncUserRepository, UserRepository, password_executor, pwd_context
+from app.data.database import (
+    DB_POOL_SIZE, async_engine, async_read_engines, engine, log_effective_pragmas, read_engines,
+)
+from app.data.grade_audit import audit_writer
+from app.data.instructor_repo import AsyncInstructorRepo, InstructorRepo
+from app.data.migrations import LATEST_VERSION, get_schema_version, migrate
+from app.data.student_repo import AsyncStudentRepo, StudentRepo
+from app.domain import report_jobs
+
+logger = logging.getLogger(__name__)
+
+# apply pending migrations at startup; when off, a database that is behind refuses to start
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "1").lower() in ("1", "true", "yes")
+# connections opened per engine before the first request, capped by the pool size
+STARTUP_WARM_CONNECTIONS = int(os.getenv("STARTUP_WARM_CONNECTIONS", str(DB_POOL_SIZE)))
+
+# ids start at 1, the warmup reads match no row
+_NO_ID = 0
+
+
+def check_schema(db_engine: Engine) -> int:
+    """Return the schema version, migrating first if the database is behind this build."""
+    with db_engine.connect() as connection:
+        version = get_schema_version(connection)
+    if version == LATEST_VERSION:
+        return version
+    if version > LATEST_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this build ({LATEST_VERSION})")
+    if not SCHEMA_AUTO_MIGRATE:
+        raise RuntimeError(
+            f"Database schema version {version} is behind {LATEST_VERSION}, run `python -m app.data.migrations`"
+        )
+    return migrate(db_engine)
+
+
+def _warm_count(db_engine: Engine, count: int) -> int:
+    # in-memory SQLite pools hold a single connection
+    return min(count, db_engine.pool.size()) if isinstance(db_engine.pool, QueuePool) else 1
+
+
+def warm_pool(db_engine: Engine, count: int = STARTUP_WARM_CONNECTIONS) -> int:
+    """Open `count` connections at once, then hand them all back to the pool."""
+    count = _warm_count(db_engine, count)
+    with ExitStack() as stack:
+        for _ in range(count):
+            stack.enter_context(db_engine.connect())
+    return count
+
+
+async def warm_async_pool(db_engine: AsyncEngine, count: int = STARTUP_WARM_CONNECTIONS) -> int:
+    count = _warm_count(db_engine.sync_engine, count)
+    async with AsyncExitStack() as stack:
+        for _ in range(count):
+            await stack.enter_async_context(db_engine.connect())
+    return count
+
+
+def precompile_statements(db_engine: Engine) -> int:
+    """Run the hot repo reads once with keys that match nothing, which leaves their SQL in the compiled cache.
+
+    The cache is per engine, the read engines are warmed the same way.
+    """
+    with Session(db_engine) as session:
+        users, students, instructors = UserRepository(session), StudentRepo(session), InstructorRepo(session)
+        reads = [
+            lambda: users.get_student_by_name(""),
+            lambda: users.get_instructor_by_name(""),
+            lambda: students.get_student_by_id(_NO_ID),
+            lambda: students.get_all_students(after_id=_NO_ID, limit=1),
+            lambda: instructors.get_instructor_by_id(_NO_ID),
+            lambda: instructors.get_all_instructors(after_id=_NO_ID, limit=1),
+            lambda: instructors.get_top_students(n=1),
+            lambda: instructors.view_grades(session, after_id=_NO_ID, limit=1),
+        ]
+        for read in reads:
+            try:
+                read()
+            except HTTPException:
+                # view_grades answers an empty table with 204
+                pass
+    return len(reads)
+
+
+async def precompile_async_statements(db_engine: AsyncEngine) -> int:
+    async with AsyncSession(db_engine, expire_on_commit=False) as session:
+        users, students, instructors = AsyncUserRepository(session), AsyncStudentRepo(session), AsyncInstructorRepo(session)
+        reads = [
+            users.get_student_by_name(""),
+            users.get_instructor_by_name(""),
+            students.get_student_by_id(_NO_ID),
+            students.get_all_students(after_id=_NO_ID, limit=1),
+            students.get_my_grades(_NO_ID),
+            instructors.get_instructor_by_id(_NO_ID),
+            instructors.get_all_instructors(after_id=_NO_ID, limit=1),
+            instructors.view_grades(after_id=_NO_ID, limit=1),
+        ]
+        for read in reads:
+            await read
+    return len(reads)
+
+
+def warm_password_hashing():
+    # loads and self-tests the bcrypt backend (tens of ms) on a hashing thread, instead of in the first login
+    password_executor.submit(pwd_context.handler().get_backend).result()
+
+
+def build_routes(app: FastAPI):
+    # FastAPI builds the handlers of included routers on first use, a lookup that misses builds them all
+    try:
+        app.url_path_for("__startup__")
+    except NoMatchFound:
+        pass
+
+
+class _Phases(dict):
+    @contextmanager
+    def timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[name] = time.perf_counter() - started
+
+
+async def warm_up(app: FastAPI) -> dict[str, float]:
+    """Schema check and warmup, returns the seconds spent per phase."""
+    phases = _Phases()
+    with phases.timed("schema"):
+        version = check_schema(engine)
+    with phases.timed("pool"):
+        connections = warm_pool(engine) + await warm_async_pool(async_engine)
+        for read_engine, async_read_engine in zip(read_engines, async_read_engines):
+            connections += warm_pool(read_engine) + await warm_async_pool(async_read_engine)
+    with phases.timed("statements"):
+        statements = precompile_statements(engine) + await precompile_async_statements(async_engine)
+        for read_engine, async_read_engine in zip(read_engines, async_read_engines):
+            statements += precompile_statements(read_engine) + await precompile_async_statements(async_read_engine)
+    with phases.timed("passwords"):
+        warm_password_hashing()
+    with phases.timed("routes"):
+        build_routes(app)
+        # imports the thread pool backend and starts a worker for the sync routes
+        await run_in_threadpool(lambda: None)
+
+    total = sum(phases.values())
+    metrics.app_startup_duration.set(total)
+    logger.info(
+        "Started in %.1f ms: schema v%d, %d connections, %d statements (%s)", total * 1000, version, connections,
+        statements, ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in phases.items()),
+    )
+    for db_engine in (engine, *read_engines):
+        log_effective_pragmas(db_engine)
+    return dict(phases)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up(app)
+    audit_writer.start()
+    await run_in_threadpool(report_jobs.fail_interrupted_jobs)
+    await run_in_threadpool(report_jobs.expire_reports)
+    resumed = await run_in_threadpool(report_jobs.resume_queued_jobs)
+    if resumed:
+        logger.info("Resumed %d queued report jobs", resumed)
+    try:
+        yield
+    finally:
+        report_jobs.shutdown()
+        # writes (or spools) the grade changes still queued
+        await run_in_threadpool(audit_writer.stop)
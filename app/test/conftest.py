@@ -0,0 +1,81 @@
+import os
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+# Point the engines at a throwaway database before app.data.database is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'school.db')}")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("GRADE_AUDIT_SPOOL_DIR", tempfile.mkdtemp())
+os.environ.setdefault("REPORT_DIR", tempfile.mkdtemp())
+
+from sqlmodel import Session, SQLModel
+from starlette.testclient import TestClient
+
+from app import create_app
+from app.api import api
+from app.api.response_cache import response_cache
+from app.auth import auth_routes
+from app.auth.dependencies import hash_password
+from app.auth.principal_cache import principal_cache
+from app.auth.token import create_access_token
+from app.data.database import engine
+from app.data.grade_audit import audit_writer
+from app.data.migrations import migrate
+from app.data.models import Instructor, Student
+from app.domain.analytics import grade_snapshot
+
+
+@pytest.fixture
+def db():
+    # grade changes recorded by the previous test go to its database, not this one
+    audit_writer.flush()
+    SQLModel.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA user_version = 0")
+    migrate(engine)
+    principal_cache.clear()
+    response_cache.clear()
+    grade_snapshot.invalidate()
+    yield engine
+
+
+@pytest.fixture
+def client(db):
+    app = create_app()
+    app.include_router(api.router)
+    app.include_router(auth_routes.router)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def make_user(model, user_name: str, password: str = "secret"):
+    with Session(engine) as session:
+        user = model(
+            userName=user_name,
+            firstName=user_name.title(),
+            lastName="Doe",
+            email=f"{user_name}@school.test",
+            dateOfBirth=date(2000, 1, 1),
+            hashed_password=hash_password(password),
+        )
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        return user
+
+
+def bearer(user) -> dict[str, str]:
+    token = create_access_token({"uid": user.id, "username": user.userName, "role": user.userRole}, timedelta(minutes=5))
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def instructor(db):
+    return make_user(Instructor, "teacher")
+
+
+@pytest.fixture
+def student(db):
+    return make_user(Student, "pupil")
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from app.data.models import Student
+from app.domain.analytics import grade_snapshot, summarize
+from app.test.conftest import bearer, make_user
+
+
+def test_summarize_matches_numpy_reference():
+    marks = np.array([[10, 12, 14, 16, 18], [20, 0, 10, 5, 15], [8, 8, 8, 8, 9]], dtype=np.int8)
+
+    stats = summarize(marks)
+
+    assert stats["count"] == 3
+    assert stats["subjects"]["pure_maths"]["mean"] == pytest.approx(38 / 3)
+    assert stats["subjects"]["physics"]["percentiles"]["p50"] == 15
+    assert stats["subjects"]["chemistry"]["histogram"][8] == 1
+    assert stats["correlation"]["biology"]["biology"] == pytest.approx(1.0)
+    for column, subject in enumerate(["pure_maths", "chemistry", "biology", "computer_science", "physics"]):
+        reference = marks[:, column].astype(float)
+        assert stats["subjects"][subject]["std"] == pytest.approx(reference.std())
+        assert list(stats["subjects"][subject]["percentiles"].values()) == pytest.approx(np.percentile(reference, [10, 25, 50, 75, 90]))
+    assert stats["correlation"]["pure_maths"]["chemistry"] == pytest.approx(np.corrcoef(marks.T.astype(float))[0, 1])
+    assert stats["average"]["percentiles"]["p90"] == pytest.approx(np.percentile(marks.mean(axis=1), 90))
+
+
+def test_analytics_endpoint_follows_grade_writes(client, instructor):
+    headers = bearer(instructor)
+    pupil = make_user(Student, "pupil")
+    body = {"student_id": pupil.id, "pure_maths": 10, "chemistry": 10, "biology": 10, "computer_science": 10, "physics": 10}
+
+    client.put("/api/students/grades/update-Add", params={"student_id": pupil.id}, headers=headers, json=body)
+    assert client.get("/api/analytics/grades", headers=headers).json()["subjects"]["physics"]["mean"] == 10
+
+    # applied to the loaded snapshot in place, no reload needed
+    client.put("/api/students/grades/update-Add", params={"student_id": pupil.id}, headers=headers, json={**body, "physics": 20})
+    assert grade_snapshot.is_fresh()
+    assert client.get("/api/analytics/grades", headers=headers).json()["subjects"]["physics"]["mean"] == 20
+
+    # and so is a grade deleted with its student
+    other = make_user(Student, "other")
+    client.put("/api/students/grades/update-Add", params={"student_id": other.id}, headers=headers,
+               json={**body, "student_id": other.id, "physics": 16})
+    assert client.get("/api/analytics/grades", headers=headers).json()["subjects"]["physics"]["mean"] == 18
+    client.delete(f"/api/students/{pupil.id}", headers=headers)
+    assert grade_snapshot.is_fresh()
+    assert client.get("/api/analytics/grades", headers=headers).json()["subjects"]["physics"]["mean"] == 16
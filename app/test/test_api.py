@@ -1,22 +1,27 @@
-from starlette.testclient import TestClient
+from app.data.models import Instructor, Student
+from app.test.conftest import bearer, make_user
 
-import sys
-import os
 
-# Add the project's root directory to sys.path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+def test_get_students(client, instructor, student):
+    response = client.get("/api/students", headers=bearer(instructor))
+    assert response.status_code == 200
+    assert [row["userName"] for row in response.json()["students"]] == [student.userName]
 
-from app import create_app
 
-app = create_app()
+def test_get_students_needs_a_token(client, db):
+    assert client.get("/api/students").status_code == 401
 
-client = TestClient(app)
 
-def test_get_students():
-    response = client.get("/api/students")
-    print(dir(response))
-    print(response.status_code)
-    print(response.text)
-    assert response.status_code == 200
+def test_update_keeps_what_it_leaves_out_and_refuses_a_taken_email(client, instructor, student):
+    other = make_user(Student, "other")
+    body = {"firstName": "Renamed", "lastName": None, "email": None, "dateOfBirth": None}
+    response = client.put(f"/api/students/{student.id}", json=body, headers=bearer(instructor))
+    assert response.status_code == 200, response.text
+    assert response.json()["firstName"] == "Renamed" and response.json()["email"] == student.email
 
-test_get_students()
\ No newline at end of file
+    response = client.put(f"/api/students/{student.id}", json={**body, "email": other.email}, headers=bearer(instructor))
+    assert response.status_code == 409
+    assert response.json()["error_body"]["message"] == "Another user already has this email"
+    colleague = make_user(Instructor, "colleague")
+    response = client.put(f"/api/instructor/{instructor.id}", json={**body, "email": colleague.email}, headers=bearer(instructor))
+    assert response.status_code == 409
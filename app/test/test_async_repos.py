@@ -0,0 +1,124 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlmodel import Session
+
+from app.api.dependencies import commit_unit_of_work, get_async_session, get_async_unit_of_work, get_unit_of_work
+from app.data.database import Intent, async_engine, async_session_scope
+from app.data.instructor_repo import AsyncInstructorRepo
+from app.data.models import Grade, Instructor, Student
+from app.data.schemas import GradeSchema, UpdateUserSchema
+from app.data.student_repo import AsyncStudentRepo
+from app.data.unit_of_work import AsyncUnitOfWork
+
+MARKS = {"pure_maths": 10, "chemistry": 11, "biology": 12, "computer_science": 13, "physics": 14}
+
+
+def new_user(name: str, role: str) -> dict:
+    # what the services hand the repos: the password already hashed
+    return {"userName": name, "firstName": name.title(), "lastName": "Doe", "email": f"{name}@school.test",
+            "dateOfBirth": date(2000, 1, 1), "hashed_password": "x", "userRole": role}
+
+
+def checked_out() -> int:
+    return async_engine.sync_engine.pool.checkedout()
+
+
+def test_student_round_trip_through_the_async_repo(db):
+    async def scenario():
+        async with AsyncUnitOfWork() as work:
+            student = await AsyncStudentRepo(await work.session()).create_student(new_user("ada", "Student"))
+            student_id = student.id
+
+        async with AsyncUnitOfWork(Intent.READ) as work:
+            repo = AsyncStudentRepo(await work.session())
+            assert (await repo.get_student_by_id(student_id)).userName == "ada"
+            assert [row[0] for row in await repo.get_all_students(fields=("userName",))] == ["ada"]
+
+        async with AsyncUnitOfWork() as work:
+            repo = AsyncStudentRepo(await work.session())
+            update = UpdateUserSchema(firstName="Augusta", lastName="King", email="ada@school.test", dateOfBirth=date(1815, 12, 10))
+            assert (await repo.update_student(student_id, update)).firstName == "Augusta"
+            assert await repo.update_student(999999, update) is None
+        return student_id
+
+    student_id = asyncio.run(scenario())
+    with Session(db) as session:
+        assert session.get(Student, student_id).lastName == "King"
+
+    async def delete():
+        async with AsyncUnitOfWork() as work:
+            repo = AsyncStudentRepo(await work.session())
+            return await repo.delete_student(student_id), await repo.delete_student(student_id)
+
+    assert asyncio.run(delete()) == (True, False)
+    with Session(db) as session:
+        assert session.get(Student, student_id) is None
+
+
+def test_instructor_and_grades_through_the_async_repo(db):
+    async def scenario():
+        async with AsyncUnitOfWork() as work:
+            session = await work.session()
+            instructor = await AsyncInstructorRepo(session).create_instructor(new_user("grace", "Instructor"))
+            student = await AsyncStudentRepo(session).create_student(new_user("alan", "Student"))
+            repo = AsyncInstructorRepo(session)
+            await repo.add_new_grade(GradeSchema(student_id=student.id, **MARKS))
+            assert (await repo.update_grade(student.id, GradeSchema(student_id=student.id, **{**MARKS, "physics": 20}))).physics == 20
+            ids = instructor.id, student.id
+
+        async with AsyncUnitOfWork(Intent.READ) as work:
+            repo = AsyncInstructorRepo(await work.session())
+            assert (await repo.get_instructor_by_id(ids[0])).userName == "grace"
+            assert await repo.get_grade_marks([ids[1]]) == {ids[1]: (10, 11, 12, 13, 20)}
+            assert [row.userName for row in await repo.view_grades()] == ["alan"]
+            assert [row.physics async for row in repo.stream_grades()] == [20]
+            assert [row.id for row in await repo.get_top_students(n=1)] == [ids[1]]
+        return ids
+
+    instructor_id, student_id = asyncio.run(scenario())
+    with Session(db) as session:
+        assert session.get(Instructor, instructor_id).userName == "grace"
+        assert session.get(Grade, 1).student_id == student_id
+
+
+def test_async_session_scope_rolls_back_and_returns_its_connection(db):
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async with async_session_scope() as session:
+                await AsyncStudentRepo(session).create_student(new_user("lost", "Student"))
+                assert checked_out() == 1
+                raise RuntimeError("nothing commits")
+        assert checked_out() == 0
+
+    asyncio.run(scenario())
+    with Session(db) as session:
+        assert session.query(Student).count() == 0
+
+
+def test_async_session_dependency_commits_once_the_route_returns(db):
+    async def request():
+        work_dependency = get_async_unit_of_work(Intent.WRITE)
+        sync_dependency = get_unit_of_work(Intent.WRITE)
+        async_work, work = await work_dependency.__anext__(), await sync_dependency.__anext__()
+        committing = commit_unit_of_work(work, async_work)
+        await committing.__anext__()
+
+        # the route: the session opens on first use
+        assert checked_out() == 0
+        session = await get_async_session(async_work)
+        assert await get_async_session(async_work) is session
+        student = await AsyncStudentRepo(session).create_student(new_user("eve", "Student"))
+
+        with pytest.raises(StopAsyncIteration):
+            await committing.__anext__()
+        for dependency in (work_dependency, sync_dependency):
+            with pytest.raises(StopAsyncIteration):
+                await dependency.__anext__()
+        assert checked_out() == 0
+        return student.id
+
+    student_id = asyncio.run(request())
+    with Session(db) as session:
+        assert session.get(Student, student_id).userName == "eve"
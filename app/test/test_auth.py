@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from passlib.context import CryptContext
+from sqlmodel import Session
+
+from app.auth.token import create_access_token
+from app.data.database import engine
+from app.data.models import Instructor, Student
+from app.test.conftest import make_user
+
+
+def test_login_rehashes_password_when_cost_changes(client, instructor):
+    with Session(engine) as session:
+        stored = session.get(Instructor, instructor.id)
+        stored.hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("secret")
+        session.add(stored)
+        session.commit()
+
+    response = client.post("/auth/instructor", data={"username": "teacher", "password": "secret"})
+    assert response.status_code == 200
+
+    with Session(engine) as session:
+        assert session.get(Instructor, instructor.id).hashed_password.startswith("$2b$04$")
+
+
+def test_login_rejects_wrong_password(client, instructor):
+    response = client.post("/auth/instructor", data={"username": "teacher", "password": "nope"})
+    assert response.status_code == 401
+
+
+def test_a_student_token_is_not_an_instructor_token_even_for_the_same_name(client, db):
+    make_user(Instructor, "sam")
+    make_user(Student, "sam")
+    token = client.post("/auth/students", data={"username": "sam", "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/students", headers=headers).status_code == 404
+    # still a valid student token (the student has no grades yet, hence no 200)
+    assert client.get("/api/my-grades", params={"student_name": "sam"}, headers=headers).status_code != 401
+    # a token without the user id (issued before it was added) names nobody
+    legacy = create_access_token({"username": "sam", "role": "Instructor"}, timedelta(minutes=5))
+    assert client.get("/api/students", headers={"Authorization": f"Bearer {legacy}"}).status_code == 404
@@ -0,0 +1,91 @@
+from sqlmodel import Session
+
+from app.data.models import Grade, Instructor, Student
+from app.domain import batch
+from app.test.conftest import bearer, make_user
+
+MARKS = {"pure_maths": 10, "chemistry": 11, "biology": 12, "computer_science": 13, "physics": 14}
+
+
+def update(student: Student, first_name: str) -> dict:
+    return {"firstName": first_name, "lastName": "Doe", "email": student.email, "dateOfBirth": "2000-01-01"}
+
+
+def run(client, instructor, operations, atomic=True):
+    response = client.post("/api/batch", json={"operations": operations, "atomic": atomic}, headers=bearer(instructor))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_operations_run_in_order_and_answer_like_their_routes(client, db, instructor, student):
+    other = make_user(Student, "other")
+    report = run(client, instructor, [
+        {"op": "update_student", "id": student.id, "data": update(student, "Renamed")},
+        {"op": "get_student", "id": student.id},
+        {"op": "update_grade", "id": student.id, "data": MARKS},
+        {"op": "update_grade", "id": student.id, "data": {**MARKS, "physics": 20}},
+        {"op": "delete_student", "id": other.id},
+        {"op": "get_instructor", "id": instructor.id},
+    ])
+
+    assert report["committed"] and report["failed"] == 0
+    assert [result["status"] for result in report["results"]] == [200, 200, 200, 200, 204, 200]
+    assert report["results"][1]["body"] == client.get(f"/api/students/{student.id}", headers=bearer(instructor)).json()
+    assert report["results"][1]["body"]["firstName"] == "Renamed"
+    assert report["results"][3]["body"]["physics"] == 20
+    with Session(db) as session:
+        assert session.get(Student, other.id) is None
+        assert session.get(Grade, report["results"][3]["body"]["id"]).physics == 20
+
+
+def test_a_taken_email_is_reported_as_such(client, db, instructor, student):
+    other = make_user(Student, "other")
+    report = run(client, instructor, [
+        {"op": "update_student", "id": student.id, "data": {**update(student, "Renamed"), "email": other.email}},
+    ], atomic=False)
+
+    assert report["results"][0]["status"] == 409
+    assert report["results"][0]["body"]["error_body"]["message"] == "Another user already has this email"
+
+
+def test_atomic_batch_rolls_everything_back(client, db, instructor, student):
+    report = run(client, instructor, [
+        {"op": "update_student", "id": student.id, "data": update(student, "Lost")},
+        {"op": "update_grade", "id": student.id, "data": MARKS},
+        {"op": "delete_instructor", "id": 999999},
+        {"op": "get_student", "id": student.id},
+    ])
+
+    assert not report["committed"]
+    assert [result["status"] for result in report["results"]] == [200, 200, 404, batch.SKIPPED]
+    assert report["results"][2]["body"]["error_body"]["title"] == "Not Found"
+    with Session(db) as session:
+        assert session.get(Student, student.id).firstName == student.firstName
+        assert session.get(Instructor, instructor.id) is not None
+        assert session.query(Grade).count() == 0
+
+
+def test_best_effort_batch_keeps_what_succeeded(client, db, instructor, student):
+    other = make_user(Student, "other")
+    report = run(client, instructor, [
+        {"op": "update_student", "id": student.id, "data": update(student, "Kept")},
+        # e-mail taken by the other student: this update alone is undone
+        {"op": "update_student", "id": other.id, "data": {**update(other, "Clash"), "email": student.email}},
+        {"op": "update_grade", "id": other.id, "data": {**MARKS, "physics": 21}},
+        {"op": "update_grade", "id": other.id, "data": MARKS},
+    ], atomic=False)
+
+    assert report["committed"] and (report["succeeded"], report["failed"]) == (2, 2)
+    assert [result["status"] for result in report["results"]] == [200, 409, 422, 200]
+    with Session(db) as session:
+        assert session.get(Student, student.id).firstName == "Kept"
+        assert session.get(Student, other.id).firstName == other.firstName
+
+
+def test_batch_needs_an_instructor_and_is_bounded(client, db, instructor, student, monkeypatch):
+    operations = [{"op": "get_student", "id": student.id}] * 3
+    assert client.post("/api/batch", json={"operations": operations}, headers=bearer(student)).status_code == 404
+    assert client.post("/api/batch", json={"operations": [{"op": "drop_table", "id": 1}]}, headers=bearer(instructor)).status_code == 422
+
+    monkeypatch.setattr(batch, "BATCH_MAX_OPERATIONS", 2)
+    assert client.post("/api/batch", json={"operations": operations}, headers=bearer(instructor)).status_code == 413
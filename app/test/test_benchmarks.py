@@ -0,0 +1,32 @@
+import sqlite3
+
+from benchmarks.compare import compare
+from benchmarks.harness import Benchmark, measure
+from benchmarks.seed import seed
+
+
+def test_seed_builds_a_migrated_database(tmp_path):
+    path = str(tmp_path / "bench.db")
+    report = seed(path, students=200, instructors=3, graded=0.5)
+
+    connection = sqlite3.connect(path)
+    counts = [connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in ("student", "instructor", "grade")]
+    hashes = connection.execute("SELECT count(DISTINCT hashed_password) FROM student").fetchone()[0]
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    connection.close()
+
+    assert counts == [200, 3, 100] and report["grades"] == 100
+    assert hashes == 1 and version > 0
+
+
+def test_measure_reports_percentiles_and_compare_flags_regressions():
+    calls = []
+    result = measure(Benchmark("unit", "noop", calls.append, setup=lambda: "state"), iterations=20, warmup=5)
+
+    assert len(calls) == 25 and set(calls) == {"state"}
+    assert result.iterations == 20 and result.p50_ms <= result.p95_ms <= result.p99_ms
+    assert result.ops_per_s > 0 and result.peak_rss_kb > 0
+
+    run = lambda p50: {"runs": [{"students": 10, "results": [{"group": "unit", "name": "noop", "p50_ms": p50, "p95_ms": p50}]}]}
+    assert compare(run(1.0), run(1.05), threshold=10)[1] == []
+    assert compare(run(1.0), run(1.5), threshold=10)[1] == ["10 unit noop: p50 +50.0%"]
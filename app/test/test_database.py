@@ -0,0 +1,10 @@
+from app.data.database import create_db_engine, get_effective_pragmas
+
+
+def test_sqlite_engine_runs_with_wal_and_pragmas(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'school.db'}")
+    pragmas = get_effective_pragmas(engine)
+
+    assert pragmas["journal_mode"] == "wal"
+    assert pragmas["busy_timeout"] == 5000
+    assert engine.pool.size() == 5
@@ -0,0 +1,59 @@
+import json
+
+from sqlmodel import Session
+
+from app.data.models import Grade, Student
+from app.test.conftest import bearer, make_user
+
+
+def test_list_selects_only_the_requested_fields(client, db, instructor, student):
+    response = client.get("/api/students", params={"fields": "email, userName"}, headers=bearer(instructor))
+
+    assert response.status_code == 200
+    [row] = response.json()["students"]
+    # id is always included, fields come back in model order
+    assert list(row) == ["id", "userName", "email"]
+    assert row == {"id": student.id, "userName": student.userName, "email": student.email}
+
+    only_id = client.get("/api/instructors", params={"fields": "id"}, headers=bearer(instructor))
+    assert only_id.json()["instructors"] == [{"id": instructor.id}]
+
+
+def test_the_password_hash_is_never_selectable(client, db, instructor, student):
+    for path in ("/api/students", f"/api/students/{student.id}", f"/api/instructor/{instructor.id}"):
+        response = client.get(path, params={"fields": "userName,hashed_password"}, headers=bearer(instructor))
+        assert response.status_code == 400
+        assert "hashed_password" in response.json()["detail"]
+
+
+def test_detail_defaults_to_the_response_model(client, db, instructor, student):
+    full = client.get(f"/api/students/{student.id}", headers=bearer(instructor)).json()
+    assert "hashed_password" not in full and full["userName"] == student.userName
+
+    sparse = client.get(f"/api/instructor/{instructor.id}", params={"fields": "lastName"}, headers=bearer(instructor))
+    assert sparse.json() == {"id": instructor.id, "lastName": instructor.lastName}
+    assert client.get("/api/students/999999", params={"fields": "lastName"}, headers=bearer(instructor)).status_code == 404
+
+
+def test_grade_fields(client, db, instructor, student):
+    other = make_user(Student, "learner")
+    with Session(db) as session:
+        for pupil in (student, other):
+            session.add(Grade(student_id=pupil.id, pure_maths=1, chemistry=2, biology=3, computer_science=4, physics=5))
+        session.commit()
+
+    rows = client.get("/api/all-grades", params={"fields": "userName,physics"}, headers=bearer(instructor)).json()
+    assert rows[1] == {"id": other.id, "userName": "learner", "grades": {"physics": 5}}
+    # no subject requested, no grades object
+    names = client.get("/api/all-grades", params={"fields": "lastName"}, headers=bearer(instructor)).json()
+    assert names[0] == {"id": student.id, "lastName": student.lastName}
+
+    streamed = client.get(
+        "/api/all-grades", params={"fields": "chemistry"}, headers={**bearer(instructor), "Accept": "application/x-ndjson"}
+    )
+    assert [json.loads(line) for line in streamed.text.splitlines()] == [
+        {"id": student.id, "grades": {"chemistry": 2}}, {"id": other.id, "grades": {"chemistry": 2}},
+    ]
+
+    mine = client.get("/api/my-grades", params={"student_name": student.userName, "fields": "biology"}, headers=bearer(student))
+    assert list(mine.json()) == ["id", "biology"] and mine.json()["biology"] == 3
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from app.data.grade_audit import AuditWriter, GradeChange, audit_writer
+from app.data.models import Grade, GradeAudit, Student
+from app.test.conftest import bearer, make_user
+
+MARKS = {"pure_maths": 10, "chemistry": 11, "biology": 12, "computer_science": 13, "physics": 14}
+
+
+def put_grade(client, instructor, student, **marks):
+    response = client.put("/api/students/grades/update-Add", params={"student_id": student.id},
+                          json={"student_id": student.id, **marks}, headers=bearer(instructor))
+    assert response.status_code == 200, response.text
+
+
+def test_grade_changes_are_audited_with_old_and_new_marks(client, db, instructor, student):
+    put_grade(client, instructor, student, **MARKS)
+    put_grade(client, instructor, student, **{**MARKS, "physics": 20})
+    # writing the same marks again is not a change
+    put_grade(client, instructor, student, **{**MARKS, "physics": 20})
+    assert audit_writer.flush()
+
+    history = client.get(f"/api/students/{student.id}/grade-history", headers=bearer(instructor)).json()
+    assert len(history) == 2
+    assert history[0]["instructor_id"] == instructor.id
+    assert history[0]["old"] == MARKS and history[0]["new"] == {**MARKS, "physics": 20}
+    assert history[1]["old"] is None and history[1]["new"] == MARKS
+
+
+def test_deleting_a_student_deletes_and_audits_their_grade(client, db, instructor, student):
+    put_grade(client, instructor, student, **MARKS)
+    response = client.delete(f"/api/students/{student.id}", headers=bearer(instructor))
+    assert response.status_code == 204
+    assert audit_writer.flush()
+
+    history = client.get(f"/api/students/{student.id}/grade-history", headers=bearer(instructor)).json()
+    assert history[0]["old"] == MARKS and history[0]["new"] is None
+    # SQLite reuses the freed rowid: the grade must not pass on to the next student
+    newcomer = make_user(Student, "newcomer")
+    assert newcomer.id == student.id
+    with Session(db) as session:
+        assert session.exec(select(Grade).where(Grade.student_id == newcomer.id)).first() is None
+
+
+def test_a_rolled_back_batch_audits_nothing(client, db, instructor, student):
+    response = client.post("/api/batch", headers=bearer(instructor), json={"operations": [
+        {"op": "update_grade", "id": student.id, "data": MARKS},
+        {"op": "delete_instructor", "id": 999999},
+    ]})
+    assert response.status_code == 200 and not response.json()["committed"]
+    assert audit_writer.flush()
+
+    with Session(db) as session:
+        assert session.exec(select(GradeAudit)).all() == []
+
+
+def test_changes_the_database_refuses_are_spooled_and_replayed(db, tmp_path):
+    change = GradeChange(7, None, (1, 2, 3, 4, 5), None, datetime(2024, 1, 1))
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'school.db'}")
+    writer = AuditWriter(broken, spool_dir=str(tmp_path))
+    writer.record(change)
+    writer.flush()
+    assert os.listdir(tmp_path) == [f"grade_audit.{os.getpid()}.ndjson"]
+
+    assert AuditWriter(db, spool_dir=str(tmp_path)).replay_spool() == 1
+    assert os.listdir(tmp_path) == []
+    with Session(db) as session:
+        audited = session.exec(select(GradeAudit)).one()
+    assert (audited.student_id, audited.new_physics, audited.old_physics) == (7, 5, None)
+
+
+def test_stopping_spools_what_is_still_queued(db, tmp_path):
+    writer = AuditWriter(db, spool_dir=str(tmp_path))
+    writer.record(GradeChange(7, (1, 1, 1, 1, 1), (2, 2, 2, 2, 2), 3, datetime(2024, 1, 1)))
+    writer.stop()
+
+    with open(tmp_path / f"grade_audit.{os.getpid()}.ndjson") as spool:
+        assert [GradeChange.from_json(line).old for line in spool] == [(1, 1, 1, 1, 1)]
+
+
+def test_a_batch_stuck_on_a_locked_database_is_spooled_when_stopping(db, tmp_path):
+    writer = AuditWriter(db, flush_interval=0, spool_dir=str(tmp_path))
+    writer.start()
+    thread = writer._thread
+    blocker = sqlite3.connect(db.url.database, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+
+    writer.record(GradeChange(7, None, (1, 2, 3, 4, 5), 3, datetime(2024, 1, 1)))
+    while writer._inflight is None:
+        time.sleep(0.01)
+    writer.stop(timeout=0.05)
+    with open(tmp_path / f"grade_audit.{os.getpid()}.ndjson") as spool:
+        assert [GradeChange.from_json(line).new for line in spool] == [(1, 2, 3, 4, 5)]
+
+    # the writer gets the database back later and must not insert the spooled batch a second time
+    blocker.execute("ROLLBACK")
+    blocker.close()
+    thread.join(10)
+    assert not thread.is_alive()
+    with Session(db) as session:
+        assert session.exec(select(GradeAudit)).all() == []
+
+
+def test_flushes_bump_the_audit_counter_only(db):
+    def versions():
+        with db.connect() as connection:
+            return dict(connection.exec_driver_sql("SELECT name, version FROM table_version").all())
+
+    before = versions()
+    audit_writer.record(GradeChange(7, None, (1, 2, 3, 4, 5), None, datetime(2024, 1, 1)))
+    assert audit_writer.flush()
+    after = versions()
+    assert after.pop("grade_audit") == before.pop("grade_audit") + 1 and after == before
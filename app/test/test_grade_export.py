@@ -0,0 +1,80 @@
+import asyncio
+import csv
+import io
+import json
+
+from sqlmodel import Session
+
+from app.api import streaming
+from app.data.models import GRADE_LIST_FIELDS, Grade, Student
+from app.test.conftest import bearer, make_user
+
+
+def add_grades(db, count: int) -> list[Student]:
+    students = [make_user(Student, f"pupil{index}") for index in range(count)]
+    with Session(db) as session:
+        for index, student in enumerate(students):
+            session.add(Grade(student_id=student.id, pure_maths=index % 21, chemistry=1, biology=2, computer_science=3, physics=4))
+        session.commit()
+    return students
+
+
+def test_csv_export_has_every_grade(client, db, instructor):
+    students = add_grades(db, 12)
+
+    response = client.get("/api/all-grades/export", params={"format": "csv"}, headers=bearer(instructor))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="grades.csv"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == [student.id for student in students]
+    assert rows[5]["userName"] == "pupil5" and rows[5]["pure_maths"] == "5"
+
+
+def test_csv_lines_are_encoded_and_flushed_incrementally(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_SIZE", 20)
+
+    async def rows():
+        for index in range(10):
+            yield index, f"name{index}"
+
+    async def collect():
+        return [chunk async for chunk in streaming.async_csv_lines(("id", "name"), rows())]
+
+    chunks = asyncio.run(collect())
+    # the header goes out alone, then a chunk as soon as STREAM_CHUNK_SIZE bytes (three 9-byte rows) are buffered
+    assert chunks[0] == b"id,name\r\n"
+    assert [len(chunk) for chunk in chunks[1:]] == [27, 27, 27, 9]
+    assert b"".join(chunks[1:]).decode().splitlines()[9] == "9,name9"
+
+
+def test_csv_cells_that_spreadsheets_evaluate_are_escaped(client, db, instructor):
+    student = add_grades(db, 1)[0]
+    with Session(db) as session:
+        row = session.get(Student, student.id)
+        row.firstName, row.lastName = '=HYPERLINK("http://evil.test")', "@SUM(A1)"
+        session.commit()
+
+    exported = client.get("/api/all-grades/export", params={"fields": "firstName,lastName,physics"}, headers=bearer(instructor))
+    [row] = list(csv.DictReader(io.StringIO(exported.text)))
+    assert row["firstName"] == '\'=HYPERLINK("http://evil.test")' and row["lastName"] == "'@SUM(A1)"
+    assert row["physics"] == "4"
+    assert streaming.csv_safe_row(["+1", "-x", "\tcmd", "a-b", -3, None]) == ["'+1", "'-x", "'\tcmd", "a-b", -3, None]
+
+
+def test_export_fields_and_ndjson(client, db, instructor):
+    student = add_grades(db, 1)[0]
+
+    exported = client.get("/api/all-grades/export", params={"fields": "userName,physics"}, headers=bearer(instructor))
+    assert exported.text.splitlines() == ["id,userName,physics", f"{student.id},pupil0,4"]
+
+    exported = client.get("/api/all-grades/export", params={"format": "ndjson", "fields": "physics"}, headers=bearer(instructor))
+    assert [json.loads(line) for line in exported.text.splitlines()] == [{"id": student.id, "grades": {"physics": 4}}]
+
+
+def test_empty_export_is_just_the_header(client, db, instructor):
+    assert client.get("/api/all-grades/export", headers=bearer(instructor)).text == ",".join(GRADE_LIST_FIELDS) + "\r\n"
+
+
+def test_export_is_for_instructors(client, db, student):
+    assert client.get("/api/all-grades/export", headers=bearer(student)).status_code == 404
@@ -0,0 +1,45 @@
+from sqlmodel import Session, select
+
+from app.data.database import engine
+from app.data.models import Grade, Student
+from app.test.conftest import bearer, make_user
+
+
+def test_csv_import_upserts_valid_rows_and_reports_the_rest(client, instructor):
+    pupils = [make_user(Student, f"pupil{index}") for index in range(2)]
+    csv_body = "\n".join([
+        "student_id,pure_maths,chemistry,biology,computer_science,physics",
+        f"{pupils[0].id},10,10,10,10,10",
+        f"{pupils[1].id},12,12,12,12,12",
+        f"{pupils[0].id},15,15,15,15,15",
+        "999,10,10,10,10,10",
+        f"{pupils[1].id},25,10,10,10,10",
+    ])
+
+    response = client.post(
+        "/api/grades/import",
+        headers=bearer(instructor),
+        files={"file": ("grades.csv", csv_body, "text/csv")},
+    )
+
+    report = response.json()
+    assert response.status_code == 200
+    assert (report["received"], report["imported"], report["failed"]) == (5, 2, 2)
+    assert [(error["line"], error["student_id"]) for error in report["errors"]] == [(5, 999), (6, None)]
+    with Session(engine) as session:
+        marks = {grade.student_id: grade.physics for grade in session.exec(select(Grade))}
+    assert marks == {pupils[0].id: 15, pupils[1].id: 12}
+
+
+def test_ndjson_import_reports_bad_lines(client, instructor):
+    pupil = make_user(Student, "pupil")
+    body = f'{{"student_id": {pupil.id}, "pure_maths": 1, "chemistry": 2, "biology": 3, "computer_science": 4, "physics": 5}}\nnot json\n'
+
+    report = client.post(
+        "/api/grades/import",
+        headers=bearer(instructor),
+        files={"file": ("grades.ndjson", body, "application/x-ndjson")},
+    ).json()
+
+    assert (report["imported"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["line"] == 2
@@ -0,0 +1,58 @@
+from sqlmodel import Session
+
+from app.data.instructor_repo import InstructorRepo
+from app.data.models import Grade, Student
+from app.domain import leaderboard
+from app.test.conftest import bearer, make_user
+
+
+def grade(client, headers, student, marks):
+    body = dict(zip(["pure_maths", "chemistry", "biology", "computer_science", "physics"], marks), student_id=student.id)
+    response = client.put("/api/students/grades/update-Add", params={"student_id": student.id}, headers=headers, json=body)
+    assert response.status_code == 200
+
+
+def test_top_students_keeps_ties_at_the_cutoff(client, instructor):
+    headers = bearer(instructor)
+    pupils = [make_user(Student, f"pupil{index}") for index in range(4)]
+    grade(client, headers, pupils[0], [20, 20, 20, 20, 20])
+    grade(client, headers, pupils[1], [10, 10, 10, 10, 10])
+    grade(client, headers, pupils[2], [10, 10, 10, 10, 10])
+    grade(client, headers, pupils[3], [5, 5, 5, 5, 5])
+
+    board = client.get("/api/top-students", params={"n": 2}, headers=headers).json()
+    assert [(row["userName"], row["rank"], row["average_marks"]) for row in board] == [
+        ("pupil0", 1, 20.0), ("pupil1", 2, 10.0), ("pupil2", 2, 10.0)
+    ]
+
+    # updating a grade moves the student on the board
+    grade(client, headers, pupils[3], [20, 20, 20, 20, 19])
+    board = client.get("/api/top-students", params={"n": 1, "subject": "physics"}, headers=headers).json()
+    assert [(row["userName"], row["marks"]) for row in board] == [("pupil0", 20)]
+    board = client.get("/api/top-students", params={"n": 2}, headers=headers).json()
+    assert [row["userName"] for row in board] == ["pupil0", "pupil3"]
+
+
+def test_ties_at_the_cutoff_are_bounded(db, monkeypatch):
+    monkeypatch.setattr(leaderboard, "MAX_BOARD_ROWS", 3)
+    pupils = [make_user(Student, f"pupil{index}") for index in range(5)]
+    with Session(db) as session:
+        for pupil in pupils:
+            session.add(Grade(student_id=pupil.id, pure_maths=10, chemistry=10, biology=10, computer_science=10, physics=10))
+        session.commit()
+        board = InstructorRepo(session).get_top_students(n=1)
+    assert [row.id for row in board] == [pupil.id for pupil in pupils[:3]]
+
+
+def test_grades_without_a_student_take_no_place(client, db, instructor):
+    headers = bearer(instructor)
+    pupils = [make_user(Student, f"pupil{index}") for index in range(4)]
+    for pupil, mark in zip(pupils, (20, 15, 10, 5)):
+        grade(client, headers, pupil, [mark] * 5)
+    # a grade row left behind by a student deleted outside the app
+    with Session(db) as session:
+        session.add(Grade(student_id=999999, pure_maths=20, chemistry=20, biology=20, computer_science=20, physics=20))
+        session.commit()
+
+    board = client.get("/api/top-students", params={"n": 3}, headers=headers).json()
+    assert [row["userName"] for row in board] == ["pupil0", "pupil1", "pupil2"]
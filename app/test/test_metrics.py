@@ -0,0 +1,52 @@
+import re
+
+from app import metrics
+from app.metrics import Histogram
+from app.test.conftest import bearer
+
+
+def _sample(text: str, series: str) -> float:
+    match = re.search(rf"^{re.escape(series)} (\S+)$", text, re.MULTILINE)
+    assert match, series
+    return float(match.group(1))
+
+
+def test_requests_are_labelled_by_route_template_with_their_queries(client, instructor, student):
+    headers = bearer(instructor)
+    route = ("GET", "/api/students/{user_id}")
+    # the registry is process wide, compare against what earlier tests left behind
+    ok, missing, unmatched = (metrics.http_requests.value(*route, "200"), metrics.http_requests.value(*route, "404"),
+                              metrics.http_requests.value("GET", "<unmatched>", "404"))
+    queries = metrics.http_request_db_queries.count(*route)
+
+    for _ in range(2):
+        assert client.get(f"/api/students/{student.id}", headers=headers).status_code == 200
+    client.get("/api/students/999999", headers=headers)
+    client.get("/no/such/path/123")
+
+    assert metrics.http_requests.value(*route, "200") == ok + 2
+    assert metrics.http_requests.value(*route, "404") == missing + 1
+    assert metrics.http_requests.value("GET", "<unmatched>", "404") == unmatched + 1
+    assert metrics.http_request_db_queries.count(*route) == queries + 3
+
+    text = client.get("/metrics").text
+    assert _sample(text, 'http_requests_in_progress{method="GET"}') == 1  # the /metrics request itself
+    # the sync route runs in the thread pool, its queries still land on the request
+    assert _sample(text, 'http_request_db_queries_sum{method="GET",route="/api/students/{user_id}"}') >= 3
+    assert _sample(text, 'db_query_duration_seconds_count{operation="SELECT"}') >= 3
+    assert f'route="/api/students/{student.id}"' not in text and 'route="/api/students/999999"' not in text
+    assert "/no/such" not in text
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, 'a"b')
+
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{route="a\\"b",le="0.1"} 1',
+        'latency_seconds_bucket{route="a\\"b",le="1"} 3',
+        'latency_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{route="a\\"b"} 6.05',
+        'latency_seconds_count{route="a\\"b"} 4',
+    ]
@@ -0,0 +1,40 @@
+import json
+from datetime import date
+
+from sqlmodel import Session
+
+from app.api.streaming import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.data.models import Student
+from app.test.conftest import bearer, make_user
+
+
+def test_students_keyset_pages_and_ndjson_stream(client, instructor):
+    for index in range(5):
+        make_user(Student, f"pupil{index}")
+    headers = bearer(instructor)
+
+    first = client.get("/api/students", params={"limit": 2}, headers=headers).json()
+    assert [s["userName"] for s in first["students"]] == ["pupil0", "pupil1"]
+
+    second = client.get("/api/students", params={"limit": 2, "after_id": first["next_after_id"]}, headers=headers).json()
+    assert [s["userName"] for s in second["students"]] == ["pupil2", "pupil3"]
+
+    response = client.get("/api/students", params={"after_id": 1}, headers={**headers, "Accept": "application/x-ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["userName"] for row in rows] == ["pupil1", "pupil2", "pupil3", "pupil4"]
+
+
+def test_list_pages_are_bounded(client, db, instructor):
+    with Session(db) as session:
+        for index in range(DEFAULT_PAGE_SIZE + 1):
+            session.add(Student(userName=f"pupil{index}", firstName="Pupil", lastName="Doe", email=f"pupil{index}@school.test",
+                                dateOfBirth=date(2000, 1, 1), hashed_password="x"))
+        session.commit()
+    headers = bearer(instructor)
+
+    # no ?limit= is a default page, not the whole table
+    page = client.get("/api/students", headers=headers).json()
+    assert len(page["students"]) == DEFAULT_PAGE_SIZE and page["next_after_id"] is not None
+    assert client.get("/api/students", params={"limit": MAX_PAGE_SIZE + 1}, headers=headers).status_code == 422
+    assert client.get("/api/instructors", params={"limit": 0}, headers=headers).status_code == 422
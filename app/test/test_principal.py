@@ -0,0 +1,44 @@
+from datetime import date
+
+from app.auth.principal_cache import principal_cache
+from app.data.instructor_repo import InstructorRepo
+from app.data.schemas import UpdateUserSchema
+from app.data.unit_of_work import UnitOfWork
+from app.domain import instructor_service
+from app.test.conftest import bearer
+
+
+def test_current_instructor_is_cached_and_invalidated(client, instructor):
+    headers = bearer(instructor)
+
+    assert client.get("/api/students", headers=headers).status_code == 200
+    assert len(principal_cache) == 1
+
+    response = client.put(
+        f"/api/instructor/{instructor.id}",
+        headers=headers,
+        json={"firstName": "New", "lastName": "Name", "email": "new@school.test", "dateOfBirth": "1990-01-01"},
+    )
+    assert response.status_code == 200
+    assert len(principal_cache) == 0
+
+
+def test_student_token_is_not_an_instructor(client, student):
+    assert client.get("/api/students", headers=bearer(student)).status_code == 404
+
+
+def test_principals_are_invalidated_once_the_change_commits(db, instructor, monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(principal_cache, "invalidate", lambda role, principal_id: invalidated.append((role, principal_id)))
+    update = UpdateUserSchema(firstName="New", lastName="Name", email="new@school.test", dateOfBirth=date(1990, 1, 1))
+
+    with UnitOfWork() as work:
+        instructor_service.update_instructor(instructor.id, update, InstructorRepo(work.session))
+        assert invalidated == []
+    assert invalidated == [("Instructor", instructor.id)]
+
+    # a change that rolls back leaves the cached principal alone
+    with UnitOfWork() as work:
+        instructor_service.delete_instructor(instructor.id, InstructorRepo(work.session))
+        work.rollback()
+    assert invalidated == [("Instructor", instructor.id)]
@@ -0,0 +1,22 @@
+from app.data.models import Student
+from app.test.conftest import bearer, make_user
+
+
+def user(name: str, role: str = "Student", email: str | None = None) -> dict:
+    return {
+        "userName": name, "firstName": name.title(), "lastName": "Doe", "email": email or f"{name}@school.test",
+        "dateOfBirth": "2001-02-03", "userRole": role, "password": "pw",
+    }
+
+
+def test_bulk_provisioning_reports_duplicates_without_aborting(client, instructor):
+    make_user(Student, "taken")
+    batch = [user("ann"), user("taken"), user("bob", "Instructor"), user("ann", email="other@school.test"), user("cid")]
+
+    response = client.post("/api/users/bulk", headers=bearer(instructor), json=batch)
+
+    report = response.json()
+    assert response.status_code == 200
+    assert (report["received"], report["created"], report["failed"]) == (5, 3, 2)
+    assert [(error["index"], error["userName"]) for error in report["errors"]] == [(1, "taken"), (3, "ann")]
+    assert client.post("/auth/students", data={"username": "cid", "password": "pw"}).status_code == 200
@@ -0,0 +1,73 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.auth.dependencies import UserRepository
+from app.data.database import async_engine, create_db_engine, engine
+from app.data.instructor_repo import AsyncInstructorRepo, InstructorRepo
+from app.data.migrations import LATEST_VERSION, get_schema_version
+from app.data.query_plans import explain_query_plan, full_scans
+from app.data.student_repo import AsyncStudentRepo, StudentRepo
+
+
+@contextmanager
+def captured_statements():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+
+def run_async(call):
+    async def runner():
+        async with AsyncSession(async_engine) as session:
+            await call(session)
+    asyncio.run(runner())
+
+
+# Repo queries on the request hot paths: none of them may read a whole table
+INDEXED_QUERIES = {
+    "student by id": lambda session: StudentRepo(session).get_student_by_id(1),
+    "students page": lambda session: StudentRepo(session).get_all_students(after_id=10, limit=50),
+    "my grades": lambda _: run_async(lambda session: AsyncStudentRepo(session).get_my_grades(1)),
+    "instructor by id": lambda session: InstructorRepo(session).get_instructor_by_id(1),
+    "instructors page": lambda session: InstructorRepo(session).get_all_instructors(after_id=10, limit=50),
+    "instructor by name": lambda session: UserRepository(session).get_instructor_by_name("teacher"),
+    "student by name": lambda session: UserRepository(session).get_student_by_name("pupil"),
+    "top students": lambda session: InstructorRepo(session).get_top_students(n=5),
+    "top students by subject": lambda session: InstructorRepo(session).get_top_students(n=5, subject="physics"),
+    "grades page": lambda _: run_async(lambda session: AsyncInstructorRepo(session).view_grades(after_id=10, limit=50)),
+}
+
+
+def test_database_is_migrated_to_latest(db):
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == LATEST_VERSION
+
+
+@pytest.mark.parametrize("name", INDEXED_QUERIES)
+def test_repo_query_does_not_regress_to_full_scan(db, name):
+    with captured_statements() as statements, Session(engine) as session:
+        INDEXED_QUERIES[name](session)
+    selects = [(sql, params) for sql, params in statements if sql.lstrip().upper().startswith("SELECT")]
+    assert selects
+
+    # sqlite3's statement cache would hand back EXPLAIN output prepared against an older schema
+    plan_engine = create_db_engine(engine.url.render_as_string(), connect_args={"check_same_thread": False, "cached_statements": 0})
+    with plan_engine.connect() as connection:
+        for sql, params in selects:
+            plan = explain_query_plan(connection, sql, params)
+            assert not full_scans(plan), f"{name}: {sql}\n{plan}"
+    plan_engine.dispose()
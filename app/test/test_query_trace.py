@@ -0,0 +1,82 @@
+import logging
+import threading
+
+import pytest
+from sqlmodel import Session, select
+
+from app import create_app
+from app.api import api
+from app.data import query_trace
+from app.data.database import engine, get_session
+from app.data.models import Student
+from app.test.conftest import bearer
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def tracing(monkeypatch):
+    monkeypatch.setattr(query_trace, "SQL_TRACE", True)
+    monkeypatch.setattr(query_trace, "SQL_N_PLUS_ONE_THRESHOLD", 3)
+
+
+def test_statement_shape_folds_literals_and_in_lists():
+    assert query_trace.statement_shape("SELECT * FROM t WHERE a = 'x''y' AND b IN (?, ?,  ?)\n LIMIT 10") == \
+        "SELECT * FROM t WHERE a = ? AND b IN (?) LIMIT ?"
+    assert query_trace.statement_shape("SELECT anon_1.grade_1 FROM anon_1") == "SELECT anon_1.grade_1 FROM anon_1"
+
+
+def test_repeated_shapes_are_reported_as_n_plus_one(tracing, student, caplog):
+    trace = query_trace.QueryTrace("loop")
+    token = query_trace.current_trace.set(trace)
+    try:
+        with Session(engine) as session:
+            for user_id in (student.id, student.id + 1, student.id + 2):
+                session.exec(select(Student).where(Student.id == user_id)).first()
+    finally:
+        query_trace.current_trace.reset(token)
+
+    with caplog.at_level(logging.WARNING, logger=query_trace.logger.name):
+        query_trace.report(trace)
+    assert [count for _, count in trace.repeated()] == [3]
+    assert "Possible N+1 in loop: 3 x SELECT" in caplog.text
+
+
+def test_slow_statements_are_logged_with_their_plan(tracing, monkeypatch, student, caplog):
+    monkeypatch.setattr(query_trace, "SQL_SLOW_QUERY_MS", 0.0)
+    with caplog.at_level(logging.WARNING, logger=query_trace.slow_query_logger.name):
+        with Session(engine) as session:
+            session.exec(select(Student).where(Student.userName == student.userName)).first()
+
+    assert "Slow query" in caplog.text and "SEARCH student USING INDEX" in caplog.text
+    assert student.userName not in caplog.text  # parameters stay out of the log
+
+
+def test_session_without_request_gets_its_own_trace(tracing, student, caplog):
+    traces = []
+
+    def work():
+        # a fresh thread: no request trace in the context, only the session's
+        dependency = get_session()
+        session = next(dependency)
+        traces.append(session.info[query_trace.TRACE_KEY])
+        session.get(Student, student.id)
+        dependency.close()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+
+    assert traces[0].label == "session" and traces[0].count >= 1
+    # the connection went back to the pool without the trace
+    with Session(engine) as session:
+        session.get(Student, student.id + 100)
+    assert traces[0].count == 1
+
+
+def test_requests_are_traced_per_route(tracing, db, instructor, student, caplog):
+    app = create_app()
+    app.include_router(api.router)
+    with TestClient(app) as client, caplog.at_level(logging.DEBUG, logger=query_trace.logger.name):
+        assert client.get(f"/api/students/{student.id}", headers=bearer(instructor)).status_code == 200
+
+    assert "GET /api/students/{user_id} ran" in caplog.text
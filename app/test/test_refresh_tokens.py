@@ -0,0 +1,104 @@
+from sqlmodel import Session, select
+
+from app.auth import dependencies
+from app.auth.token import verify_token
+from app.data.database import engine
+from app.data.models import RefreshToken, Student
+from app.test.conftest import bearer, make_user
+
+
+def login(client, path="/auth/instructor", username="teacher"):
+    response = client.post(path, data={"username": username, "password": "secret"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def refresh(client, refresh_token):
+    return client.post("/auth/refresh", json={"refresh_token": refresh_token})
+
+
+def stored_tokens() -> list[RefreshToken]:
+    with Session(engine) as session:
+        return session.exec(select(RefreshToken)).all()
+
+
+def test_refresh_rotates_without_bcrypt(client, instructor, monkeypatch):
+    tokens = login(client)
+    assert verify_token(tokens["access_token"])["fam"] == int(tokens["refresh_token"].split(".")[0])
+
+    def no_bcrypt(*args):
+        raise AssertionError("refresh must not verify a password")
+    monkeypatch.setattr(dependencies.pwd_context, "verify_and_update", no_bcrypt)
+
+    refreshed = refresh(client, tokens["refresh_token"])
+    assert refreshed.status_code == 200
+    body = refreshed.json()
+    assert body["role"] == "Instructor" and body["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/api/instructors", headers={"Authorization": f"Bearer {body['access_token']}"}).status_code == 200
+
+    # rotated in place: still one row, holding a hash rather than the token
+    [row] = stored_tokens()
+    assert row.user_id == instructor.id and len(row.token_hash) == 32
+
+
+def test_reusing_a_rotated_token_revokes_the_family(client, instructor):
+    tokens = login(client)
+    rotated = refresh(client, tokens["refresh_token"]).json()
+
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    # the thief's replay ended the login for the legitimate holder as well, access token included
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+    assert client.get("/api/instructors", headers={"Authorization": f"Bearer {rotated['access_token']}"}).status_code == 401
+    assert stored_tokens() == []
+
+
+def test_a_guessed_secret_does_not_log_anyone_out(client, instructor):
+    tokens = login(client)
+    family = verify_token(tokens["access_token"])["fam"]
+
+    # the family id is in every access token, only a secret the family was issued may end it
+    assert refresh(client, f"{family}.bogus").status_code == 401
+    assert refresh(client, tokens["refresh_token"]).status_code == 200
+
+
+def test_revoke_logs_out_one_login(client, instructor):
+    first, second = login(client), login(client)
+
+    assert client.post("/auth/revoke", json={"refresh_token": first["refresh_token"]}).status_code == 204
+    assert refresh(client, first["refresh_token"]).status_code == 401
+    assert client.get("/api/instructors", headers={"Authorization": f"Bearer {first['access_token']}"}).status_code == 401
+    assert refresh(client, second["refresh_token"]).status_code == 200
+    # unknown or malformed tokens get the same answer
+    assert client.post("/auth/revoke", json={"refresh_token": "1.nope"}).status_code == 204
+    assert refresh(client, "garbage").status_code == 401
+
+
+def test_deleted_users_cannot_refresh(client, student):
+    tokens = login(client, "/auth/students", student.userName)
+    with Session(engine) as session:
+        session.delete(session.get(Student, student.id))
+        session.commit()
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    assert stored_tokens() == []
+
+
+def test_a_login_does_not_outlive_its_user_when_the_id_is_reused(client, student):
+    tokens = login(client, "/auth/students", student.userName)
+    with Session(engine) as session:
+        session.delete(session.get(Student, student.id))
+        session.commit()
+    # SQLite hands the highest deleted rowid to the next insert: same id, same name, another user
+    successor = make_user(Student, student.userName)
+    assert successor.id == student.id
+
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    assert stored_tokens() == []
+
+
+def test_logins_and_refreshes_keep_cached_responses(client, instructor):
+    headers = bearer(instructor)
+    etag = client.get("/api/instructors", headers=headers).headers["etag"]
+
+    tokens = login(client)
+    assert refresh(client, tokens["refresh_token"]).status_code == 200
+    assert client.get("/api/instructors", headers={**headers, "If-None-Match": etag}).status_code == 304
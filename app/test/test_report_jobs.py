@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from app.data.models import Grade, ReportJob, Student
+from app.domain import report_jobs
+from app.test.conftest import bearer, make_user
+
+MARKS = {"pure_maths": 10, "chemistry": 11, "biology": 12, "computer_science": 13, "physics": 14}
+
+
+def add_grades(db, *names: str) -> list[Student]:
+    students = [make_user(Student, name) for name in names]
+    with Session(db) as session:
+        for offset, student in enumerate(students):
+            session.add(Grade(student_id=student.id, **{**MARKS, "physics": offset}))
+        session.commit()
+    return students
+
+
+def wait_for(client, instructor, location: str) -> dict:
+    for _ in range(200):
+        job = client.get(location, headers=bearer(instructor)).json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job still {job['status']}")
+
+
+def test_grades_report_runs_in_the_background_page_by_page(client, db, instructor, monkeypatch):
+    monkeypatch.setattr(report_jobs, "REPORT_PAGE_SIZE", 2)
+    students = add_grades(db, "ada", "alan", "grace")
+
+    response = client.post("/api/jobs", json={"kind": "grades"}, headers=bearer(instructor))
+    assert response.status_code == 202 and response.json()["status"] == "queued"
+    job = wait_for(client, instructor, response.headers["Location"])
+
+    assert job["status"] == "succeeded" and job["progress"] == job["total"] == 3
+    report = client.get(job["result_url"], headers=bearer(instructor))
+    assert report.status_code == 200 and report.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(report.text)))
+    assert [row["userName"] for row in rows] == [student.userName for student in students]
+    assert [row["physics"] for row in rows] == ["0", "1", "2"]
+
+
+def test_top_students_report(client, db, instructor):
+    add_grades(db, "ada", "alan", "grace")
+    response = client.post("/api/jobs", json={"kind": "top_students", "n": 2, "subject": "physics"}, headers=bearer(instructor))
+    job = wait_for(client, instructor, response.headers["Location"])
+
+    ranked = client.get(job["result_url"], headers=bearer(instructor)).json()
+    assert [(entry["userName"], entry["marks"]) for entry in ranked] == [("grace", 2), ("alan", 1)]
+
+
+def test_a_failed_job_reports_its_error_and_has_no_result(client, db, instructor, monkeypatch):
+    def broken(job_id, out, file_format):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setitem(report_jobs.REPORTS, "grades", (broken, lambda params: params["file_format"]))
+    response = client.post("/api/jobs", json={"kind": "grades", "format": "ndjson"}, headers=bearer(instructor))
+    job = wait_for(client, instructor, response.headers["Location"])
+
+    assert job["status"] == "failed" and job["error"] == "RuntimeError: disk full" and job["result_url"] is None
+    assert client.get(f"/api/jobs/{job['id']}/result", headers=bearer(instructor)).status_code == 409
+    assert client.get("/api/jobs/999999", headers=bearer(instructor)).status_code == 404
+
+
+def cached_table_versions(db) -> dict[str, int]:
+    with db.connect() as connection:
+        return dict(connection.exec_driver_sql(
+            "SELECT name, version FROM table_version WHERE name IN ('student', 'instructor', 'grade')").all())
+
+
+def test_a_queued_job_runs_once(db):
+    add_grades(db, "ada")
+    versions = cached_table_versions(db)
+    with Session(db) as session:
+        job = ReportJob(kind="grades", params=json.dumps({"file_format": "ndjson"}))
+        session.add(job)
+        session.commit()
+        job_id = job.id
+
+    report_jobs.run_job(job_id)
+    report_jobs.run_job(job_id)  # already claimed: a second submission does nothing
+
+    with Session(db) as session:
+        job = session.get(ReportJob, job_id)
+        assert (job.status, job.progress) == ("succeeded", 1)
+        finished_at = job.finished_at
+    with open(job.result_path) as report:
+        assert json.loads(report.readline())["grades"]["physics"] == 0
+    assert report_jobs.resume_queued_jobs() == 0
+    with Session(db) as session:
+        assert session.get(ReportJob, job_id).finished_at == finished_at
+    # the job's own writes leave the cached responses alone
+    assert cached_table_versions(db) == versions
+
+
+def test_jobs_left_running_by_a_stopped_process_fail(db):
+    now = datetime.now()
+    with Session(db) as session:
+        stale = ReportJob(kind="grades", status="running", started_at=now - timedelta(hours=1), heartbeat_at=now - timedelta(hours=1))
+        alive = ReportJob(kind="grades", status="running", started_at=now, heartbeat_at=now)
+        session.add_all([stale, alive])
+        session.commit()
+        stale_id, alive_id = stale.id, alive.id
+
+    assert report_jobs.fail_interrupted_jobs() == 1
+    with Session(db) as session:
+        assert session.get(ReportJob, stale_id).status == "failed"
+        assert session.get(ReportJob, stale_id).error.startswith("Interrupted")
+        assert session.get(ReportJob, alive_id).status == "running"
+
+
+def test_reports_are_deleted_after_the_retention_period(client, db, instructor):
+    add_grades(db, "ada")
+    response = client.post("/api/jobs", json={"kind": "grades"}, headers=bearer(instructor))
+    job = wait_for(client, instructor, response.headers["Location"])
+    with Session(db) as session:
+        row = session.get(ReportJob, job["id"])
+        path = row.result_path
+        row.finished_at = datetime.now() - timedelta(seconds=report_jobs.REPORT_RETENTION + 60)
+        session.commit()
+    # what a job that died while writing leaves behind
+    leftover = os.path.join(report_jobs.REPORT_DIR, "report-999999.csv.part")
+    open(leftover, "w").close()
+    expired = time.time() - report_jobs.REPORT_RETENTION - 60
+    os.utime(leftover, (expired, expired))
+
+    assert report_jobs.expire_reports() == 2
+    assert not os.path.exists(path) and not os.path.exists(leftover)
+    assert client.get(job["result_url"], headers=bearer(instructor)).status_code == 410
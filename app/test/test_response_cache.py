@@ -0,0 +1,91 @@
+import sqlite3
+import time
+from datetime import date
+
+from sqlmodel import Session
+
+from app.api.response_cache import CachedResponse, ResponseCache, response_cache
+from app.data.database import engine
+from app.data.schemas import UpdateUserSchema
+from app.data.student_repo import StudentRepo
+from app.data.table_versions import bump_versions
+from app.test.conftest import bearer
+
+
+def test_etag_revalidates_to_304_until_a_write(client, instructor, student):
+    headers = bearer(instructor)
+
+    first = client.get("/api/students", headers=headers)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and len(response_cache) == 1
+
+    cached = client.get("/api/students", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["etag"] == etag
+
+    update = {"firstName": "Renamed", "lastName": "Doe", "email": "pupil@school.test", "dateOfBirth": "2000-01-01"}
+    assert client.put(f"/api/students/{student.id}", json=update, headers=headers).status_code == 200
+
+    fresh = client.get("/api/students", headers={**headers, "If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != etag
+    assert fresh.json()["students"][0]["firstName"] == "Renamed"
+
+
+def test_writes_from_another_process_invalidate(client, instructor, student):
+    headers = bearer(instructor)
+    etag = client.get("/api/students", headers=headers).headers["etag"]
+
+    # a plain sqlite3 connection that doesn't bump table_version, like a manual fix from the sqlite3 shell
+    other = sqlite3.connect(engine.url.database)
+    other.execute("UPDATE student SET lastName = 'Elsewhere' WHERE id = ?", (student.id,))
+    other.commit()
+    other.close()
+
+    response = client.get("/api/students", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["students"][0]["lastName"] == "Elsewhere"
+
+
+def test_unrelated_table_writes_keep_entries(client, instructor, student):
+    headers = bearer(instructor)
+    etag = client.get("/api/instructors", headers=headers).headers["etag"]
+
+    with Session(engine) as session:
+        StudentRepo(session).update_student(student.id, UpdateUserSchema(
+            firstName="An", lastName="Other", email="another@school.test", dateOfBirth=date(2000, 1, 1),
+        ))
+    assert client.get("/api/instructors", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+
+def test_writes_to_uncached_tables_keep_entries(client, instructor):
+    headers = bearer(instructor)
+    etag = client.get("/api/instructors", headers=headers).headers["etag"]
+
+    # what job progress, audit flushes and logins commit: a counter of a table no route caches
+    with Session(engine) as session:
+        session.exec(bump_versions("report_job", "grade_audit", "refresh_token"))
+        session.commit()
+    assert client.get("/api/instructors", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+
+def test_a_warm_cache_does_not_serve_revoked_tokens(client, instructor, student):
+    tokens = client.post("/auth/instructor", data={"username": instructor.userName, "password": "secret"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    for path in ("/api/students", "/api/top-students", "/api/all-grades"):
+        client.get(path, headers=headers)
+    assert client.get("/api/students", headers=headers).status_code == 200 and len(response_cache) >= 1
+
+    assert client.post("/auth/revoke", json={"refresh_token": tokens["refresh_token"]}).status_code == 204
+    for path in ("/api/students", "/api/top-students", "/api/all-grades"):
+        assert client.get(path, headers=headers).status_code == 401
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=250, max_entry_bytes=150)
+    for key in range(3):
+        cache.put((key,), CachedResponse((0,), b'"x"', [], b"x" * 100, time.time() + 60))
+    cache.put(("huge",), CachedResponse((0,), b'"y"', [], b"y" * 200, time.time() + 60))
+
+    assert cache.get((0,), (0,)) is None
+    assert cache.get((2,), (0,)) is not None and cache.get((2,), (1,)) is None
+    assert cache.get(("huge",), (0,)) is None
+    assert cache.size <= 250
@@ -0,0 +1,83 @@
+import sqlite3
+
+from sqlmodel import Session
+
+from app.data.models import Student
+from app.data.student_repo import StudentRepo, search_match
+from app.data.schemas import UpdateUserSchema
+from app.test.conftest import bearer, make_user
+
+
+def search(client, instructor, **params):
+    response = client.get("/api/students/search", params=params, headers=bearer(instructor))
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_search_match_quotes_every_word_as_a_prefix():
+    assert search_match("Ada  Love") == '"Ada"* "Love"*'
+    assert search_match('ada" OR NEAR(x') == '"ada"* "OR"* "NEAR"* "x"*'
+    assert search_match(" -*") is None
+
+
+def test_ranked_prefix_search(client, db, instructor):
+    # "adams" matches on the user name for one and only on the last name for the other
+    by_last_name = make_user(Student, "zed")
+    with Session(db) as session:
+        session.get(Student, by_last_name.id).lastName = "Adamson"
+        session.commit()
+    by_user_name = make_user(Student, "adams")
+    bob = make_user(Student, "bob")
+
+    body = search(client, instructor, q="adam")
+    assert [row["id"] for row in body["students"]] == [by_user_name.id, by_last_name.id]
+    assert body["next_offset"] is None
+    assert search(client, instructor, q="bob@school", fields="userName")["students"] == [{"id": bob.id, "userName": "bob"}]
+    assert search(client, instructor, q="nobody")["students"] == []
+    assert search(client, instructor, q="!!")["students"] == []
+
+
+def test_search_pages(client, db, instructor):
+    # the older students match only on the last name, which weighs less than the user name
+    by_last_name = [make_user(Student, f"other{index}").id for index in range(3)]
+    with Session(db) as session:
+        for student_id in by_last_name:
+            session.get(Student, student_id).lastName = "Pupilson"
+        session.commit()
+    by_user_name = [make_user(Student, f"pupil{index}").id for index in range(2)]
+
+    first = search(client, instructor, q="pupil", limit=2)
+    second = search(client, instructor, q="pupil", limit=2, offset=first["next_offset"])
+    last = search(client, instructor, q="pupil", limit=2, offset=second["next_offset"])
+
+    assert first["next_offset"] == 2 and last["next_offset"] is None
+    # pages follow the relevance order, not the id order
+    assert [row["id"] for page in (first, second, last) for row in page["students"]] == by_user_name + by_last_name
+
+
+def test_index_follows_student_writes(client, db, instructor):
+    student = make_user(Student, "carol")
+    with Session(db) as session:
+        repo = StudentRepo(session)
+        repo.update_student(student.id, UpdateUserSchema(
+            firstName="Caroline", lastName="Herschel", email="comets@school.test", dateOfBirth=student.dateOfBirth))
+        assert [row[0] for row in repo.search_students(search_match("hersch"), fields=("id",))] == [student.id]
+        assert repo.search_students(search_match("doe"), fields=("id",)) == []
+
+        repo.delete_student(student.id)
+        assert repo.search_students(search_match("carol"), fields=("id",)) == []
+
+    # writers outside the app are indexed too
+    connection = sqlite3.connect(db.url.database)
+    connection.execute(
+        "INSERT INTO student (created_at, last_updated, userName, firstName, lastName, email, dateOfBirth, hashed_password, userRole) "
+        "VALUES (datetime(), datetime(), 'dora', 'Dora', 'Explorer', 'dora@school.test', '2000-01-01', 'x', 'Student')"
+    )
+    connection.commit()
+    connection.close()
+    assert [row["userName"] for row in search(client, instructor, q="explor")["students"]] == ["dora"]
+
+
+def test_search_requires_a_query_and_is_not_an_id(client, db, instructor):
+    assert client.get("/api/students/search", headers=bearer(instructor)).status_code == 422
+    assert client.get("/api/students/search", params={"q": "x", "fields": "hashed_password"}, headers=bearer(instructor)).status_code == 400
@@ -0,0 +1,37 @@
+from sqlmodel import Session
+
+from app.data.models import PUBLIC_USER_FIELDS, Grade, Student
+from app.data.schemas import GetStudentResponse
+from app.test.conftest import bearer, make_user
+
+
+def test_student_list_matches_the_response_model_without_the_hash(client, db, instructor, student):
+    response = client.get("/api/students", params={"limit": 1}, headers=bearer(instructor))
+
+    assert response.headers["content-type"] == "application/json"
+    body = response.json()
+    assert body["next_after_id"] == student.id
+    [row] = body["students"]
+    assert list(row) == list(PUBLIC_USER_FIELDS)
+    # same encoding of ids, dates and datetimes as the validated single-student route
+    single = client.get(f"/api/students/{student.id}", headers=bearer(instructor)).json()
+    assert {key: row[key] for key in single} == single == GetStudentResponse.model_validate(student, from_attributes=True).model_dump(mode="json")
+    assert row["created_at"] == student.created_at.isoformat()
+
+
+def test_all_grades_rows_and_cursor_header(client, db, instructor):
+    students = [make_user(Student, f"pupil{index}") for index in range(3)]
+    with Session(db) as session:
+        for index, student in enumerate(students):
+            session.add(Grade(student_id=student.id, pure_maths=index, chemistry=1, biology=2, computer_science=3, physics=20))
+        session.commit()
+
+    response = client.get("/api/all-grades", params={"limit": 2}, headers=bearer(instructor))
+
+    assert response.headers["x-next-after-id"] == str(students[1].id)
+    assert response.json()[1] == {
+        "id": students[1].id, "userName": "pupil1", "firstName": "Pupil1", "lastName": "Doe",
+        "grades": {"pure_maths": 1, "chemistry": 1, "biology": 2, "computer_science": 3, "physics": 20},
+    }
+    last_page = client.get("/api/all-grades", params={"limit": 2, "after_id": students[1].id}, headers=bearer(instructor))
+    assert "x-next-after-id" not in last_page.headers and len(last_page.json()) == 1
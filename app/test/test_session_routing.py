@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlmodel import select
+
+from app.api.dependencies import READ_YOUR_WRITES_HEADER
+from app.data import database
+from app.data.database import Intent, RoutingSession, create_db_engine, engine, read_only_url, session_scope
+from app.data.models import Student
+from app.test.conftest import bearer, make_user
+
+
+@pytest.fixture
+def readers(monkeypatch):
+    # two read-only engines on the test database, as DATABASE_READ_URLS would configure them
+    engines = [create_db_engine(read_only_url(str(engine.url)), read_only=True) for _ in range(2)]
+    monkeypatch.setattr(database, "read_engines", engines)
+    yield engines
+    for reader in engines:
+        reader.dispose()
+
+
+@pytest.fixture
+def reads(readers):
+    # statements the read engines ran during the test, per engine
+    statements = {reader: [] for reader in readers}
+
+    def recorder(reader):
+        return lambda connection, cursor, statement, *args: statements[reader].append(statement)
+
+    listeners = [(reader, recorder(reader)) for reader in readers]
+    for reader, record in listeners:
+        event.listen(reader, "before_cursor_execute", record)
+    yield statements
+    for reader, record in listeners:
+        event.remove(reader, "before_cursor_execute", record)
+
+
+def all_reads(reads) -> list[str]:
+    return [statement for statements in reads.values() for statement in statements]
+
+
+def test_without_read_urls_everything_reads_from_the_primary(db):
+    assert database.read_urls("") == []
+    assert database.read_urls("sqlite:///a.db, sqlite:///b.db") == ["sqlite:///a.db", "sqlite:///b.db"]
+    assert database.read_engines == []
+    with session_scope(Intent.READ) as session:
+        assert session.get_bind(clause=select(Student)) is engine
+
+
+def test_read_engine_is_a_read_only_view_of_the_database(db, readers):
+    assert read_only_url("sqlite:///tmp/school.db") == "sqlite:///file:tmp/school.db?mode=ro&uri=true"
+    assert read_only_url("sqlite://") is None
+
+    student = make_user(Student, "reader")
+    with readers[0].connect() as connection:
+        assert connection.exec_driver_sql("SELECT userName FROM student").scalar() == student.userName
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("DELETE FROM student")
+
+
+def test_read_session_reads_from_a_reader_until_it_writes(db, reads):
+    student = make_user(Student, "alice")
+    with session_scope(Intent.READ) as session:
+        assert isinstance(session, RoutingSession)
+        loaded = session.exec(select(Student).where(Student.id == student.id)).one()
+        assert loaded.userName == "alice" and len(all_reads(reads)) == 1
+
+        loaded.firstName = "Alicia"
+        session.flush()
+        # read your writes: from now on the primary answers, with the flushed change
+        assert session.exec(select(Student.firstName).where(Student.id == student.id)).one() == "Alicia"
+        assert len(all_reads(reads)) == 1
+        session.commit()
+
+
+def test_a_session_keeps_the_reader_it_started_with(db, reads):
+    make_user(Student, "carol")
+    with session_scope(Intent.READ) as session:
+        for _ in range(3):
+            session.exec(select(Student)).all()
+        first = session.reader
+    with session_scope(Intent.READ) as session:
+        session.exec(select(Student)).all()
+        assert session.reader is not first
+    # all three reads of the first session went to its reader, the next session took the other one
+    assert len(reads[first]) == 3 and len(all_reads(reads)) == 4
+
+
+def test_write_session_never_uses_a_reader(db, reads):
+    student = make_user(Student, "bob")
+    with session_scope(Intent.WRITE) as session:
+        session.get(Student, student.id)
+        session.exec(select(Student)).all()
+    assert all_reads(reads) == []
+
+
+def test_routes_pick_the_engine_by_method(client, db, instructor, student, reads):
+    headers = bearer(instructor)
+    assert client.get(f"/api/students/{student.id}", headers=headers).status_code == 200
+    assert any("FROM student" in statement for statement in all_reads(reads))
+
+    for statements in reads.values():
+        statements.clear()
+    update = {"firstName": "New", "lastName": "Name", "email": "new@school.test", "dateOfBirth": "2000-01-01"}
+    assert client.put(f"/api/students/{student.id}", json=update, headers=headers).status_code == 200
+    assert client.get(f"/api/students/{student.id}", headers={**headers, READ_YOUR_WRITES_HEADER: "1"}).json()["firstName"] == "New"
+    assert all_reads(reads) == []
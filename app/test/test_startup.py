@@ -0,0 +1,119 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+from sqlmodel import SQLModel
+
+from app import metrics, startup
+from app.data import migrations
+from app.data.database import create_db_engine
+from app.data.migrations import LATEST_VERSION, MigrationError
+from app.test.conftest import bearer
+
+
+@pytest.fixture
+def fresh_engine(tmp_path):
+    new_engine = create_db_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    yield new_engine
+    new_engine.dispose()
+
+
+def test_schema_check_migrates_a_database_that_is_behind(fresh_engine):
+    assert startup.check_schema(fresh_engine) == LATEST_VERSION
+    with fresh_engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT count(*) FROM grade").scalar() == 0
+    # second start: current, nothing to apply
+    assert startup.check_schema(fresh_engine) == LATEST_VERSION
+
+
+def test_schema_check_refuses_outdated_or_newer_databases(fresh_engine, monkeypatch):
+    monkeypatch.setattr(startup, "SCHEMA_AUTO_MIGRATE", False)
+    with pytest.raises(RuntimeError, match="is behind"):
+        startup.check_schema(fresh_engine)
+
+    with fresh_engine.begin() as connection:
+        connection.exec_driver_sql(f"PRAGMA user_version = {LATEST_VERSION + 1}")
+    with pytest.raises(RuntimeError, match="is newer"):
+        startup.check_schema(fresh_engine)
+
+
+def test_the_migrated_schema_matches_the_models(fresh_engine, tmp_path):
+    migrations.migrate(fresh_engine)
+    models_engine = create_db_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    SQLModel.metadata.create_all(models_engine)
+
+    def schema(db_engine):
+        inspector = inspect(db_engine)
+        return {table: ({column["name"]: (str(column["type"]), column["nullable"]) for column in inspector.get_columns(table)},
+                        sorted((index["name"], tuple(index["column_names"]), bool(index["unique"])) for index in inspector.get_indexes(table)))
+                for table in SQLModel.metadata.tables}
+
+    assert schema(fresh_engine) == schema(models_engine)
+    models_engine.dispose()
+
+
+def add_duplicate_grades(db_engine):
+    with db_engine.begin() as connection:
+        migrations._initial_schema(connection)
+        connection.exec_driver_sql(
+            "INSERT INTO grade (student_id, pure_maths, chemistry, biology, computer_science, physics) "
+            "VALUES (1, 1, 1, 1, 1, 1), (1, 2, 2, 2, 2, 2), (2, 3, 3, 3, 3, 3)"
+        )
+        connection.exec_driver_sql("PRAGMA user_version = 1")
+
+
+def test_duplicate_grades_stop_the_migration(fresh_engine):
+    add_duplicate_grades(fresh_engine)
+    with pytest.raises(MigrationError, match=r"1 duplicate rows for 1 students \(student_id 1\)"):
+        migrations.migrate(fresh_engine)
+    with fresh_engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == 1
+        assert connection.exec_driver_sql("SELECT count(*) FROM grade").scalar() == 3
+
+
+def test_dropping_duplicate_grades_is_opt_in_and_keeps_a_copy(fresh_engine, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATE_DEDUPLICATE_GRADES", True)
+    add_duplicate_grades(fresh_engine)
+    assert migrations.migrate(fresh_engine) == LATEST_VERSION
+    with fresh_engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT student_id, physics FROM grade ORDER BY id").all() == [(1, 2), (2, 3)]
+        assert connection.exec_driver_sql("SELECT student_id, physics FROM grade_duplicate").all() == [(1, 1)]
+
+
+def test_a_failing_migration_leaves_no_trace(fresh_engine, monkeypatch):
+    def half_done(connection):
+        connection.exec_driver_sql("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("crashed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [*migrations.MIGRATIONS, migrations.Migration(LATEST_VERSION + 1, "broken", half_done)])
+    with pytest.raises(RuntimeError, match="crashed"):
+        migrations.migrate(fresh_engine)
+    with fresh_engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == LATEST_VERSION
+        assert connection.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE name = 'half_done'").scalar() == 0
+
+
+def test_warm_pool_leaves_the_connections_pooled(fresh_engine):
+    assert startup.warm_pool(fresh_engine, count=3) == 3
+    assert fresh_engine.pool.checkedin() == 3
+
+
+def test_lifespan_warms_up_and_times_the_first_request(client, instructor):
+    # the client fixture entered the lifespan already
+    assert metrics.app_startup_duration.value() > 0
+    assert startup.precompile_statements(startup.engine) == 8
+
+    client.get("/api/instructors")
+    first = metrics.app_first_request_duration.value()
+    assert first > 0
+    client.get("/api/instructors")
+    assert metrics.app_first_request_duration.value() == first
+
+
+def test_the_served_app_mounts_every_router(db, instructor):
+    import main
+
+    with TestClient(main.load_app()) as client:
+        assert client.get("/api/students", headers=bearer(instructor)).status_code == 200
+        response = client.post("/auth/instructor", data={"username": instructor.userName, "password": "secret"})
+        assert response.status_code == 200
+        assert client.post("/auth/refresh", json={"refresh_token": "1.bogus"}).status_code == 401
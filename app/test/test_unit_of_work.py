@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.data.database import async_engine, engine
+from app.data.instructor_repo import InstructorRepo
+from app.data.models import Grade, Student
+from app.data.schemas import GradeSchema, UpdateUserSchema
+from app.data.student_repo import StudentRepo
+from app.data.unit_of_work import UnitOfWork
+from app.test.conftest import bearer
+
+MARKS = {"pure_maths": 10, "chemistry": 11, "biology": 12, "computer_science": 13, "physics": 14}
+
+
+def new_student(name: str) -> dict:
+    return {"userName": name, "firstName": name.title(), "lastName": "Doe", "email": f"{name}@school.test",
+            "dateOfBirth": date(2000, 1, 1), "hashed_password": "x"}
+
+
+@contextmanager
+def recorded(*engines):
+    statements, commits = [], []
+
+    def on_execute(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    def on_commit(connection):
+        commits.append(connection)
+
+    for db_engine in engines:
+        event.listen(db_engine, "before_cursor_execute", on_execute)
+        event.listen(db_engine, "commit", on_commit)
+    try:
+        yield statements, commits
+    finally:
+        for db_engine in engines:
+            event.remove(db_engine, "before_cursor_execute", on_execute)
+            event.remove(db_engine, "commit", on_commit)
+
+
+def test_writes_are_flushed_and_committed_once_at_the_end(db):
+    with recorded(engine) as (_, commits), UnitOfWork() as work:
+        student = StudentRepo(work.session).create_student(new_student("ada"))
+        # the INSERT has run and handed back the id, nothing is committed yet
+        assert student.id is not None
+        grade_id = InstructorRepo(work.session).add_new_grade(GradeSchema(student_id=student.id, **MARKS)).id
+        with Session(engine) as other:
+            assert other.get(Student, student.id) is None
+        assert commits == []
+
+    assert len(commits) == 1
+    with Session(engine) as other:
+        assert other.get(Grade, grade_id).physics == 14
+
+
+def test_updates_and_deletes_are_a_single_statement(db):
+    with UnitOfWork() as work:
+        student_id = StudentRepo(work.session).create_student(new_student("grace")).id
+        InstructorRepo(work.session).add_new_grade(GradeSchema(student_id=student_id, **MARKS))
+
+    with recorded(engine) as (statements, _), UnitOfWork() as work:
+        students, instructors = StudentRepo(work.session), InstructorRepo(work.session)
+        update = UpdateUserSchema(firstName="Gracie", lastName="Hopper", email="gracie@school.test", dateOfBirth=date(1999, 12, 9))
+        assert students.update_student(student_id, update).firstName == "Gracie"
+        assert instructors.update_grade(student_id, GradeSchema(student_id=student_id, **{**MARKS, "physics": 20})).physics == 20
+        assert students.update_student(999999, update) is None
+        assert not students.delete_student(999999)
+
+    data_statements = [statement for statement in statements if "table_version" not in statement]
+    assert [statement.split()[0] for statement in data_statements] == ["UPDATE", "UPDATE", "UPDATE", "DELETE"]
+    assert all("RETURNING" in statement for statement in data_statements)
+
+
+def test_a_failing_unit_of_work_leaves_nothing_behind(db):
+    applied = []
+    with pytest.raises(RuntimeError), UnitOfWork() as work:
+        repo = InstructorRepo(work.session)
+        student = StudentRepo(work.session).create_student(new_student("alan"))
+        repo.add_new_grade(GradeSchema(student_id=student.id, **MARKS))
+        repo.after_commit(lambda: applied.append("grade"))
+        raise RuntimeError("the route failed after writing")
+
+    assert applied == []
+    with Session(engine) as other:
+        assert other.query(Student).count() == 0
+
+    with UnitOfWork() as work:
+        InstructorRepo(work.session).after_commit(lambda: applied.append("committed"))
+        StudentRepo(work.session).create_student(new_student("alan"))
+    assert applied == ["committed"]
+
+
+def test_a_request_commits_once(client, db, instructor, student):
+    with recorded(engine, async_engine.sync_engine) as (_, commits):
+        response = client.put(f"/api/students/{student.id}", headers=bearer(instructor), json={
+            "firstName": "Renamed", "lastName": "Doe", "email": student.email, "dateOfBirth": "2000-01-01"})
+        assert response.status_code == 200 and response.json()["firstName"] == "Renamed"
+    assert len(commits) == 1
+
+    with recorded(engine, async_engine.sync_engine) as (_, commits):
+        assert client.get(f"/api/students/{student.id}", headers=bearer(instructor)).json()["firstName"] == "Renamed"
+    assert commits == []
@@ -0,0 +1,5 @@
+"""Benchmark suite: seeded databases, repo/service/route microbenchmarks, JSON results.
+
+    python -m benchmarks.run --sizes 1000 100000 --output bench.json
+    python -m benchmarks.compare old.json new.json
+"""
@@ -0,0 +1,58 @@
+"""Compare two `benchmarks.run` reports.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+
+Prints p50/p95 per benchmark and the relative change. The exit status is 1 when any p50 got
+slower by more than --threshold percent, so it can gate a release.
+"""
+import argparse
+import json
+
+
+def _index(report: dict) -> dict[tuple[int, str, str], dict]:
+    return {
+        (run["students"], result["group"], result["name"]): result
+        for run in report["runs"]
+        for result in run["results"]
+    }
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> tuple[list[str], list[str]]:
+    old, new = _index(baseline), _index(candidate)
+    lines = [f"{'students':>9}  {'benchmark':<52} {'p50 ms':>10} {'Δp50':>8} {'p95 ms':>10} {'Δp95':>8}"]
+    regressions = []
+    for key in sorted(old.keys() & new.keys()):
+        students, group, name = key
+        p50, p95 = _change(old[key]["p50_ms"], new[key]["p50_ms"]), _change(old[key]["p95_ms"], new[key]["p95_ms"])
+        lines.append(
+            f"{students:>9}  {group + ' ' + name:<52} {new[key]['p50_ms']:>10.3f} {p50:>+7.1f}% "
+            f"{new[key]['p95_ms']:>10.3f} {p95:>+7.1f}%"
+        )
+        if p50 > threshold:
+            regressions.append(f"{students} {group} {name}: p50 {p50:+.1f}%")
+    for key in sorted(old.keys() - new.keys()):
+        lines.append(f"{key[0]:>9}  {key[1] + ' ' + key[2]:<52} missing from the candidate")
+    return lines, regressions
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p50 slowdown in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as baseline, open(args.candidate) as candidate:
+        lines, regressions = compare(json.load(baseline), json.load(candidate), args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print("\nregressions:\n  " + "\n  ".join(regressions))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import gc
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    """One measured call. `setup` runs before every timed call and its result is passed to `run`;
+    `teardown` gets it back afterwards. Neither is timed."""
+    group: str
+    name: str
+    run: Callable[[Any], Any] | Callable[[Any], Awaitable[Any]]
+    setup: Callable[[], Any] | None = None
+    teardown: Callable[[Any], Any] | None = None
+    # fraction of the suite's iteration count, for calls that take seconds at 1M rows
+    weight: float = 1.0
+
+
+@dataclass(frozen=True)
+class Result:
+    group: str
+    name: str
+    iterations: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    ops_per_s: float
+    peak_rss_kb: int
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB everywhere else
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _result(benchmark: Benchmark, timings: list[float]) -> Result:
+    samples = np.array(timings) * 1000
+    p50, p95, p99 = np.percentile(samples, PERCENTILES)
+    return Result(
+        group=benchmark.group,
+        name=benchmark.name,
+        iterations=len(samples),
+        mean_ms=round(float(samples.mean()), 4),
+        p50_ms=round(float(p50), 4),
+        p95_ms=round(float(p95), 4),
+        p99_ms=round(float(p99), 4),
+        ops_per_s=round(float(1000 / samples.mean()), 2),
+        peak_rss_kb=peak_rss_kb(),
+    )
+
+
+def _iterations(benchmark: Benchmark, iterations: int, warmup: int) -> tuple[int, int]:
+    return max(1, int(iterations * benchmark.weight)), int(warmup * benchmark.weight)
+
+
+def measure(benchmark: Benchmark, iterations: int, warmup: int) -> Result:
+    iterations, warmup = _iterations(benchmark, iterations, warmup)
+    timings = []
+    gc.collect()
+    for index in range(warmup + iterations):
+        state = benchmark.setup() if benchmark.setup else None
+        started = time.perf_counter()
+        benchmark.run(state)
+        elapsed = time.perf_counter() - started
+        if benchmark.teardown:
+            benchmark.teardown(state)
+        if index >= warmup:
+            timings.append(elapsed)
+    return _result(benchmark, timings)
+
+
+async def measure_async(benchmark: Benchmark, iterations: int, warmup: int) -> Result:
+    iterations, warmup = _iterations(benchmark, iterations, warmup)
+    timings = []
+    gc.collect()
+    for index in range(warmup + iterations):
+        state = benchmark.setup() if benchmark.setup else None
+        started = time.perf_counter()
+        await benchmark.run(state)
+        elapsed = time.perf_counter() - started
+        if benchmark.teardown:
+            benchmark.teardown(state)
+        if index >= warmup:
+            timings.append(elapsed)
+    return _result(benchmark, timings)
@@ -0,0 +1,154 @@
+"""Seed (once) and benchmark databases of several sizes, one subprocess per size.
+
+    python -m benchmarks.run --sizes 1000 100000 1000000 --output bench.json
+
+Pristine databases are kept in --data-dir and reused; each run works on a fresh copy so that
+results from different releases start from identical data. Each size runs in its own process,
+because the app binds its engines to DATABASE_URL at import and so that peak RSS is per size.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+DEFAULT_SIZES = (1_000, 100_000)
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+GROUPS = ("repo", "service", "route")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _meta(args) -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "bcrypt_rounds": os.getenv("BCRYPT_ROUNDS"),
+    }
+
+
+def _run_worker(args) -> dict:
+    # DATABASE_URL is already set by the parent, only now may the app be imported
+    from benchmarks.harness import measure, measure_async
+    from benchmarks.suite import Suite, create_bench_app
+
+    import httpx
+
+    suite = Suite(args.students, args.instructors, random_seed=args.seed)
+    results = []
+    for group in ("repo", "service"):
+        if group in args.groups:
+            benchmarks = suite.repo_benchmarks() if group == "repo" else suite.service_benchmarks()
+            results += [measure(benchmark, args.iterations, args.warmup) for benchmark in benchmarks]
+
+    if "route" in args.groups:
+        async def routes():
+            transport = httpx.ASGITransport(app=create_bench_app())
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                return [await measure_async(benchmark, args.iterations, args.warmup)
+                        for benchmark in suite.route_benchmarks(client)]
+        results += asyncio.run(routes())
+
+    return {"students": args.students, "instructors": args.instructors, "results": [result.as_dict() for result in results]}
+
+
+def _prepare_database(size: int, args) -> tuple[str, dict]:
+    from sqlalchemy import create_engine
+
+    from app.data.migrations import migrate
+    from benchmarks.seed import default_instructors, seed
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    pristine = os.path.join(args.data_dir, f"school-{size}.db")
+    if args.reseed and os.path.exists(pristine):
+        os.remove(pristine)
+    seeded = {"students": size, "instructors": default_instructors(size), "seconds": None}
+    if not os.path.exists(pristine):
+        seeded = seed(pristine, size, random_seed=args.seed)
+        print(f"seeded {size} students in {seeded['seconds']}s", file=sys.stderr)
+
+    working = os.path.join(args.data_dir, f"school-{size}.run.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(working + suffix):
+            os.remove(working + suffix)
+    shutil.copyfile(pristine, working)
+    # pristine databases outlive schema changes, bring the copy up to date
+    working_engine = create_engine(f"sqlite:///{working}")
+    migrate(working_engine)
+    working_engine.dispose()
+    return working, seeded
+
+
+def _run_size(size: int, args) -> dict:
+    working, seeded = _prepare_database(size, args)
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--worker",
+        "--students", str(size), "--instructors", str(seeded["instructors"]),
+        "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+        "--seed", str(args.seed), "--groups", *args.groups,
+    ]
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{working}", "REPORT_DIR": os.path.join(args.data_dir, "reports")}
+    env.pop("ASYNC_DATABASE_URL", None)
+    started = time.perf_counter()
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit(f"benchmarks for {size} students failed")
+    run = json.loads(completed.stdout)
+    run["seed_seconds"] = seeded["seconds"]
+    run["seconds"] = round(time.perf_counter() - started, 2)
+    print(f"benchmarked {size} students in {run['seconds']}s", file=sys.stderr)
+    return run
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="students per database")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--reseed", action="store_true", help="regenerate the pristine databases")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    # internal: run one size inside this process
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--students", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--instructors", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(_run_worker(args)))
+        return
+
+    report = {"meta": _meta(args), "runs": [_run_size(size, args) for size in args.sizes]}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
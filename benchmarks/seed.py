@@ -0,0 +1,120 @@
+"""Bulk generator for `school.db`-shaped benchmark databases.
+
+Rows go straight through sqlite3 `executemany` with journaling and syncing off, and every user
+shares one password hash computed up front, so a million students take seconds instead of the
+hours bcrypt would need. The schema itself comes from the real migrations.
+
+    python -m benchmarks.seed benchmarks/data/school-100000.db --students 100000
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine
+
+from app.data.migrations import migrate
+
+BENCH_PASSWORD = "benchmark"
+SEED_BATCH_SIZE = 50_000
+FIRST_NAMES = ("Ada", "Alan", "Grace", "Linus", "Barbara", "Edsger", "Frances", "Donald", "Margaret", "Ken")
+LAST_NAMES = ("Lovelace", "Turing", "Hopper", "Torvalds", "Liskov", "Dijkstra", "Allen", "Knuth", "Hamilton", "Thompson")
+
+
+def student_name(index: int) -> str:
+    return f"student{index:07d}"
+
+
+def instructor_name(index: int) -> str:
+    return f"instructor{index:05d}"
+
+
+def default_instructors(students: int) -> int:
+    return max(10, students // 100)
+
+
+def _users(name_of, count: int, hashed_password: str, role: str, rng: np.random.Generator):
+    now = datetime(2024, 9, 1)
+    birthdays = rng.integers(0, 3650, count).tolist()
+    for index in range(1, count + 1):
+        name = name_of(index)
+        yield (
+            now, now, name,
+            FIRST_NAMES[index % len(FIRST_NAMES)], LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)],
+            f"{name}@bench.test", date(1995, 1, 1) + timedelta(days=birthdays[index - 1]),
+            hashed_password, role,
+        )
+
+
+def _insert(connection: sqlite3.Connection, table: str, rows, columns: tuple[str, ...]):
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == SEED_BATCH_SIZE:
+            connection.executemany(statement, batch)
+            batch.clear()
+    if batch:
+        connection.executemany(statement, batch)
+
+
+def seed(path: str, students: int, instructors: int | None = None, graded: float = 1.0, random_seed: int = 42) -> dict:
+    """Create a fresh database at `path`. The first `graded` fraction of the students gets a grade row."""
+    from app.auth.dependencies import hash_password
+
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    instructors = default_instructors(students) if instructors is None else instructors
+    started = time.perf_counter()
+
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+    engine.dispose()
+
+    rng = np.random.default_rng(random_seed)
+    hashed_password = hash_password(BENCH_PASSWORD)
+    user_columns = ("created_at", "last_updated", '"userName"', '"firstName"', '"lastName"', "email",
+                    '"dateOfBirth"', "hashed_password", '"userRole"')
+    graded_count = int(students * graded)
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("BEGIN")
+        _insert(connection, "student", _users(student_name, students, hashed_password, "Student", rng), user_columns)
+        _insert(connection, "instructor", _users(instructor_name, instructors, hashed_password, "Instructor", rng), user_columns)
+        marks = rng.integers(0, 21, (graded_count, 5)).tolist()
+        grades = ((student_id, *row) for student_id, row in enumerate(marks, start=1))
+        _insert(connection, "grade", grades,
+                ("student_id", "pure_maths", "chemistry", "biology", "computer_science", "physics"))
+        connection.execute("COMMIT")
+        connection.execute("ANALYZE")
+        connection.execute("PRAGMA journal_mode = WAL")
+    finally:
+        connection.close()
+
+    return {
+        "path": path,
+        "students": students,
+        "instructors": instructors,
+        "grades": graded_count,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Generate a benchmark database")
+    parser.add_argument("path")
+    parser.add_argument("--students", type=int, required=True)
+    parser.add_argument("--instructors", type=int)
+    parser.add_argument("--graded", type=float, default=1.0, help="fraction of students with a grade row")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    print(seed(args.path, args.students, args.instructors, args.graded, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Benchmark definitions for one seeded database.
+
+Imported only once DATABASE_URL points at that database (see `benchmarks.run`), since the app's
+engines are created at import time. Every write benchmark undoes itself in an untimed setup or
+teardown, so repeated runs measure the same data.
+"""
+import os
+import random
+import time
+from datetime import date, timedelta
+from itertools import islice
+from typing import Any, Callable
+
+import httpx
+from sqlmodel import Session, delete, func, select
+
+from app import create_app
+from app.api import api
+from app.api.response_cache import response_cache
+from app.auth import auth_routes
+from app.auth.dependencies import hash_password
+from app.auth.token import create_access_token, new_refresh_token, refresh_token_expiry
+from app.data.database import engine
+from app.data.instructor_repo import InstructorRepo
+from app.data.models import Grade, Instructor, JobStatus, RefreshToken, ReportJob, Student
+from app.data.schemas import GradeSchema, UpdateUserSchema
+from app.data.student_repo import StudentRepo
+from app.data.unit_of_work import UnitOfWork
+from app.domain import analytics, grade_import, instructor_service, student_service
+from benchmarks.harness import Benchmark
+from benchmarks.seed import BENCH_PASSWORD, instructor_name, student_name
+
+PAGE = 100
+# the largest page the list routes serve, where serialization dominates
+LARGE_PAGE = 1000
+STREAMED_ROWS = 1000
+TOP_N = 10
+BATCH_OPERATIONS = 10
+
+
+class Suite:
+    def __init__(self, students: int, instructors: int, random_seed: int = 42):
+        self.students = students
+        self.instructors = instructors
+        self.rng = random.Random(random_seed)
+        self.hashed_password = hash_password(BENCH_PASSWORD)
+        self._created = 0
+
+    # helpers
+
+    def student_id(self) -> int:
+        return self.rng.randint(1, self.students)
+
+    def instructor_id(self) -> int:
+        # instructor 1 signs the route requests, it is never updated or deleted
+        return self.rng.randint(2, self.instructors)
+
+    def grade(self, student_id: int) -> GradeSchema:
+        return GradeSchema(student_id=student_id, **{
+            subject: self.rng.randint(0, 20)
+            for subject in ("pure_maths", "chemistry", "biology", "computer_science", "physics")
+        })
+
+    def user_data(self, role: str) -> dict[str, Any]:
+        self._created += 1
+        name = f"bench{role.lower()}{self._created}"
+        return {
+            "userName": name, "firstName": "Bench", "lastName": role, "email": f"{name}@bench.test",
+            "dateOfBirth": date(2000, 1, 1), "userRole": role, "hashed_password": self.hashed_password,
+        }
+
+    def insert_user(self, model) -> int:
+        with Session(engine) as session:
+            user = model(**self.user_data(model.__name__))
+            session.add(user)
+            session.commit()
+            return user.id
+
+    @staticmethod
+    def delete_grade(student_id: int):
+        with Session(engine) as session:
+            session.exec(delete(Grade).where(Grade.student_id == student_id))
+            session.commit()
+
+    @staticmethod
+    def delete_by_name(model, user_name: str):
+        with Session(engine) as session:
+            session.exec(delete(model).where(model.userName == user_name))
+            session.commit()
+
+    @staticmethod
+    def clear_report_jobs(_=None):
+        # let the job just submitted finish outside the timed call, then drop it and its report
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            with Session(engine) as session:
+                pending = session.exec(select(func.count()).select_from(ReportJob).where(
+                    ReportJob.status.in_((JobStatus.QUEUED, JobStatus.RUNNING)))).one()
+            if not pending:
+                break
+            time.sleep(0.01)
+        with Session(engine) as session:
+            for path in session.exec(select(ReportJob.result_path).where(ReportJob.result_path.is_not(None))):
+                if os.path.exists(path):
+                    os.remove(path)
+            session.exec(delete(ReportJob))
+            session.commit()
+
+    def batch_operations(self) -> list[dict[str, Any]]:
+        student_ids = self.rng.sample(range(1, self.students + 1), min(BATCH_OPERATIONS, self.students))
+        return [{"op": "update_grade", "id": student_id, "data": self.grade(student_id).model_dump()} for student_id in student_ids]
+
+    def refresh_token(self) -> str:
+        # what a login leaves behind, without its bcrypt
+        family, token, token_hash = new_refresh_token()
+        with Session(engine) as session:
+            instructor = session.get(Instructor, self.instructor_id())
+            session.add(RefreshToken(family=family, token_hash=token_hash, role="Instructor", user_id=instructor.id,
+                                     user_name=instructor.userName, user_created_at=instructor.created_at,
+                                     expires_at=refresh_token_expiry()))
+            session.commit()
+        return token
+
+    def update(self, user_id: int, model) -> UpdateUserSchema:
+        name = student_name(user_id) if model is Student else instructor_name(user_id)
+        return UpdateUserSchema(
+            firstName=self.rng.choice(("Ada", "Alan", "Grace")), lastName="Updated",
+            email=f"{name}@bench.test", dateOfBirth=date(1999, 1, 1),
+        )
+
+    def session_benchmark(
+        self,
+        group: str,
+        name: str,
+        call: Callable[[Session, Any], Any],
+        prepare: Callable[[], Any] | None = None,
+        cleanup: Callable[[Any], Any] | None = None,
+        weight: float = 1.0,
+    ) -> Benchmark:
+        """A benchmark that gets a fresh unit of work per call and commits it, like a request does."""
+        def setup():
+            argument = prepare() if prepare else None
+            return UnitOfWork(), argument
+
+        def run(state):
+            work, argument = state
+            result = call(work.session, argument)
+            work.commit()
+            return result
+
+        def teardown(state):
+            work, argument = state
+            work.close()
+            if cleanup:
+                cleanup(argument)
+
+        return Benchmark(group, name, run, setup, teardown, weight)
+
+    # groups
+
+    def repo_benchmarks(self) -> list[Benchmark]:
+        bench = self.session_benchmark
+        group = "repo"
+        return [
+            bench(group, "StudentRepo.create_student",
+                  lambda s, data: StudentRepo(s).create_student(data),
+                  prepare=lambda: self.user_data("Student"),
+                  cleanup=lambda data: self.delete_by_name(Student, data["userName"])),
+            bench(group, "StudentRepo.get_student_by_id", lambda s, _: StudentRepo(s).get_student_by_id(self.student_id())),
+            bench(group, "StudentRepo.get_all_students", lambda s, _: StudentRepo(s).get_all_students(after_id=self.student_id(), limit=PAGE)),
+            bench(group, "StudentRepo.stream_all_students",
+                  lambda s, _: list(islice(StudentRepo(s).stream_all_students(after_id=self.student_id()), STREAMED_ROWS)), weight=0.25),
+            bench(group, "StudentRepo.update_student",
+                  lambda s, student_id: StudentRepo(s).update_student(student_id, self.update(student_id, Student)),
+                  prepare=self.student_id),
+            bench(group, "StudentRepo.delete_student",
+                  lambda s, student_id: StudentRepo(s).delete_student(student_id),
+                  prepare=lambda: self.insert_user(Student)),
+            bench(group, "StudentRepo.get_my_grades", lambda s, _: StudentRepo(s).get_my_grades(self.student_id())),
+
+            bench(group, "InstructorRepo.create_instructor",
+                  lambda s, data: InstructorRepo(s).create_instructor(data),
+                  prepare=lambda: self.user_data("Instructor"),
+                  cleanup=lambda data: self.delete_by_name(Instructor, data["userName"])),
+            bench(group, "InstructorRepo.get_instructor_by_id", lambda s, _: InstructorRepo(s).get_instructor_by_id(self.instructor_id())),
+            bench(group, "InstructorRepo.get_all_instructors", lambda s, _: InstructorRepo(s).get_all_instructors(limit=PAGE)),
+            bench(group, "InstructorRepo.stream_all_instructors",
+                  lambda s, _: list(islice(InstructorRepo(s).stream_all_instructors(), STREAMED_ROWS)), weight=0.25),
+            bench(group, "InstructorRepo.update_instructor",
+                  lambda s, instructor_id: InstructorRepo(s).update_instructor(instructor_id, self.update(instructor_id, Instructor)),
+                  prepare=self.instructor_id),
+            bench(group, "InstructorRepo.delete_instructor",
+                  lambda s, instructor_id: InstructorRepo(s).delete_instructor(instructor_id),
+                  prepare=lambda: self.insert_user(Instructor)),
+            bench(group, "InstructorRepo.get_top_students", lambda s, _: InstructorRepo(s).get_top_students(n=TOP_N)),
+            bench(group, "InstructorRepo.get_top_students[subject]", lambda s, _: InstructorRepo(s).get_top_students(n=TOP_N, subject="physics")),
+            bench(group, "InstructorRepo.add_new_grade",
+                  lambda s, student_id: InstructorRepo(s).add_new_grade(self.grade(student_id)),
+                  prepare=self._ungraded_student),
+            bench(group, "InstructorRepo.update_grade",
+                  lambda s, student_id: InstructorRepo(s).update_grade(student_id, self.grade(student_id)),
+                  prepare=self.student_id),
+            bench(group, "InstructorRepo.existing_student_ids",
+                  lambda s, _: InstructorRepo(s).existing_student_ids(self.student_id() for _ in range(PAGE))),
+            bench(group, "InstructorRepo.upsert_grades",
+                  lambda s, rows: InstructorRepo(s).upsert_grades([rows]),
+                  prepare=lambda: [self.grade(self.student_id()).model_dump() for _ in range(PAGE)], weight=0.5),
+            bench(group, "InstructorRepo.view_grades", lambda s, _: InstructorRepo(s).view_grades(s, after_id=self.student_id() - 1, limit=PAGE)),
+        ]
+
+    def _ungraded_student(self) -> int:
+        student_id = self.student_id()
+        self.delete_grade(student_id)
+        return student_id
+
+    def service_benchmarks(self) -> list[Benchmark]:
+        bench = self.session_benchmark
+        group = "service"
+        return [
+            bench(group, "student_service.get_students",
+                  lambda s, _: student_service.get_students(StudentRepo(s), after_id=self.student_id(), limit=PAGE)),
+            bench(group, "student_service.stream_students",
+                  lambda s, _: list(islice(student_service.stream_students(StudentRepo(s), after_id=self.student_id()), STREAMED_ROWS)), weight=0.25),
+            bench(group, "student_service.get_student", lambda s, _: student_service.get_student(self.student_id(), StudentRepo(s))),
+            bench(group, "student_service.update_student",
+                  lambda s, student_id: student_service.update_student(student_id, self.update(student_id, Student), StudentRepo(s)),
+                  prepare=self.student_id),
+            bench(group, "student_service.get_my_grades", lambda s, _: student_service.get_my_grades(self.student_id(), StudentRepo(s))),
+            bench(group, "instructor_service.get_instructors", lambda s, _: instructor_service.get_instructors(InstructorRepo(s), limit=PAGE)),
+            bench(group, "instructor_service.get_instructor",
+                  lambda s, _: instructor_service.get_instructor(self.instructor_id(), InstructorRepo(s))),
+            bench(group, "instructor_service.get_top_students", lambda s, _: instructor_service.get_top_students(InstructorRepo(s), n=TOP_N)),
+            bench(group, "instructor_service.update_grade",
+                  lambda s, student_id: instructor_service.update_grade(self.grade(student_id), InstructorRepo(s), student_id),
+                  prepare=self.student_id),
+            bench(group, "instructor_service.view_all_grades",
+                  lambda s, _: instructor_service.view_all_grades(InstructorRepo(s), s), weight=0.01),
+            bench(group, "grade_import.import_grades",
+                  lambda s, rows: grade_import.import_grades(rows, InstructorRepo(s)),
+                  prepare=lambda: [(line, self.grade(self.student_id()).model_dump()) for line in range(2, PAGE + 2)], weight=0.5),
+            bench(group, "analytics.grade_statistics", lambda s, _: analytics.grade_statistics(s)),
+            bench(group, "analytics.grade_statistics[cold]",
+                  lambda s, _: analytics.grade_statistics(s),
+                  prepare=analytics.grade_snapshot.invalidate, weight=0.02),
+        ]
+
+    def route_benchmarks(self, client: httpx.AsyncClient) -> list[Benchmark]:
+        instructor = self.token(1, "Instructor")
+        first_student = self.token(1, "Student")
+        group = "route"
+
+        def get(name: str, url: Callable[[], str], headers: dict, weight: float = 1.0, cached: bool = False):
+            async def run(_):
+                response = await client.get(url(), headers=headers)
+                assert response.status_code in (200, 304), (name, response.status_code, response.text[:200])
+            # uncached numbers measure the route itself, the cached ones what a polling client sees
+            setup = None if cached else response_cache.clear
+            return Benchmark(group, name, run, setup=setup, weight=weight)
+
+        def call(name: str, method: str, url: Callable[[Any], str], request: Callable[[Any], dict] | None = None,
+                 prepare=None, cleanup=None, weight: float = 1.0, headers: dict = instructor):
+            async def run(argument):
+                response = await client.request(method, url(argument), headers=headers, **(request(argument) if request else {}))
+                assert response.status_code < 300, (name, response.status_code, response.text[:200])
+            return Benchmark(group, name, run, setup=prepare, teardown=cleanup, weight=weight)
+
+        grades_csv = lambda: "student_id,pure_maths,chemistry,biology,computer_science,physics\n" + "".join(
+            f"{self.student_id()},{self.rng.randint(0, 20)},{self.rng.randint(0, 20)},{self.rng.randint(0, 20)},"
+            f"{self.rng.randint(0, 20)},{self.rng.randint(0, 20)}\n" for _ in range(PAGE)
+        )
+
+        return [
+            get("GET /api/students", lambda: f"/api/students?limit={PAGE}&after_id={self.student_id()}", instructor),
+            get("GET /api/students[1000]", lambda: f"/api/students?limit={LARGE_PAGE}&after_id={self.student_id()}", instructor, weight=0.25),
+            get("GET /api/students[cached]", lambda: f"/api/students?limit={PAGE}", instructor, cached=True),
+            get("GET /api/students/{id}", lambda: f"/api/students/{self.student_id()}", instructor),
+            # a user name prefix shared by 100 students
+            get("GET /api/students/search", lambda: f"/api/students/search?q={student_name(self.student_id())[:-2]}", instructor),
+            get("GET /api/instructors", lambda: f"/api/instructors?limit={PAGE}", instructor),
+            get("GET /api/instructor/{id}", lambda: f"/api/instructor/{self.instructor_id()}", instructor),
+            get("GET /api/my-grades", lambda: f"/api/my-grades?student_name={student_name(1)}", first_student),
+            get("GET /api/top-students", lambda: f"/api/top-students?n={TOP_N}", instructor),
+            get("GET /api/top-students[subject]", lambda: f"/api/top-students?n={TOP_N}&subject=physics", instructor),
+            get("GET /api/all-grades", lambda: f"/api/all-grades?limit={PAGE}&after_id={self.student_id() - 1}", instructor),
+            get("GET /api/all-grades[1000]", lambda: f"/api/all-grades?limit={LARGE_PAGE}&after_id={self.student_id() - 1}",
+                instructor, weight=0.25),
+            # every grade, streamed
+            get("GET /api/all-grades/export", lambda: "/api/all-grades/export?format=csv", instructor, weight=0.02),
+            get("GET /api/analytics/grades", lambda: "/api/analytics/grades", instructor),
+            call("PUT /api/students/{id}", "PUT", lambda student_id: f"/api/students/{student_id}",
+                 request=lambda student_id: {"json": self.update(student_id, Student).model_dump(mode="json")}, prepare=self.student_id),
+            call("PUT /api/instructor/{id}", "PUT", lambda instructor_id: f"/api/instructor/{instructor_id}",
+                 request=lambda instructor_id: {"json": self.update(instructor_id, Instructor).model_dump(mode="json")},
+                 prepare=self.instructor_id),
+            call("DELETE /api/students/{id}", "DELETE", lambda student_id: f"/api/students/{student_id}",
+                 prepare=lambda: self.insert_user(Student)),
+            call("DELETE /api/instructor/{id}", "DELETE", lambda instructor_id: f"/api/instructor/{instructor_id}",
+                 prepare=lambda: self.insert_user(Instructor)),
+            call("PUT /api/students/grades/update-Add", "PUT",
+                 lambda student_id: f"/api/students/grades/update-Add?student_id={student_id}",
+                 request=lambda student_id: {"json": self.grade(student_id).model_dump()}, prepare=self.student_id),
+            call("POST /api/batch", "POST", lambda _: "/api/batch",
+                 request=lambda operations: {"json": {"operations": operations}}, prepare=self.batch_operations),
+            # only the enqueue is timed, the job itself runs on the report pool
+            call("POST /api/jobs", "POST", lambda _: "/api/jobs",
+                 request=lambda _: {"json": {"kind": "top_students", "n": TOP_N}}, cleanup=self.clear_report_jobs, weight=0.25),
+            call("POST /api/grades/import", "POST", lambda _: "/api/grades/import?format=csv",
+                 request=lambda content: {"files": {"file": ("grades.csv", content, "text/csv")}}, prepare=grades_csv, weight=0.5),
+            # the next three hash (or verify) a bcrypt password per user, at BCRYPT_ROUNDS
+            call("POST /api/create-user", "POST", lambda _: "/api/create-user",
+                 request=lambda data: {"json": data}, prepare=self._new_user_payload,
+                 cleanup=lambda data: self.delete_by_name(Student, data["userName"]), weight=0.1),
+            call("POST /api/users/bulk", "POST", lambda _: "/api/users/bulk",
+                 request=lambda users: {"json": users}, prepare=lambda: [self._new_user_payload() for _ in range(10)],
+                 cleanup=lambda users: [self.delete_by_name(Student, user["userName"]) for user in users], weight=0.02),
+            call("POST /auth/instructor", "POST", lambda _: "/auth/instructor", headers={},
+                 request=lambda _: {"data": {"username": instructor_name(1), "password": BENCH_PASSWORD}}, weight=0.1),
+            call("POST /auth/refresh", "POST", lambda _: "/auth/refresh", headers={},
+                 request=lambda token: {"json": {"refresh_token": token}}, prepare=self.refresh_token),
+        ]
+
+    def _new_user_payload(self) -> dict[str, Any]:
+        data = self.user_data("Student")
+        del data["hashed_password"]
+        return {**data, "dateOfBirth": data["dateOfBirth"].isoformat(), "password": BENCH_PASSWORD}
+
+    @staticmethod
+    def token(user_id: int, role: str) -> dict[str, str]:
+        user_name = student_name(user_id) if role == "Student" else instructor_name(user_id)
+        token = create_access_token({"uid": user_id, "username": user_name, "role": role}, timedelta(hours=12))
+        return {"Authorization": f"Bearer {token}"}
+
+
+def create_bench_app():
+    app = create_app()
+    app.include_router(api.router)
+    app.include_router(auth_routes.router)
+    return app
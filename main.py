@@ -1,14 +1,27 @@
+import logging
+import time
+
 import uvicorn
 
-from app import create_app
-from app.api import api
-from app.data.database import create_tables
+logging.basicConfig(level=logging.INFO)
+
+
+def load_app():
+    # the app's imports are what a worker start waits on, timed here; the schema check and warmup
+    # run in the app's lifespan, once per worker, not at import
+    started = time.perf_counter()
+    from app import create_app
+    from app.api import api
+    from app.auth import auth_routes
 
-app = create_app()
+    app = create_app()
+    app.include_router(api.router)
+    app.include_router(auth_routes.router)
+    logging.getLogger(__name__).info("Imported the app in %.1f ms", (time.perf_counter() - started) * 1000)
+    return app
 
-create_tables()
 
-app.include_router(api.router)
+app = load_app()
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", reload=True, port=9000)
\ No newline at end of file
+    uvicorn.run("main:app", reload=True, port=9000)